@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""批量转换命令行入口，不启动界面
+
+示例：
+    python batch.py input_dir output_dir --scale 2 --format png
+"""
+import argparse
+import sys
+import time
+
+from PySide6.QtCore import QCoreApplication
+
+from conf import config
+from src.qt.util.qtbatch import QtBatch
+from src.qt.util.qttask import QtTask
+from src.util import Log, ToolUtil
+from src.util.engine import InitWaifu2x, StopWaifu2x
+
+ModelNames = {"cunet": "CUNET", "photo": "PHOTO", "anime": "ANIME_STYLE_ART_RGB"}
+
+
+def ParseArgs(argv):
+    parser = argparse.ArgumentParser(description="Waifu2x batch convert")
+    parser.add_argument("input", help="input image or directory")
+    parser.add_argument("output", help="output directory")
+    parser.add_argument("--model", choices=sorted(ModelNames), default="cunet")
+    parser.add_argument("--noise", type=int, choices=[-1, 0, 1, 2, 3], default=3)
+    parser.add_argument("--scale", type=float, default=2)
+    parser.add_argument("--width", type=int, default=0, help="fixed output width, used with --high")
+    parser.add_argument("--high", type=int, default=0, help="fixed output height, used with --width")
+    parser.add_argument("--format", choices=["jpg", "png"], default="jpg")
+    parser.add_argument("--tta", action="store_true")
+    parser.add_argument("--gpu", type=int, default=0, help="gpu index, -1 for cpu")
+    parser.add_argument("--jobs", type=int, default=8, help="max tasks in flight")
+    parser.add_argument("--no-recursive", dest="recursive", action="store_false")
+    parser.add_argument("--overwrite", action="store_true")
+    parser.add_argument("--journal", default="", help="journal file, rerun with the same file to resume")
+    parser.add_argument("--retry-failed", dest="retryFailed", action="store_true",
+                        help="convert again the files failed in the journal")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = ParseArgs(argv)
+    Log.Init()
+    app = QCoreApplication(sys.argv)
+
+    # 先按命令行指定的GPU初始化，QtTask在后台初始化时直接使用这次的结果
+    InitWaifu2x(args.gpu)
+    task = QtTask()
+    task.WaitEngines()
+    engine = task.engine
+    if not engine:
+        Log.Warn("no convert engine, " + config.ErrorMsg)
+        return 1
+
+    isFixSize = args.width > 0 and args.high > 0
+    modelName = ToolUtil.GetModelName(ModelNames[args.model], args.noise,
+                                      not isFixSize and args.scale <= 1, args.tta)
+    model = {"model": engine.GetModel(modelName), "format": args.format}
+    if isFixSize:
+        model["width"] = args.width
+        model["high"] = args.high
+    else:
+        model["scale"] = args.scale
+
+    batch = QtBatch(args.input, args.output, model, args.jobs, args.recursive, args.overwrite,
+                    args.journal, args.retryFailed)
+    if batch.resumeNum:
+        print("resume: {} unfinished in {}".format(batch.resumeNum, args.journal))
+
+    def FileBack(src, dst, isOk):
+        print("{} {} -> {}".format("ok  " if isOk else "fail", src, dst))
+
+    tick = time.time()
+    batch.fileBack.connect(FileBack)
+    batch.finishBack.connect(app.quit)
+    batch.Start()
+    app.exec()
+    tick = time.time() - tick
+
+    total = batch.okNum + batch.failNum
+    print("done: {} ok, {} fail, {} skip, {:.1f}s, {:.2f} img/s".format(
+        batch.okNum, batch.failNum, batch.skipNum, tick, total / tick if tick > 0 else 0))
+    StopWaifu2x()
+    return 0 if batch.failNum == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
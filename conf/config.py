@@ -17,6 +17,22 @@ UseCpuNum = 0
 SelectEncodeGpu = ""
 
 Waifu2xThread = 2
+CpuEngineWorkers = 0    # CPU引擎线程数，0表示使用全部核心
+IsCpuEngineAssist = False   # GPU可用时是否同时使用CPU引擎分担任务
+IsCacheConvert = True   # 是否缓存转换结果
+CachePath = "cache"     # 转换结果缓存目录
+CacheSize = 1024        # 转换结果缓存上限（MB）
+TileSize = 2560         # 超过该尺寸的图片拆分成分块转换，0表示不分块，较小的图片引擎可以一次转换
+TileOverlap = 16        # 分块之间的重叠像素
+TileMinSize = 128       # 分块失败重试时最小的分块尺寸
+ProgressInterval = 0.1  # 转换进度信号的最小间隔（秒）
+PreviewLevelSize = 2048 # 超过该尺寸的图片显示时生成缩小的预览层级
+PreviewFullScale = 1.0  # 显示比例超过该值时才加载原始分辨率
+ViewTileSize = 512      # 显示大图时的分块尺寸
+ViewTileCacheSize = 256 # 显示大图时分块缓存的上限（MB）
+ViewUpdateInterval = 16 # 缩放和窗口大小变化合并处理的间隔（毫秒）
+ViewIdleTime = 200      # 停止缩放拖动多久后恢复平滑缩放（毫秒）
+ImageAllocationLimit = 1024 # 解码单张图片的内存上限（MB），超过时只解码缩小的层级，0表示不限制，Qt默认只有128MB
 Format = "jpg"
 Waifu2xPath = "waifu2x"
 IsOpenWaifu = True
@@ -24,6 +40,13 @@ IsOpenWaifu = True
 LookModel = 0       # 默认值
 DownloadModel = 0   # 默认值
 LogIndex = 0
+LogFileSize = 10        # 单个日志文件的大小上限（MB），超过后轮转
+LogFileNum = 5          # 轮转后保留的旧日志文件数
+LogRateNum = 20         # 同一个位置的日志在LogRateInterval秒内最多输出的条数，0表示不限制
+LogRateInterval = 1.0   # 日志限速的时间窗口（秒）
+IsMetrics = True        # 记录热点路径的耗时、计数，关闭后计时没有开销
+IsTrace = False         # 启动时开始记录性能跟踪，也可以通过菜单开关
+TraceMaxEvents = 1000000    # 性能跟踪最多记录的事件数
 
 
 Model0 = "cunet"     # 通用
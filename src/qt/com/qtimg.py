@@ -2,15 +2,24 @@ import os
 import time
 
 from PySide6 import QtWidgets, QtGui, QtCore
-from PySide6.QtCore import Qt, QRectF, QPointF, QSizeF, QEvent
+from PySide6.QtCore import Qt, QRect, QRectF, QSize, QSizeF, QEvent, QTimer
 from PySide6.QtGui import QColor, QPainter, QPixmap, QDoubleValidator, \
-    QIntValidator
-from PySide6.QtWidgets import QFrame, QGraphicsPixmapItem, QGraphicsScene, QApplication, QFileDialog
+    QIntValidator, QTransform, QPen
+from PySide6.QtWidgets import QFrame, QGraphicsPixmapItem, QGraphicsScene, QApplication, QFileDialog, \
+    QGraphicsRectItem
 
 from conf import config
 from src.qt.com.qtbubblelabel import QtBubbleLabel
+from src.qt.com.qttileitem import QtTiledImageItem
+from src.qt.util.qtdecode import QtImageDecoder
+from src.qt.util.qtio import QtFileWorker
 from src.qt.util.qttask import QtTask
 from src.util import Singleton, ToolUtil, Log
+from src.util.imageprobe import ProbeImage
+from src.util.scheduler import TaskPriority
+from src.util.tile import TiledImage
+from src.util.trace import Trace
+from src.util.zoom import ZoomState
 from ui.img import Ui_Img
 
 class QtImg(QtWidgets.QWidget, Ui_Img):
@@ -56,6 +65,13 @@ class QtImg(QtWidgets.QWidget, Ui_Img):
         self.graphicsScene = QGraphicsScene(self)  # 场景
         self.graphicsView.setScene(self.graphicsScene)
         self.graphicsScene.addItem(self.graphicsItem)
+        # 显示金字塔时只绘制可见的分块，部分转换结果仍然用graphicsItem显示
+        self.tileItem = QtTiledImageItem()
+        self.tileItem.setFlags(QGraphicsPixmapItem.ItemIsFocusable |
+                               QGraphicsPixmapItem.ItemIsMovable |
+                               QGraphicsPixmapItem.ItemUsesExtendedStyleOption)
+        self.tileItem.hide()
+        self.graphicsScene.addItem(self.tileItem)
         self.graphicsView.setMinimumSize(10, 10)
         self.pixMap = QPixmap("Loading")
         self.graphicsItem.setPixmap(self.pixMap)
@@ -65,6 +81,7 @@ class QtImg(QtWidgets.QWidget, Ui_Img):
         # self.radioButton.installEventFilter(self)
         # self.radioButton_2.installEventFilter(self)
         self.graphicsView.installEventFilter(self)
+        self.graphicsView.viewport().installEventFilter(self)
         self.graphicsView.setWindowFlag(Qt.FramelessWindowHint)
         # tta有BUG，暂时屏蔽 TODO
         # self.ttaModel.setEnabled(False)
@@ -72,15 +89,77 @@ class QtImg(QtWidgets.QWidget, Ui_Img):
         self.waifu2xData = b""
 
         self._delta = 0.1
-        self.scaleCnt = 0
+        # 缩放状态，滚轮和窗口大小变化合并到下一帧一次计算变换
+        self.zoomState = ZoomState()
+        self.pendingSteps = 0
+        self.isFitPending = False
+        self.viewTimer = QTimer(self)
+        self.viewTimer.setSingleShot(True)
+        self.viewTimer.setInterval(config.ViewUpdateInterval)
+        self.viewTimer.timeout.connect(self.ApplyView)
+        # 交互期间关闭平滑缩放，停止后恢复
+        self.idleTimer = QTimer(self)
+        self.idleTimer.setSingleShot(True)
+        self.idleTimer.setInterval(config.ViewIdleTime)
+        self.idleTimer.timeout.connect(lambda: self.SetInteracting(False))
 
         self.backStatus = ""
         self.format = ""
+        self.partialRegions = None  # 分块转换时已经完成的部分结果[(x, y, data)]，没有部分结果时为None
+        self.partialOutSize = None  # 部分结果所属的结果图片的大小
+        self.regionIds = set()      # 还没有画到当前金字塔上的部分结果的解码请求
+
+        # 图片在后台线程解码，解码期间显示加载中
+        self.decoder = QtImageDecoder()
+        self.decoder.decodeBack.connect(self.AddDecodeBack)
+        self.decoder.pyramidBack.connect(self.AddPyramidBack)
+        self.decoder.regionsBack.connect(self.AddRegionsBack)
+        self.decodeId = 0
+        # 预览金字塔，显示与缩放比例匹配的层级，原图只在放大超过1:1时解码
+        self.pyramid = None
+        self.fullId = 0
+        self.copyId = 0             # 复制到剪贴板的解码请求
+        self.loadingLabel = QtWidgets.QLabel(self.tr("加载中"), self.graphicsView)
+        self.loadingLabel.setStyleSheet("background-color: rgba(0, 0, 0, 128); color: white; padding: 6px;")
+        self.loadingLabel.hide()
+
+        # 打开和保存文件在后台线程进行
+        self.fileWorker = QtFileWorker()
+        self.fileWorker.readBack.connect(self.AddReadBack)
+        self.fileWorker.writeProgress.connect(self.AddWriteProgress)
+        self.fileWorker.writeBack.connect(self.AddWriteBack)
+        self.openId = 0
+        self.saveNum = 0            # 正在保存的文件数
+        self.saveProgress = QtWidgets.QProgressBar(self)
+        self.saveProgress.setMaximumSize(QSize(220, 16777215))
+        self.saveProgress.setFormat(self.tr("保存中") + " %p%")
+        self.saveProgress.hide()
+        self.verticalLayout_3.addWidget(self.saveProgress)
+
+        # 按住Shift拖动选择区域，转换大图时选区或者当前可见的区域先转换
+        self.selectItem = QGraphicsRectItem()
+        pen = QPen(QColor(0, 120, 215))
+        pen.setStyle(Qt.DashLine)
+        pen.setCosmetic(True)
+        self.selectItem.setPen(pen)
+        self.selectItem.setBrush(QColor(0, 120, 215, 40))
+        self.selectItem.setZValue(1)
+        self.selectItem.setAcceptedMouseButtons(Qt.NoButton)
+        self.selectItem.hide()
+        self.graphicsScene.addItem(self.selectItem)
+        self.selectStart = None     # 正在拖动选区时为起点，场景坐标
+        self.selectBox = None       # 选区，原图坐标(x0, y0, x1, y1)
+        self.selectCheckBox = QtWidgets.QCheckBox(self.tr("只转换选区"), self)
+        self.selectCheckBox.setToolTip(self.tr("按住Shift拖动选择区域"))
+        self.verticalLayout_2.insertWidget(self.verticalLayout_2.indexOf(self.ttaModel) + 1, self.selectCheckBox)
+        self.convertId = 0
+        self.convertBox = None      # 只转换选区时为转换的区域，原图坐标
 
     def ShowImg(self, data):
         if data:
             self.data = data
             self.waifu2xData = b""
+            self.convertId = 0
             QtTask().CancelConver("QtImg")
             self._ShowImg(data)
         elif self.data:
@@ -89,59 +168,232 @@ class QtImg(QtWidgets.QWidget, Ui_Img):
             pass
 
     def _ShowImg(self, data):
-        self.scaleCnt = 0
-        self.pixMap = QPixmap()
-        self.pixMap.loadFromData(data)
+        """
+        提交后台解码，解码完成后在AddPyramidBack中显示，之前的图片保留到解码完成
+        重新生成金字塔时丢弃已经收到的部分结果，之后的部分结果画在新的金字塔上
+        """
+        self.ClearPartial()
         self.show()
-        self.graphicsItem.setPixmap(self.pixMap)
-        self.graphicsView.setSceneRect(QRectF(QPointF(0, 0), QPointF(self.pixMap.width(), self.pixMap.height())))
         size = ToolUtil.GetDownloadSize(len(data))
         self.sizeLabel.setText(size)
-        weight, height = ToolUtil.GetPictureSize(data)
-        self.resolutionLabel.setText(str(weight) + "x" + str(height))
+        info = ProbeImage(data)
+        if info:
+            self.resolutionLabel.setText(str(info.width) + "x" + str(info.height))
+        self.fullId = 0
+        self.decodeId = self.decoder.Decode(data, isPyramid=True)
+        Trace.Begin("load image", self.decodeId)
+        self.SetLoading(True)
+
+    def ClearPartial(self):
+        """丢弃部分结果和还没画上去的解码请求，之后生成的金字塔上不再画"""
+        self.partialRegions = None
+        self.regionIds.clear()
+
+    def AddPyramidBack(self, requestId, pyramid):
+        # 只显示最新的请求
+        Trace.End("load image", requestId)
+        if requestId != self.decodeId:
+            return
+        self.decodeId = 0
+        self.SetLoading(False)
+        if not pyramid:
+            Log.Warn("decode image fail")
+            return
+        w, h = pyramid.size
+        self.resolutionLabel.setText(str(w) + "x" + str(h))
+        self.zoomState.Reset()
+        self.ClearSelect()
+        self.pyramid = pyramid
+        self.regionIds.clear()
+        self.tileItem.SetPyramid(pyramid)
+        self.tileItem.show()
+        self.graphicsItem.hide()
+        self.graphicsView.setSceneRect(QRectF(0, 0, w, h))
         self.ScalePicture()
-
-    def ScalePicture(self):
-        rect = QRectF(self.graphicsItem.pos(), QSizeF(
-            self.pixMap.size()))
-        unity = self.graphicsView.transform().mapRect(QRectF(0, 0, 1, 1))
-        width = unity.width()
-        height = unity.height()
-        if width <= 0 or height <= 0:
+        if self.partialRegions:
+            # 解码期间已经有部分转换结果
+            self.ApplyPartial(self.partialRegions)
+
+    def AddDecodeBack(self, requestId, img):
+        """放大超过1:1时重新解码的原图，以及复制到剪贴板的原图"""
+        if requestId == self.copyId:
+            self.copyId = 0
+            if img.isNull():
+                QtBubbleLabel.ShowErrorEx(self, "Copy Fail")
+                return
+            QApplication.clipboard().setImage(img)
+            QtBubbleLabel.ShowMsgEx(self, "Copy Success")
+            return
+        if requestId != self.fullId or not self.pyramid:
+            return
+        self.fullId = 0
+        if img.isNull():
             return
-        self.graphicsView.scale(1 / width, 1 / height)
+        self.pyramid.levels[0] = img
+        self.tileItem.update()
+        if self.partialRegions:
+            # 重新解码的原图上没有部分结果
+            self.ApplyPartial(self.partialRegions, [0])
+
+    def GetImageSize(self):
+        """场景中图片的大小，即原图的大小"""
+        if self.pyramid:
+            return QSizeF(*self.pyramid.size)
+        return QSizeF(self.pixMap.size())
+
+    def UpdatePyramidLevel(self):
+        """按当前的显示比例请求或者释放原图，绘制时tileItem自己选择层级"""
+        pyramid = self.pyramid
+        if not pyramid:
+            return
+        level = pyramid.GetLevel(self.graphicsView.transform().m11())
+        if level == 0 and 0 not in pyramid.levels:
+            # 新图片正在解码时不请求，避免覆盖新图片的解码请求
+            if not self.fullId and not self.decodeId:
+                self.fullId = self.decoder.Decode(pyramid.data)
+        elif level != 0 and not pyramid.isSmall and 0 in pyramid.levels:
+            # 缩小后释放原图和原图的分块
+            del pyramid.levels[0]
+            self.tileItem.DropLevel(0)
+
+    def SetLoading(self, isLoading):
+        if isLoading:
+            self.loadingLabel.adjustSize()
+            self.loadingLabel.move((self.graphicsView.width() - self.loadingLabel.width()) // 2,
+                                   (self.graphicsView.height() - self.loadingLabel.height()) // 2)
+            self.loadingLabel.show()
+            self.loadingLabel.raise_()
+            self.graphicsView.setCursor(Qt.BusyCursor)
+        else:
+            self.loadingLabel.hide()
+            self.graphicsView.setCursor(Qt.OpenHandCursor)
+
+    def GetFitScale(self):
+        size = self.GetImageSize()
         viewRect = self.graphicsView.viewport().rect()
-        sceneRect = self.graphicsView.transform().mapRect(rect)
-        if sceneRect.width() <= 0 or sceneRect.height() <= 0:
+        return ZoomState.GetFitScale((size.width(), size.height()), (viewRect.width(), viewRect.height()))
+
+    def ScalePicture(self, isCenter=True):
+        """按适应窗口的比例和缩放次数一次设置变换"""
+        fitScale = self.GetFitScale()
+        if fitScale <= 0:
             return
-        x_ratio = viewRect.width() / sceneRect.width()
-        y_ratio = viewRect.height() / sceneRect.height()
-        x_ratio = y_ratio = min(x_ratio, y_ratio)
-
-        self.graphicsView.scale(x_ratio, y_ratio)
-        # if self.readImg.isStripModel:
-        #     height2 = self.pixMap.size().height() / 2
-        #     height3 = self.graphicsView.size().height()/2
-        #     height3 = height3/x_ratio
-        #     p = self.graphicsItem.pos()
-        #     self.graphicsItem.setPos(p.x(), p.y()+height2-height3)
-        self.graphicsView.centerOn(rect.center())
-
-        for _ in range(abs(self.scaleCnt)):
-            if self.scaleCnt > 0:
-                self.graphicsView.scale(1.1, 1.1)
-            else:
-                self.graphicsView.scale(1/1.1, 1/1.1)
+        scale = self.zoomState.GetScale(fitScale)
+        self.graphicsView.setTransform(QTransform.fromScale(scale, scale))
+        if isCenter:
+            item = self.tileItem if self.pyramid else self.graphicsItem
+            self.graphicsView.centerOn(QRectF(item.pos(), self.GetImageSize()).center())
+        self.UpdatePyramidLevel()
+
+    def ApplyView(self):
+        """处理合并后的缩放和窗口大小变化"""
+        steps, self.pendingSteps = self.pendingSteps, 0
+        isFit, self.isFitPending = self.isFitPending, False
+        isZoom = steps != 0 and self.zoomState.Zoom(steps, self.GetFitScale())
+        if isFit:
+            self.ScalePicture()
+        elif isZoom:
+            self.ScalePicture(isCenter=False)
+        if isFit or isZoom:
+            self.UpdateConvertFocus()
+
+    def UpdateView(self):
+        """在下一帧更新视图，期间的多次请求只处理一次"""
+        self.SetInteracting(True)
+        if not self.viewTimer.isActive():
+            self.viewTimer.start()
+
+    def SetInteracting(self, isInteracting):
+        if isInteracting:
+            self.idleTimer.start()
+            if self.graphicsView.renderHints() & QPainter.SmoothPixmapTransform:
+                self.graphicsView.setRenderHint(QPainter.SmoothPixmapTransform, False)
+        elif not self.graphicsView.renderHints() & QPainter.SmoothPixmapTransform:
+            self.graphicsView.setRenderHint(QPainter.SmoothPixmapTransform, True)
+            self.graphicsView.viewport().update()
 
     def resizeEvent(self, event) -> None:
         super(self.__class__, self).resizeEvent(event)
-        self.ScalePicture()
+        self.isFitPending = True
+        self.UpdateView()
+        if self.loadingLabel.isVisible():
+            self.SetLoading(True)
 
     def eventFilter(self, obj, ev):
         if ev.type() == QEvent.KeyPress:
             return True
-        else:
-            return super(self.__class__, self).eventFilter(obj, ev)
+        elif obj is self.graphicsView.viewport() and self.SelectEvent(ev):
+            return True
+        elif ev.type() == QEvent.MouseMove and ev.buttons():
+            # 拖动图片
+            self.SetInteracting(True)
+        elif ev.type() == QEvent.MouseButtonRelease:
+            self.UpdateConvertFocus()
+        return super(self.__class__, self).eventFilter(obj, ev)
+
+    def SelectEvent(self, ev):
+        """按住Shift拖动选择区域，返回是否已处理"""
+        if ev.type() == QEvent.MouseButtonPress and ev.button() == Qt.LeftButton and \
+                ev.modifiers() & Qt.ShiftModifier:
+            self.selectStart = self.graphicsView.mapToScene(ev.position().toPoint())
+            self.selectItem.setRect(QRectF(self.selectStart, self.selectStart))
+            self.selectItem.show()
+            return True
+        if self.selectStart is None:
+            return False
+        if ev.type() == QEvent.MouseMove:
+            pos = self.graphicsView.mapToScene(ev.position().toPoint())
+            self.selectItem.setRect(QRectF(self.selectStart, pos).normalized())
+            return True
+        if ev.type() == QEvent.MouseButtonRelease:
+            self.selectStart = None
+            self.selectBox = self.GetSourceBox(self.selectItem.rect())
+            if not self.selectBox:
+                # 只点击没有拖动，取消选区
+                self.ClearSelect()
+            self.UpdateConvertFocus()
+            return True
+        return False
+
+    def ClearSelect(self):
+        self.selectStart = None
+        self.selectBox = None
+        self.selectItem.hide()
+
+    def GetSourceSize(self):
+        info = ProbeImage(self.data)
+        return info.size if info else (0, 0)
+
+    def GetSourceBox(self, sceneRect):
+        """场景中的区域对应原图中的区域(x0, y0, x1, y1)，显示的可能是缩小的层级或者转换结果，按比例换算"""
+        srcW, srcH = self.GetSourceSize()
+        size = self.GetImageSize()
+        if srcW <= 0 or srcH <= 0 or size.width() <= 0 or size.height() <= 0:
+            return None
+        item = self.tileItem if self.pyramid else self.graphicsItem
+        rect = item.mapFromScene(sceneRect).boundingRect()
+        ratioX, ratioY = srcW / size.width(), srcH / size.height()
+        x0 = max(0, int(rect.left() * ratioX))
+        y0 = max(0, int(rect.top() * ratioY))
+        x1 = min(srcW, int(rect.right() * ratioX + 0.5))
+        y1 = min(srcH, int(rect.bottom() * ratioY + 0.5))
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return x0, y0, x1, y1
+
+    def GetConvertFocus(self):
+        """优先转换的区域：有选区时为选区，否则为当前可见的区域"""
+        if self.selectBox:
+            return self.selectBox
+        return self.GetSourceBox(self.graphicsView.mapToScene(self.graphicsView.viewport().rect()).boundingRect())
+
+    def UpdateConvertFocus(self):
+        """转换中移动或缩放后，新的可见区域的分块先转换"""
+        if not self.convertId or self.convertBox:
+            return
+        focus = self.GetConvertFocus()
+        if focus:
+            QtTask().SetConvertFocus(self.convertId, focus)
 
     def wheelEvent(self, event):
         if event.angleDelta().y() > 0:
@@ -158,23 +410,24 @@ class QtImg(QtWidgets.QWidget, Ui_Img):
         self.zoom(1/1.1)
 
     def zoom(self, factor):
-        """缩放
-        :param factor: 缩放的比例因子
+        """缩放，在下一帧和其他缩放一起生效
+        :param factor: 大于等于1时放大一次，否则缩小一次
         """
-        _factor = self.graphicsView.transform().scale(
-            factor, factor).mapRect(QRectF(0, 0, 1, 1)).width()
-        if _factor < 0.07 or _factor > 100:
-            # 防止过大过小
-            return
-        if factor >= 1:
-            self.scaleCnt += 1
-        else:
-            self.scaleCnt -= 1
-        self.graphicsView.scale(factor, factor)
+        self.pendingSteps += 1 if factor >= 1 else -1
+        self.UpdateView()
 
     def CopyPicture(self):
         clipboard = QApplication.clipboard()
-        clipboard.setPixmap(self.pixMap)
+        if self.pyramid:
+            # 显示的可能是缩小的层级，复制原图，超过解码的内存上限时复制缩小的图片
+            img = self.pyramid.levels.get(0)
+            if img is None:
+                # 在后台解码，完成后在AddDecodeBack中设置剪贴板
+                self.copyId = self.decoder.DecodeQueued(self.pyramid.data)
+                return
+            clipboard.setImage(img)
+        else:
+            clipboard.setPixmap(self.pixMap)
         QtBubbleLabel.ShowMsgEx(self, "Copy Success")
         return
 
@@ -192,16 +445,26 @@ class QtImg(QtWidgets.QWidget, Ui_Img):
             if filename and len(filename) >= 1:
                 name = filename[0]
                 if os.path.isfile(name):
-                    f = open(name, "rb")
-                    data = f.read()
-                    f.close()
-                    self.ShowImg(data)
-                    self.changeJpg.setEnabled(True)
-                    self.changePng.setEnabled(True)
+                    # 后台读取，读取完成后在AddReadBack中显示
+                    self.openId = self.fileWorker.Read(name)
+                    self.SetLoading(True)
         except Exception as ex:
             Log.Error(ex)
         return
 
+    def AddReadBack(self, requestId, data):
+        # 连续打开时只显示最后一次
+        if requestId != self.openId:
+            return
+        self.openId = 0
+        if not data:
+            self.SetLoading(False)
+            QtBubbleLabel.ShowErrorEx(self, "Open Fail")
+            return
+        self.ShowImg(data)
+        self.changeJpg.setEnabled(True)
+        self.changePng.setEnabled(True)
+
     def StartWaifu2xPng(self):
         if self.StartWaifu2x("png"):
             self.format = "png"
@@ -219,9 +482,9 @@ class QtImg(QtWidgets.QWidget, Ui_Img):
     def StartWaifu2x(self, format):
         if not self.data:
             return False
-        if not config.CanWaifu2x:
+        engine = QtTask().engine
+        if not engine:
             return False
-        from waifu2x_vulkan import waifu2x_vulkan
         self.SetStatus(False)
         self.index = self.comboBox.currentIndex()
         index = self.comboBox.currentIndex()
@@ -234,19 +497,11 @@ class QtImg(QtWidgets.QWidget, Ui_Img):
             modelName = "ANIME_STYLE_ART_RGB"
         else:
             return False
-        if noise == -1:
-            noiseName = "NO_NOISE"
-        else:
-            noiseName = "NOISE"+str(noise)
-        if modelName == "CUNET" and self.scaleRadio.isChecked() and round(float(self.scaleEdit.text()), 1) <= 1:
-            modelInsence = "MODEL_{}_NO_SCALE_{}".format(modelName, noiseName)
-        else:
-            modelInsence = "MODEL_{}_{}".format(modelName, noiseName)
-        if self.ttaModel.isChecked():
-            modelInsence += "_TTA"
+        isNoScale = self.scaleRadio.isChecked() and round(float(self.scaleEdit.text()), 1) <= 1
+        modelInsence = ToolUtil.GetModelName(modelName, noise, isNoScale, self.ttaModel.isChecked())
 
         model = {
-            "model":  getattr(waifu2x_vulkan, modelInsence),
+            "model":  engine.GetModel(modelInsence),
         }
         if self.scaleRadio.isChecked():
             model['scale'] = round(float(self.scaleEdit.text()), 1)
@@ -255,23 +510,115 @@ class QtImg(QtWidgets.QWidget, Ui_Img):
             model['high'] = int(self.heighEdit.text())
         model['format'] = format
         self.backStatus = self.GetStatus()
-        QtTask().AddConvertTask(self.data, model, self.AddConvertBack,
-                                cleanFlag="QtImg")
+        self.ClearPartial()
+        data = self.data
+        focus = self.GetConvertFocus()
+        self.convertBox = None
+        if self.selectCheckBox.isChecked() and self.selectBox:
+            # 只转换选区，其余部分不转换
+            try:
+                data = TiledImage.Crop(self.data, self.selectBox)
+                self.convertBox = self.selectBox
+                focus = None
+                if not self.scaleRadio.isChecked():
+                    # 固定宽高是整张图的大小，选区按比例缩小
+                    srcW, srcH = self.GetSourceSize()
+                    x0, y0, x1, y1 = self.selectBox
+                    model['width'] = max(1, round(model['width'] * (x1 - x0) / srcW))
+                    model['high'] = max(1, round(model['high'] * (y1 - y0) / srcH))
+            except Exception as es:
+                Log.Error(es)
+        self.convertId = QtTask().AddConvertTask(data, model, self.AddConvertBack,
+                                                 cleanFlag="QtImg", priority=TaskPriority.Interactive,
+                                                 progressCallBack=self.AddConvertProgress,
+                                                 partialCallBack=self.AddConvertPartial, focus=focus)
         self.changeLabel.setText(self.tr("正在转换"))
         return True
 
+    def AddConvertProgress(self, waifuId, doneNum, totalNum, doneBytes, backParam):
+        """大图分块转换的进度"""
+        self.changeLabel.setText(self.tr("正在转换") + " {}/{}".format(doneNum, totalNum))
+
+    def AddConvertPartial(self, waifuId, regions, outSize, backParam):
+        """把已经完成的分块画到正在显示的原图上，逐步显示转换结果"""
+        if not self.checkBox.isChecked():
+            return
+        with Trace.Span("partial", waifuId, regions=len(regions)):
+            self._AddConvertPartial(regions, outSize)
+
+    def _AddConvertPartial(self, regions, outSize):
+        if self.partialRegions is None:
+            self.partialRegions = []
+            self.partialOutSize = outSize
+            self.ClearSelect()
+        self.partialRegions.extend(regions)
+        self.ApplyPartial(regions)
+
+    def ApplyPartial(self, regions, levels=None):
+        """
+        在后台把部分结果解码并缩放到金字塔各个层级的大小，完成后在AddRegionsBack中画到层级上，
+        主线程不解码，也不生成结果尺寸的图片
+        regions: [(x, y, data)]，结果图片中的位置；levels: 只画这些层级，默认为所有已经解码的层级
+        """
+        pyramid = self.pyramid
+        if not pyramid or not self.partialOutSize:
+            # 原图还在解码，显示后再画
+            return
+        srcW, srcH = self.GetSourceSize()
+        if srcW <= 0 or srcH <= 0:
+            return
+        x0, y0, x1, y1 = self.convertBox or (0, 0, srcW, srcH)
+        outW, outH = self.partialOutSize
+        # 结果坐标 -> 原图坐标 -> 显示的图片的坐标
+        ratioX = (x1 - x0) / outW * pyramid.size[0] / srcW
+        ratioY = (y1 - y0) / outH * pyramid.size[1] / srcH
+        offsetX, offsetY = x0 * pyramid.size[0] / srcW, y0 * pyramid.size[1] / srcH
+        levelScales = {level: pyramid.GetScale(level) for level in pyramid.levels if levels is None or level in levels}
+        jobs = []
+        for x, y, data in regions:
+            info = ProbeImage(data)
+            if not info:
+                continue
+            targets = []
+            for level, scale in levelScales.items():
+                left = round((offsetX + x * ratioX) / scale)
+                top = round((offsetY + y * ratioY) / scale)
+                right = round((offsetX + (x + info.width) * ratioX) / scale)
+                bottom = round((offsetY + (y + info.height) * ratioY) / scale)
+                targets.append((level, QRect(left, top, right - left, bottom - top)))
+            jobs.append((data, targets))
+        if jobs:
+            self.regionIds.add(self.decoder.DecodeRegions(jobs))
+
+    def AddRegionsBack(self, requestId, regions):
+        """部分结果已经缩放到各个层级的大小，显示的图片变化后提交的请求不再使用"""
+        if requestId not in self.regionIds:
+            return
+        self.regionIds.discard(requestId)
+        with Trace.Span("partial draw", requestId, regions=len(regions)):
+            self.tileItem.DrawRegions(regions)
+
     def AddConvertBack(self, data, waifuId, backParam, tick):
         """
         当图像处理完成后，任务管理器会自动调用这个函数，对应qttask.py中的downloadCompleteBack
          """
+        isPartial = self.partialRegions is not None
+        self.ClearPartial()
+        self.convertId = 0
         if data:
             self.waifu2xData = data
             if self.checkBox.isChecked():
                 self._ShowImg(data)
+            elif isPartial:
+                # 转换期间关闭了显示结果，部分结果画在了金字塔上，重新解码原图去掉
+                self._ShowImg(self.data)
             self.changeLabel.setText(self.tr("已转换"))
             self.tickLabel.setText(str(round(tick, 3)) + "s")
 
         else:
+            if isPartial:
+                # 部分结果画在了金字塔上，重新解码原图去掉
+                self._ShowImg(self.data)
             self.changeLabel.setText(self.tr("失败"))
         self.SetStatus(True)
         return
@@ -296,14 +643,27 @@ class QtImg(QtWidgets.QWidget, Ui_Img):
             picFormat = self.format if self.format else "jpg"
             filepath = QFileDialog.getSaveFileName(self, "Save", "{}.{}".format(today, picFormat))
             if filepath and len(filepath) >= 1 and filepath[0]:
-                name = filepath[0]
-                f = open(name, "wb")
-                f.write(data)
-                f.close()
+                # 后台写入，写入期间可以继续转换和打开其他图片
+                self.fileWorker.Write(filepath[0], data)
+                self.saveNum += 1
+                self.saveProgress.setValue(0)
+                self.saveProgress.show()
         except Exception as es:
             Log.Error(es)
         return
 
+    def AddWriteProgress(self, requestId, done, total):
+        self.saveProgress.setValue(int(done * 100 / total) if total else 100)
+
+    def AddWriteBack(self, requestId, isOk, path):
+        self.saveNum -= 1
+        if self.saveNum <= 0:
+            self.saveProgress.hide()
+        if isOk:
+            QtBubbleLabel.ShowMsgEx(self, "Save Success")
+        else:
+            QtBubbleLabel.ShowErrorEx(self, "Save Fail")
+
     def SwithPicture(self):
         if self.checkBox.isChecked() and self.waifu2xData:
             self._ShowImg(self.waifu2xData)
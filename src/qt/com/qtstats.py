@@ -0,0 +1,78 @@
+from PySide6 import QtWidgets
+from PySide6.QtCore import QTimer, Qt
+
+from src.qt.util.qttask import QtTask
+
+
+class QtStats(QtWidgets.QDockWidget):
+    """
+    转换统计面板
+    每秒从 QtTask().GetStats() 读取一次，只在面板可见时刷新
+    """
+    # (阶段, 显示名, 单位)
+    Rows = (
+        ("queue", "queue wait", "s"),
+        ("engine", "engine", "s"),
+        ("callback", "callback", "s"),
+    )
+
+    def __init__(self, parent=None):
+        super(self.__class__, self).__init__("stats", parent)
+        self.setObjectName("statsDock")
+        self.setAllowedAreas(Qt.LeftDockWidgetArea | Qt.RightDockWidgetArea)
+
+        widget = QtWidgets.QWidget(self)
+        layout = QtWidgets.QVBoxLayout(widget)
+        self.summary = QtWidgets.QLabel(widget)
+        self.summary.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        layout.addWidget(self.summary)
+
+        self.table = QtWidgets.QTableWidget(len(self.Rows), 5, widget)
+        self.table.setHorizontalHeaderLabels(["count", "mean", "p50", "p95", "max"])
+        self.table.setVerticalHeaderLabels([name for _, name, _ in self.Rows])
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Stretch)
+        layout.addWidget(self.table)
+
+        self.workerLabel = QtWidgets.QLabel(widget)
+        layout.addWidget(self.workerLabel)
+        layout.addStretch(1)
+        self.setWidget(widget)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000)
+        self.timer.timeout.connect(self.Refresh)
+        self.visibilityChanged.connect(self.OnVisibilityChanged)
+
+    def OnVisibilityChanged(self, isVisible):
+        if isVisible:
+            self.Refresh()
+            self.timer.start()
+        else:
+            self.timer.stop()
+
+    def Refresh(self):
+        info = QtTask().GetStats()
+        images = info["images"]
+        self.summary.setText(
+            "queue: {}  running: {}  waiting: {}\n"
+            "images: {:.2f}/s  {:.2f} MP/s".format(
+                info["queueDepth"], info["running"], info["waiting"],
+                images["rate"], images["totalRate"]))
+
+        for row, (stage, _, unit) in enumerate(self.Rows):
+            stat = info[stage]
+            values = [str(stat["count"])] + \
+                     ["{:.3f}{}".format(stat[key], unit) for key in ("mean", "p50", "p95", "max")]
+            for column, text in enumerate(values):
+                item = self.table.item(row, column)
+                if item is None:
+                    item = QtWidgets.QTableWidgetItem()
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                    self.table.setItem(row, column, item)
+                item.setText(text)
+
+        self.workerLabel.setText("\n".join(
+            "{}: {} queued, {} running, {} done".format(
+                worker["name"], worker["queue"], worker["running"], worker["done"])
+            for worker in info["workers"]))
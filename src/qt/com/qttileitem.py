@@ -0,0 +1,153 @@
+"""
+分块显示的图片
+整张图片放在一个QGraphicsPixmapItem中时，绘制和显存占用都与图片的完整尺寸成正比，
+这里按视图只绘制与可见区域相交的分块：
+1. 根据当前的缩放比例从预览金字塔中选择层级，每个层级按tileSize切成分块
+2. 分块在第一次可见时才转换成QPixmap，放入按字节数限制大小的LRU缓存，超出时淘汰最久未用的
+3. 需要的层级还没有解码时（比如原图正在后台解码），用已有的最接近的层级代替
+4. 分块转换的部分结果直接画到各个层级上，只重新生成受影响的分块
+"""
+
+import math
+from collections import OrderedDict
+
+from PySide6.QtCore import QRect, QRectF
+from PySide6.QtGui import QPixmap, QPainter
+from PySide6.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem
+
+from conf import config
+from src.util.metrics import Metrics
+from src.util.trace import Trace
+
+
+class QtTiledImageItem(QGraphicsItem):
+    def __init__(self, tileSize=0, cacheSize=0):
+        super(self.__class__, self).__init__()
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.tileSize = tileSize or config.ViewTileSize
+        self.cacheSize = (cacheSize or config.ViewTileCacheSize) * 1024 * 1024
+        self.pyramid = None
+        self._tiles = OrderedDict()     # {(层级, 列, 行): QPixmap}，顺序即LRU顺序
+        self._tileBytes = 0
+        self.createNum = 0              # 创建过的分块数，用于统计
+
+    def SetPyramid(self, pyramid):
+        self.prepareGeometryChange()
+        self.pyramid = pyramid
+        self.Clear()
+        self.update()
+
+    def Clear(self):
+        self._tiles.clear()
+        self._tileBytes = 0
+
+    def DropLevel(self, level):
+        """释放一个层级的所有分块"""
+        for key in [key for key in self._tiles if key[0] == level]:
+            pix = self._tiles.pop(key)
+            self._tileBytes -= pix.width() * pix.height() * 4
+
+    def DrawRegions(self, regions):
+        """
+        把已经缩放到层级大小的图片画到层级上
+        regions: [(层级, QRect, QImage)]，QRect为层级中的位置，没有解码的层级跳过
+        """
+        if not self.pyramid:
+            return
+        tileSize = self.tileSize
+        for level, rect, img in regions:
+            levelImg = self.pyramid.levels.get(level)
+            if levelImg is None:
+                continue
+            painter = QPainter(levelImg)
+            painter.drawImage(rect.topLeft(), img)
+            painter.end()
+            # 释放与该区域相交的分块，下次绘制时重新生成
+            for key in [key for key in self._tiles if key[0] == level and
+                        QRect(key[1] * tileSize, key[2] * tileSize, tileSize, tileSize).intersects(rect)]:
+                pix = self._tiles.pop(key)
+                self._tileBytes -= pix.width() * pix.height() * 4
+        self.update()
+
+    def GetCacheBytes(self):
+        return self._tileBytes
+
+    def boundingRect(self):
+        if not self.pyramid:
+            return QRectF()
+        return QRectF(0, 0, self.pyramid.size[0], self.pyramid.size[1])
+
+    def GetPaintLevel(self, viewScale):
+        """与显示比例匹配的层级，没有解码时用更小的层级代替，没有更小的就用最接近的"""
+        levels = self.pyramid.levels
+        level = self.pyramid.GetLevel(viewScale)
+        if level in levels:
+            return level
+        coarser = [key for key in levels if key > level]
+        return min(coarser) if coarser else max(levels)
+
+    def _GetTile(self, level, col, row):
+        key = (level, col, row)
+        pix = self._tiles.get(key)
+        if pix is not None:
+            self._tiles.move_to_end(key)
+            return pix
+        img = self.pyramid.levels[level]
+        rect = QRect(col * self.tileSize, row * self.tileSize, self.tileSize, self.tileSize).intersected(img.rect())
+        with Metrics.Timer("view.uploadTile"):
+            pix = QPixmap.fromImage(img.copy(rect))
+        self.createNum += 1
+        self._tiles[key] = pix
+        self._tileBytes += pix.width() * pix.height() * 4
+        return pix
+
+    def _Evict(self, keepKeys):
+        """淘汰最久未用的分块，本次绘制用到的分块保留"""
+        for key in list(self._tiles):
+            if self._tileBytes <= self.cacheSize:
+                break
+            if key in keepKeys:
+                continue
+            pix = self._tiles.pop(key)
+            self._tileBytes -= pix.width() * pix.height() * 4
+
+    def paint(self, painter, option, widget=None):
+        if not self.pyramid or not self.pyramid.levels:
+            return
+        with Trace.Span("paint"), Metrics.Timer("view.paint"):
+            self._Paint(painter, option)
+        Metrics.Gauge("view.tileCacheBytes", self._tileBytes)
+
+    def _Paint(self, painter, option):
+        transform = painter.worldTransform()
+        level = self.GetPaintLevel(QStyleOptionGraphicsItem.levelOfDetailFromTransform(transform))
+        scale = self.pyramid.GetScale(level)
+        img = self.pyramid.levels[level]
+
+        # 需要绘制的区域：重绘区域与绘制设备可见范围的交集，原图坐标
+        rect = option.exposedRect.intersected(self.boundingRect())
+        device = painter.device()
+        inverted, isOk = transform.inverted()
+        if device and isOk:
+            rect = rect.intersected(inverted.mapRect(QRectF(0, 0, device.width(), device.height())))
+        if rect.isEmpty():
+            return
+
+        tileSize = self.tileSize
+        cols = math.ceil(img.width() / tileSize)
+        rows = math.ceil(img.height() / tileSize)
+        # 右下边界不包含在区域内，刚好落在分块边界上时不需要下一个分块
+        col0 = max(0, int(rect.left() / scale // tileSize))
+        col1 = min(cols - 1, math.ceil(rect.right() / scale / tileSize) - 1)
+        row0 = max(0, int(rect.top() / scale // tileSize))
+        row1 = min(rows - 1, math.ceil(rect.bottom() / scale / tileSize) - 1)
+
+        keepKeys = set()
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                pix = self._GetTile(level, col, row)
+                keepKeys.add((level, col, row))
+                target = QRectF(col * tileSize * scale, row * tileSize * scale,
+                                pix.width() * scale, pix.height() * scale)
+                painter.drawPixmap(target, pix, QRectF(pix.rect()))
+        self._Evict(keepKeys)
@@ -1,18 +1,25 @@
 
 
+import os
+import time
+
 # 导入PySide6的核心GUI模块和组件
 from PySide6 import QtWidgets, QtGui  # 导入PySide6部件
-from PySide6.QtCore import QTimer, QUrl
+from PySide6.QtCore import QTimer, QUrl, Qt, QLocale, QTranslator
 from PySide6.QtGui import QIcon, QPixmap, QDesktopServices, QGuiApplication
 from PySide6.QtWidgets import QMessageBox
 
 # 导入项目内部模块
+# 设置、关于对话框和waifu2x在第一次使用时才导入，不影响启动速度
 from conf import config  # 导入全局配置文件
 from src.qt.com.qtbubblelabel import QtBubbleLabel  # 导入自定义的气泡提示标签
 from src.qt.com.qtimg import QtImg  # 导入核心的图片处理界面
-from src.qt.menu.qtabout import QtAbout  # 导入“关于”对话框
-from src.qt.menu.qtsetting import QtSetting  # 导入设置对话框
+from src.qt.com.qtstats import QtStats  # 导入转换统计面板
+from src.qt.util.qttask import QtTask  # 导入任务管理器
 from src.util import Log  # 导入日志工具
+from src.util.metrics import Metrics  # 导入热点路径计时
+from src.util.startup import Startup  # 导入启动耗时
+from src.util.trace import Trace  # 导入性能跟踪
 from ui.main import Ui_MainWindow  # 导入由Qt Designer生成的UI定义类
 
 
@@ -31,20 +38,45 @@ class QtMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         self.setupUi(self)
         # 设置窗口标题
         self.setWindowTitle("Waifu2x-Gui")
+        Startup.Mark("window.setupUi")
 
         # 实例化各个子窗口或组件
         self.msgForm = QtBubbleLabel(self)  # 用于显示消息的气泡提示
-        self.settingForm = QtSetting(self)  # 设置窗口
-        self.settingForm.hide()  # 默认隐藏设置窗口
-        self.settingForm.LoadSetting()  # 从配置文件加载设置
+        # 设置和“关于”窗口在第一次打开时才创建，见settingForm和aboutForm
+        self._settingForm = None
+        self._aboutForm = None
+        self.translate = QTranslator()  # 用于实现多语言翻译的翻译家对象
+        self.isFirstPaint = False
+        self.engineInfo = None  # 后台初始化引擎的结果，完成前为None
 
-        self.aboutForm = QtAbout(self)  # “关于”窗口
         self.img = QtImg()  # 核心的图片处理和显示窗口
+        Startup.Mark("window.img")
 
         # 将图片处理窗口(self.img)添加到stackedWidget中
         # QStackedWidget是一个可以包含多个子控件但一次只显示一个的容器
         self.stackedWidget.addWidget(self.img)
 
+        # 转换统计面板，默认隐藏，通过菜单中的“stats”打开
+        self.statsDock = QtStats(self)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.statsDock)
+        self.statsDock.hide()
+        self.menuabout.addAction(self.statsDock.toggleViewAction())
+
+        # 性能跟踪开关，关闭时把记录写到logs目录，可以用chrome://tracing或ui.perfetto.dev打开
+        self.traceAction = QtGui.QAction("trace", self)
+        self.traceAction.setCheckable(True)
+        self.traceAction.toggled.connect(self.SwitchTrace)
+        self.menuabout.addAction(self.traceAction)
+        self.traceAction.setChecked(config.IsTrace)
+
+        # 热点路径计时报告
+        self.metricsAction = QtGui.QAction("metrics", self)
+        self.metricsAction.triggered.connect(self.ShowMetrics)
+        self.menuabout.addAction(self.metricsAction)
+
+        # 设置窗口，GPU和线程数在启动时按保存的设置选择，修改后重启生效
+        self.menuabout.addAction(self.actionsetting)
+
         # --- 信号与槽连接 ---
         # 当菜单栏的“关于”项(self.menuabout)被触发(triggered)时，调用self.OpenAbout方法
         self.menuabout.triggered.connect(self.OpenAbout)
@@ -52,62 +84,161 @@ class QtMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         # 获取主屏幕的尺寸，用于后续可能的窗口居中或缩放（当前代码已注释）
         desktop = QGuiApplication.primaryScreen().geometry()
 
+    @property
+    def settingForm(self):
+        """设置窗口，第一次使用时才创建"""
+        if self._settingForm is None:
+            from src.qt.menu.qtsetting import QtSetting
+            self._settingForm = QtSetting(self)
+            if self.engineInfo:
+                self._settingForm.SetGpuInfos(self.engineInfo["gpuInfo"], self.engineInfo["cpuNum"])
+        return self._settingForm
+
+    @property
+    def aboutForm(self):
+        """“关于”窗口，第一次使用时才创建"""
+        if self._aboutForm is None:
+            from src.qt.menu.qtabout import QtAbout
+            self._aboutForm = QtAbout(self)
+        return self._aboutForm
+
     # 重写closeEvent事件处理器，当用户关闭窗口时此方法会被自动调用
     def closeEvent(self, a0: QtGui.QCloseEvent) -> None:
+        from src.qt.menu.qtsetting import QtSetting
         # 调用父类的同名方法，以确保正常的关闭流程
         super().closeEvent(a0)
-        # 在退出前保存当前的设置和窗口大小
-        self.settingForm.ExitSaveSetting(self.size())
+        # 在退出前保存窗口大小，不需要创建设置窗口
+        QtSetting.ExitSaveSetting(self.size())
+        # 退出时还在跟踪，保存已经记录的部分
+        self.traceAction.setChecked(False)
+
+    # 第一次绘制完成后再创建任务管理器、初始化引擎，绘制之前只做显示窗口必须的工作
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.isFirstPaint:
+            self.isFirstPaint = True
+            # 子控件在同一轮中绘制，等这一轮结束再记录
+            QTimer.singleShot(0, self.OnFirstPaint)
+
+    def OnFirstPaint(self):
+        Startup.Mark("first paint")
+        Log.Info("startup {:.0f}ms\n{}", Startup.GetTime("first paint"), Startup.FormatReport())
+        self.LoadEngine()
 
     # 定义一个用于多语言翻译的方法
     def RetranslateUi(self):
-        # 当语言切换时，递归地调用所有子窗口的retranslateUi方法来更新界面文本
-        self.settingForm.retranslateUi(self.settingForm)
+        # 当语言切换时，递归地调用所有子窗口的retranslateUi方法来更新界面文本，还没有创建的窗口创建时就是当前语言
+        if self._settingForm:
+            self._settingForm.retranslateUi(self._settingForm)
+        if self._aboutForm:
+            self._aboutForm.retranslateUi(self._aboutForm)
         self.img.retranslateUi(self.img)
-        self.aboutForm.retranslateUi(self.aboutForm)
         # 更新主窗口自身的文本
         self.retranslateUi(self)
 
-    # 程序核心初始化方法，在start.py中被调用
-    def Init(self, app):
-        # 初始化语言设置
-        self.settingForm.SetLanguage(app, self)
-
-        # 检查waifu2x核心库是否可用
-        if config.CanWaifu2x:
-            from waifu2x_vulkan import waifu2x_vulkan
-            # 初始化waifu2x引擎
-            stat = waifu2x_vulkan.init()
-            if stat < 0:
-                self.msgForm.ShowError("Waifu2x CPU Model")  # 初始化失败则显示错误
-            waifu2x_vulkan.setDebug(True)  # 开启调试模式
+    # 设置应用程序的语言
+    def SetLanguage(self):
+        app = QtWidgets.QApplication.instance()
+        language = config.Language
+
+        # 如果设置为“自动”，则根据操作系统语言来判断
+        if language == 0:
+            locale = QLocale.system().name() # 获取系统语言环境，如 'zh_CN'
+            Log.Info(f"Init translate {locale}")
+            if locale.lower().startswith("zh_"):
+                language = 1 if locale.lower() == "zh_cn" else 2 # 简体中文或繁体中文
+            else:
+                language = 3 # 英文
+
+        # 根据最终的语言选项加载不同的.qm翻译文件
+        if language == 1: # 简体中文 (默认，无需加载翻译文件)
+            app.removeTranslator(self.translate)
+        else:
+            # 翻译文件在资源中，需要时才注册资源
+            import images_rc
+            # 繁体中文或英文，从资源文件中加载
+            self.translate.load(":/tr_hk.qm" if language == 2 else ":/tr_en.qm")
+            app.installTranslator(self.translate)
 
-            # 获取GPU和CPU信息，并传递给设置窗口用于显示和选择
-            gpuInfo = waifu2x_vulkan.getGpuInfo()
-            cpuNum = waifu2x_vulkan.getCpuCoreNum()
-            self.settingForm.SetGpuInfos(gpuInfo, cpuNum)
+        # 刷新整个界面的文本
+        self.RetranslateUi()
 
-            # 显示设置窗口，让用户进行初始配置
-            self.settingForm.exec()
-            # 根据用户的设置，再次设定语言
-            self.settingForm.SetLanguage(app, self)
-            # 将用户的GPU和CPU核心数选择应用到waifu2x引擎
-            waifu2x_vulkan.initSet(config.Encode, config.UseCpuNum)
+    # 程序核心初始化方法，在start.py中被调用，只做显示主窗口之前必须的工作
+    def Init(self, app):
+        from src.qt.menu.qtsetting import QtSetting
+        # 从配置文件加载设置，初始化语言设置
+        QtSetting.LoadConfig()
+        self.SetLanguage()
+
+        # 引擎初始化完成前不能转换
+        self.img.gpuName.setText(self.tr("初始化中"))
+        self.img.changeJpg.setEnabled(False)
+        self.img.changePng.setEnabled(False)
+        return
 
+    # 创建任务管理器，waifu2x的导入、GPU探测和初始化在任务管理器的后台线程中进行
+    def LoadEngine(self):
+        task = QtTask()
+        Startup.Mark("task")
+        task.engineBack.connect(self.OnEngineLoad)
+        # 连接之前已经完成时不会再发射信号
+        if not task.isEngineLoad:
+            self.OnEngineLoad(task.engineInfo)
+
+    # 引擎初始化完成的槽函数
+    def OnEngineLoad(self, info):
+        if self.engineInfo is not None:
+            return
+        self.engineInfo = info
+        Startup.Mark("engine")
+        Log.Info("engine ready {:.0f}ms", Startup.GetTime("engine"))
+        engine = QtTask().engine
+
+        if info and engine:
+            if info["stat"] < 0:
+                self.msgForm.ShowError("Waifu2x CPU Model")  # 初始化失败则显示错误
+            # 已经打开过设置窗口时，把GPU和CPU信息传递给设置窗口用于显示和选择
+            if self._settingForm:
+                self._settingForm.SetGpuInfos(info["gpuInfo"], info["cpuNum"])
             # 在主界面上显示当前使用的GPU名称
             self.img.gpuName.setText(config.EncodeGpu)
-            Log.Info("waifu2x init: " + str(stat) + " encode: " + str(config.Encode) + " version:" + waifu2x_vulkan.getVersion())
+        elif engine:
+            # 核心库不可用，但可以退回到CPU引擎，只禁用CPU引擎不支持的TTA
+            self.msgForm.ShowError("Waifu2x can not use, use CPU engine, " + config.ErrorMsg)
+            config.EncodeGpu = "CPU"
+            self.img.gpuName.setText(config.EncodeGpu)
+            self.img.ttaModel.setEnabled(False)
+            Log.Info("waifu2x can not use, engine: " + str(engine.Capabilities()))
         else:
-            # 如果核心库不可用，显示错误信息并禁用所有相关UI功能
+            # 如果没有任何可用的引擎，显示错误信息并禁用所有相关UI功能
             self.msgForm.ShowError("Waifu2x can not use, " + config.ErrorMsg)
+            self.img.gpuName.setText("")
             self.img.checkBox.setEnabled(False)
-            self.img.changeJpg.setEnabled(False)
-            self.img.changePng.setEnabled(False)
             self.img.comboBox.setEnabled(False)
             self.img.SetStatus(False)
             config.IsOpenWaifu = 0
-
-        return
+            return
+        self.img.changeJpg.setEnabled(True)
+        self.img.changePng.setEnabled(True)
+
+    # 性能跟踪开关的槽函数
+    def SwitchTrace(self, isChecked):
+        if isChecked:
+            Trace.Start()
+            return
+        if not Trace.isEnable:
+            return
+        path = os.path.join("logs", "trace_" + time.strftime("%Y%m%d_%H%M%S") + ".json")
+        num = Trace.Stop(path)
+        Log.Info("trace saved, path:{}, events:{}", path, num)
+        QtBubbleLabel.ShowMsgEx(self, "trace saved: " + path)
+
+    # 显示计时报告的槽函数，同时写入日志
+    def ShowMetrics(self):
+        import html
+        report = Metrics.FormatReport() + "\n\n" + Startup.FormatReport()
+        Log.Info("metrics report\n{}", report)
+        QMessageBox.information(self, "metrics", "<pre>" + html.escape(report) + "</pre>")
 
     # “打开关于”的槽函数
     def OpenAbout(self, action):
@@ -115,4 +246,6 @@ class QtMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         if action.text() == "about":
             # 如果是，则显示“关于”窗口
             self.aboutForm.show()
+        elif action == self.actionsetting:
+            self.settingForm.show()
         pass
\ No newline at end of file
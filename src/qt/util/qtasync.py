@@ -0,0 +1,76 @@
+"""
+asyncio接口
+在asyncio中转换图片：
+
+    async def Main():
+        sem = asyncio.Semaphore(8)
+
+        async def One(data):
+            async with sem:
+                return await convert(data, {"scale": 2, "format": "jpg"}, cleanFlag="Script")
+
+        return await asyncio.gather(*(One(data) for data in datas))
+
+    QtAsyncLoop().RunUntilComplete(Main())
+
+转换结果通过Qt信号在主线程回调，所以主线程必须运行Qt事件循环：
+1. QtAsyncLoop在Qt事件循环中用定时器驱动asyncio事件循环，两者都在主线程
+2. asyncio事件循环也可以运行在其他线程，convert本身是线程安全的，只需要主线程运行Qt事件循环
+"""
+
+import asyncio
+
+from PySide6.QtCore import QObject, QTimer, QEventLoop
+
+from src.qt.util.qttask import QtTask
+from src.util.scheduler import TaskPriority
+
+
+async def convert(imgData, model, cleanFlag="", priority=TaskPriority.Interactive, progressCallBack=None):
+    """
+    转换一张图片，返回转换后的数据，失败时抛出ConvertError
+    协程被取消时（包括asyncio.wait_for超时）同时取消转换任务
+    """
+    future = QtTask().AddConvertTask(imgData, model, cleanFlag=cleanFlag, priority=priority,
+                                     progressCallBack=progressCallBack, isFuture=True)
+    # wrap_future会把asyncio的取消传递给future，future取消时再取消转换任务
+    return await asyncio.wrap_future(future)
+
+
+class QtAsyncLoop(QObject):
+    """
+    在Qt事件循环中驱动asyncio事件循环
+    每隔interval毫秒处理一次asyncio中已经就绪的回调，不会阻塞Qt事件循环
+    """
+
+    def __init__(self, loop=None, interval=5):
+        super(self.__class__, self).__init__()
+        self.loop = loop or asyncio.new_event_loop()
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.Step)
+
+    def Start(self):
+        asyncio.set_event_loop(self.loop)
+        self.timer.start()
+
+    def Stop(self):
+        self.timer.stop()
+
+    def Step(self):
+        # stop会在处理完当前已经就绪的回调后生效，因此run_forever不会阻塞
+        self.loop.call_soon(self.loop.stop)
+        self.loop.run_forever()
+
+    def RunUntilComplete(self, coro):
+        """运行协程直到完成，期间Qt事件循环正常运行，返回协程的结果"""
+        task = self.loop.create_task(coro)
+        eventLoop = QEventLoop()
+        task.add_done_callback(lambda _: eventLoop.quit())
+        self.Start()
+        try:
+            if not task.done():
+                eventLoop.exec()
+        finally:
+            self.Stop()
+        return task.result()
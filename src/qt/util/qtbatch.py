@@ -0,0 +1,222 @@
+"""
+批量转换模块
+不依赖界面，把整个目录树的图片流式地送入 QtTask 转换：
+1. 读取线程：惰性遍历目录，读取文件并提交任务
+2. QtTask：转换（回调在Qt主线程执行）
+3. 写入线程：把结果写到输出目录
+同时在途的任务数由信号量限制，无论输入有多少文件，内存占用都保持平稳
+指定日志文件时，每个任务的提交和结果都会记录下来，中途退出后重新运行只转换没有完成的文件
+"""
+
+import os
+import threading
+from queue import Queue
+
+from PySide6.QtCore import Signal, QObject
+
+from src.qt.util.qttask import QtTask
+from src.util import Log
+from src.util.journal import JobJournal, JournalState
+from src.util.scheduler import TaskPriority
+
+ImageExts = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def WalkImages(path, recursive=True, skipPath=""):
+    """惰性遍历目录，逐个产出图片路径，每次只列出一个目录；skipPath目录不进入，避免输出目录在输入目录中时转换刚写出的文件"""
+    if os.path.isfile(path):
+        yield path
+        return
+    skip = os.path.normcase(os.path.realpath(skipPath)) if skipPath else ""
+    yield from _WalkImages(path, recursive, skip)
+
+
+def _WalkImages(path, recursive, skip):
+    try:
+        entries = sorted(os.scandir(path), key=lambda e: e.name)
+    except OSError as es:
+        Log.Error(es)
+        return
+    for entry in entries:
+        if entry.is_dir():
+            if recursive and os.path.normcase(os.path.realpath(entry.path)) != skip:
+                yield from _WalkImages(entry.path, recursive, skip)
+        elif entry.name.lower().endswith(ImageExts):
+            yield entry.path
+
+
+class QtBatch(QObject):
+    # 单个文件处理完成：源路径，输出路径，是否成功
+    fileBack = Signal(str, str, bool)
+    # 全部处理完成
+    finishBack = Signal()
+
+    _batchId = 0
+
+    def __init__(self, inputPath, outputPath, model, maxInFlight=8, recursive=True, overwrite=False,
+                 journalPath="", retryFailed=False):
+        super(self.__class__, self).__init__()
+        self.inputPath = inputPath
+        self.outputPath = outputPath
+        self.model = model
+        self.maxInFlight = max(1, maxInFlight)
+        self.recursive = recursive
+        self.overwrite = overwrite
+        self.retryFailed = retryFailed
+        # 断点续传日志，记录中已完成并且输出校验通过的文件会被跳过
+        self.journal = JobJournal(journalPath) if journalPath else None
+        # 上次中途退出时已提交但没有结果的文件数
+        self.resumeNum = len(self.journal.GetUnfinished()) if self.journal else 0
+        if self.resumeNum:
+            Log.Info("batch resume, unfinished:{}, journal:{}", self.resumeNum, journalPath)
+
+        # 确保QtTask在主线程创建，它的信号对象需要主线程的事件循环
+        QtTask()
+        QtBatch._batchId += 1
+        self.cleanFlag = "QtBatch{}".format(QtBatch._batchId)
+
+        self.okNum = 0
+        self.failNum = 0
+        self.skipNum = 0
+
+        self._slots = threading.Semaphore(self.maxInFlight)  # 在途任务数限制
+        self._lock = threading.Lock()
+        self._pending = {}                                    # {taskId: (src, dst)}
+        self._usedDst = set()                                 # 本次已经分配的输出路径，只在读取线程使用
+        self._writeQueue = Queue()
+        self._isStop = False
+        self._readThread = threading.Thread(target=self._RunRead, daemon=True)
+        self._writeThread = threading.Thread(target=self._RunWrite, daemon=True)
+
+    def Start(self):
+        self._readThread.start()
+        self._writeThread.start()
+
+    def Stop(self):
+        """取消还未完成的任务，已经写出的文件保留"""
+        self._isStop = True
+        QtTask().CancelConver(self.cleanFlag)
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for _ in pending:
+            self._slots.release()
+
+    def GetOutputPath(self, src):
+        if os.path.isfile(self.inputPath):
+            rel = os.path.basename(src)
+        else:
+            rel = os.path.relpath(src, self.inputPath)
+        return os.path.splitext(os.path.join(self.outputPath, rel))[0] + "." + self.model.get("format", "jpg")
+
+    def GetUniqueOutputPath(self, src):
+        """
+        同一目录下a.png和a.jpg都会输出为a.<format>，后遍历到的源文件加上原扩展名作为后缀，例如a_png.<format>
+        遍历顺序固定，重新运行时每个源文件得到的输出路径不变，日志记录仍然有效
+        """
+        dst = self.GetOutputPath(src)
+        if os.path.normcase(dst) in self._usedDst:
+            base, ext = os.path.splitext(dst)
+            base += "_" + os.path.splitext(src)[1].lstrip(".").lower()
+            dst, index = base + ext, 1
+            while os.path.normcase(dst) in self._usedDst:
+                dst, index = "{}_{}{}".format(base, index, ext), index + 1
+            Log.Warn("batch output name conflict: {} -> {}", src, dst)
+        self._usedDst.add(os.path.normcase(dst))
+        return dst
+
+    def _RunRead(self):
+        for src in WalkImages(self.inputPath, self.recursive, self.outputPath):
+            dst = self.GetUniqueOutputPath(src)
+            if self._IsSkip(src, dst):
+                self.skipNum += 1
+                continue
+            # 等待空闲的在途名额，读取放在拿到名额之后，保证内存中最多只有maxInFlight张原图
+            self._slots.acquire()
+            if self._isStop:
+                self._slots.release()
+                break
+            try:
+                with open(src, "rb") as f:
+                    data = f.read()
+            except Exception as es:
+                Log.Error(es)
+                self._slots.release()
+                if self.journal:
+                    self.journal.Fail(src, dst, self.model)
+                self._Finish(src, dst, False)
+                continue
+            if self.journal:
+                self.journal.Submit(src, dst, self.model)
+            with self._lock:
+                taskId = QtTask().AddConvertTask(data, self.model, self.AddConvertBack, cleanFlag=self.cleanFlag,
+                                                 priority=TaskPriority.Batch)
+                self._pending[taskId] = (src, dst)
+
+        # 拿回所有名额，即等待所有在途任务写完
+        for _ in range(self.maxInFlight):
+            self._slots.acquire()
+        self._writeQueue.put(None)
+        if self.journal:
+            self.journal.Compact()
+            self.journal.Close()
+        Log.Info("batch convert end, ok:{}, fail:{}, skip:{}", self.okNum, self.failNum, self.skipNum)
+        self.finishBack.emit()
+
+    def _IsSkip(self, src, dst):
+        """
+        有日志时以日志为准：已完成并且校验通过的跳过，失败的除非retryFailed否则跳过，
+        已提交但没有结果的重新转换，即使输出文件已经存在
+        日志中没有记录时，不覆盖已经存在的输出
+        """
+        state = self.journal.GetState(src, dst, self.model) if self.journal else None
+        if state == JournalState.Done:
+            return True
+        if state == JournalState.Fail:
+            return not self.retryFailed
+        if state == JournalState.Submit:
+            return False
+        return not self.overwrite and os.path.isfile(dst)
+
+    def AddConvertBack(self, data, taskId, backParam, tick):
+        # 在主线程执行，只做转交，写文件交给写入线程
+        self._writeQueue.put((taskId, data))
+
+    def _RunWrite(self):
+        while True:
+            item = self._writeQueue.get(True)
+            if item is None:
+                break
+            taskId, data = item
+            with self._lock:
+                info = self._pending.pop(taskId, None)
+            if not info:
+                continue
+            src, dst = info
+            isOk = False
+            if data:
+                try:
+                    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+                    # 先写临时文件再改名，中断时不会留下不完整的输出
+                    tmp = dst + ".tmp"
+                    with open(tmp, "wb") as f:
+                        f.write(data)
+                    os.replace(tmp, dst)
+                    isOk = True
+                except Exception as es:
+                    Log.Error(es)
+            if self.journal:
+                if isOk:
+                    self.journal.Done(src, dst, self.model, data)
+                else:
+                    self.journal.Fail(src, dst, self.model)
+            del data
+            self._slots.release()
+            self._Finish(src, dst, isOk)
+
+    def _Finish(self, src, dst, isOk):
+        with self._lock:
+            if isOk:
+                self.okNum += 1
+            else:
+                self.failNum += 1
+        self.fileBack.emit(src, dst, isOk)
@@ -0,0 +1,247 @@
+"""
+后台图片解码
+QPixmap只能在主线程使用，QImage可以在任意线程解码：
+1. 工作线程把数据解码成QImage，并转换成绘制最快的格式
+2. 通过信号回到主线程，主线程只需要QPixmap.fromImage
+3. 只保留最新的一个请求，连续切换图片时中间的图片不会被解码
+4. 大图可以同时生成预览金字塔，显示时按缩放比例选择层级，原始分辨率按需重新解码
+   大图直接按第1层的大小解码，不需要先完整解码原图；完整解码超过config.ImageAllocationLimit时只解码缩小的层级
+5. 分块转换的部分结果也在工作线程解码并缩放到各个层级的大小，主线程只需要画到层级上
+"""
+
+import itertools
+import math
+import threading
+from collections import deque
+
+from PySide6.QtCore import Signal, QObject, Qt, QBuffer, QIODevice, QSize
+from PySide6.QtGui import QImage, QImageReader
+
+from conf import config
+from src.util import Log
+from src.util.metrics import Metrics
+from src.util.trace import Trace
+
+
+class ImagePyramid(object):
+    """
+    预览金字塔
+    levels: {层级: QImage}，第n层的宽高为原图的1/2^n
+    小图只有第0层；大图只保留第1层及以下，第0层（原图）需要时再解码，不需要时释放
+    原图解码后超过config.ImageAllocationLimit时不会解码第0层，最多显示到minLevel层
+    """
+
+    def __init__(self, data, size):
+        self.data = data        # 原始数据，用来重新解码原图
+        self.size = size        # 原图宽高
+        self.levels = {}
+        self.minLevel = self.GetMinLevel(size)  # 可以解码的最大的层级
+
+    @staticmethod
+    def GetMinLevel(size):
+        """解码后不超过config.ImageAllocationLimit的最大的层级，0表示原图可以完整解码"""
+        limit = config.ImageAllocationLimit * 1024 * 1024
+        level = 0
+        while limit > 0 and (size[0] >> level) * (size[1] >> level) * 4 > limit:
+            level += 1
+        return level
+
+    @classmethod
+    def Build(cls, data, img, levelSize=0, size=None, level=0):
+        """
+        在工作线程中逐层缩小一半，直到不超过levelSize
+        img: 第level层的图片，size: 原图宽高，默认为img的宽高
+        """
+        levelSize = levelSize or config.PreviewLevelSize
+        pyramid = cls(data, size or (img.width(), img.height()))
+        if level == 0 and max(pyramid.size) <= levelSize:
+            pyramid.levels[0] = img
+            return pyramid
+        if level > 0:
+            pyramid.levels[level] = img
+        while max(img.width(), img.height()) > levelSize:
+            img = img.scaled(max(1, img.width() // 2), max(1, img.height() // 2),
+                             Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+            level += 1
+            pyramid.levels[level] = img
+        return pyramid
+
+    @property
+    def isSmall(self):
+        return max(self.levels) == 0
+
+    def GetLevel(self, viewScale):
+        """显示比例对应的层级：不小于屏幕上尺寸的最小层级，超过config.PreviewFullScale时为原图"""
+        if self.isSmall:
+            return 0
+        if viewScale > config.PreviewFullScale:
+            return self.minLevel
+        if viewScale <= 0:
+            return max(self.levels)
+        level = max(1, self.minLevel, int(math.floor(math.log2(1 / viewScale))))
+        return min(level, max(self.levels))
+
+    def GetScale(self, level):
+        """该层级在原图坐标下的缩放比例"""
+        return self.size[0] / self.levels[level].width()
+
+
+class QtImageDecoder(QObject):
+    # 解码完成：请求ID，解码结果（失败时为空的QImage）
+    decodeBack = Signal(int, QImage)
+    # 金字塔生成完成：请求ID，ImagePyramid（失败时为None）
+    pyramidBack = Signal(int, object)
+    # 部分结果解码完成：请求ID，[(key, QRect, QImage)]
+    regionsBack = Signal(int, object)
+
+    def __init__(self):
+        super(self.__class__, self).__init__()
+        # Qt默认拒绝解码超过128MB的图片，放大后的大图会无法显示
+        QImageReader.setAllocationLimit(config.ImageAllocationLimit)
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._pending = None        # (requestId, data, isPyramid)，只保留最新的请求
+        self._regionJobs = deque()  # [(requestId, regions)]，部分结果不能丢弃，按顺序处理
+        self._imageJobs = deque()   # [(requestId, data)]，DecodeQueued的请求，不会被丢弃
+        self._isStop = False
+        self._thread = threading.Thread(target=self._Run, daemon=True)
+        self._thread.start()
+
+    def Decode(self, data, isPyramid=False):
+        """
+        提交解码请求，返回请求ID；还没开始的旧请求会被丢弃
+        isPyramid时通过pyramidBack返回ImagePyramid，否则通过decodeBack返回QImage
+        """
+        requestId = next(self._ids)
+        with self._cond:
+            self._pending = (requestId, data, isPyramid)
+            self._cond.notify()
+        return requestId
+
+    def DecodeQueued(self, data):
+        """提交不会被新请求丢弃的解码请求（比如复制到剪贴板），返回请求ID，结果通过decodeBack返回"""
+        requestId = next(self._ids)
+        with self._cond:
+            self._imageJobs.append((requestId, data))
+            self._cond.notify()
+        return requestId
+
+    def DecodeRegions(self, regions):
+        """
+        提交部分结果的解码请求，返回请求ID，结果通过regionsBack返回
+        regions: [(data, [(key, QRect)])]，每块数据解码后缩放到每个QRect的大小，key由调用者使用（比如层级）
+        """
+        requestId = next(self._ids)
+        with self._cond:
+            self._regionJobs.append((requestId, regions))
+            self._cond.notify()
+        return requestId
+
+    def Stop(self):
+        with self._cond:
+            self._isStop = True
+            self._pending = None
+            self._regionJobs.clear()
+            self._imageJobs.clear()
+            self._cond.notify()
+
+    @staticmethod
+    def ReadImage(data, levelSize=0):
+        """
+        用QImageReader解码，levelSize大于0并且图片超过levelSize时直接按第1层的大小解码，
+        完整解码超过config.ImageAllocationLimit时继续缩小，只按缩小后的大小分配内存
+
+        返回：
+            (QImage, 原图宽高, 层级)，无法读取宽高时完整解码，原图宽高为(0, 0)
+        """
+        buffer = QBuffer()
+        buffer.setData(data)
+        buffer.open(QIODevice.ReadOnly)
+        reader = QImageReader(buffer)
+        size = reader.size()
+        w, h = max(0, size.width()), max(0, size.height())
+        level = 0
+        if w and h:
+            level = max(1 if levelSize and max(w, h) > levelSize else 0, ImagePyramid.GetMinLevel((w, h)))
+            if level:
+                reader.setScaledSize(QSize(max(1, w >> level), max(1, h >> level)))
+        img = reader.read()
+        buffer.close()
+        return QtImageDecoder.ToPaintFormat(img), (w, h), level
+
+    @staticmethod
+    def DecodeImage(data):
+        """解码原图，超过config.ImageAllocationLimit时返回缩小的图片"""
+        return QtImageDecoder.ReadImage(data)[0]
+
+    @staticmethod
+    def ToPaintFormat(img):
+        if img.isNull():
+            return img
+        # 提前转换成QPixmap使用的格式，主线程转换时只需要复制
+        imgFormat = QImage.Format_ARGB32_Premultiplied if img.hasAlphaChannel() else QImage.Format_RGB32
+        if img.format() != imgFormat:
+            img = img.convertToFormat(imgFormat)
+        return img
+
+    def _DecodeRegions(self, regions):
+        results = []
+        for data, targets in regions:
+            img = self.DecodeImage(data)
+            if img.isNull():
+                continue
+            for key, rect in targets:
+                if rect.isEmpty():
+                    continue
+                scaled = img
+                if (img.width(), img.height()) != (rect.width(), rect.height()):
+                    scaled = img.scaled(rect.width(), rect.height(), Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+                results.append((key, rect, scaled))
+        return results
+
+    def _Run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._regionJobs and not self._imageJobs and not self._isStop:
+                    self._cond.wait()
+                if self._isStop:
+                    return
+                if self._pending:
+                    requestId, data, isPyramid = self._pending
+                    self._pending = None
+                    regions = None
+                elif self._regionJobs:
+                    requestId, regions = self._regionJobs.popleft()
+                else:
+                    requestId, data = self._imageJobs.popleft()
+                    isPyramid, regions = False, None
+            if regions is not None:
+                try:
+                    with Trace.Span("decode regions", requestId, regions=len(regions)):
+                        results = self._DecodeRegions(regions)
+                except Exception as es:
+                    Log.Error(es)
+                    results = []
+                del regions
+                self.regionsBack.emit(requestId, results)
+                continue
+            try:
+                with Trace.Span("decode", requestId, size=len(data)), Metrics.Timer("decode"):
+                    # 生成金字塔时大图直接按第1层的大小解码
+                    img, size, level = self.ReadImage(data, config.PreviewLevelSize if isPyramid else 0)
+            except Exception as es:
+                Log.Error(es)
+                img, size, level = QImage(), (0, 0), 0
+            if not isPyramid:
+                del data
+                self.decodeBack.emit(requestId, img)
+                continue
+            pyramid = None
+            if not img.isNull():
+                try:
+                    with Trace.Span("pyramid", requestId), Metrics.Timer("decode.pyramid"):
+                        pyramid = ImagePyramid.Build(data, img, 0, size if size[0] else None, level)
+                except Exception as es:
+                    Log.Error(es)
+            del data, img
+            self.pyramidBack.emit(requestId, pyramid)
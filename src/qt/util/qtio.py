@@ -0,0 +1,108 @@
+"""
+后台文件读写
+网络共享或者很大的输出文件会让界面卡住，这里把读写放到工作线程：
+1. 读取和写入各自一个线程，正在保存大文件时也可以立即打开新图片
+2. 写入先写临时文件再改名，中途失败或退出时不会留下不完整的文件
+3. 结果和写入进度通过信号回到主线程
+"""
+
+import itertools
+import os
+import threading
+import time
+from queue import Queue
+
+from PySide6.QtCore import Signal, QObject
+
+from conf import config
+from src.util import Log
+
+
+class QtFileWorker(QObject):
+    # 读取完成：请求ID，数据（失败时为b""）
+    readBack = Signal(int, object)
+    # 写入进度：请求ID，已写入字节数，总字节数
+    writeProgress = Signal(int, int, int)
+    # 写入完成：请求ID，是否成功，文件路径
+    writeBack = Signal(int, bool, str)
+
+    ChunkSize = 1024 * 1024
+
+    def __init__(self):
+        super(self.__class__, self).__init__()
+        self._ids = itertools.count(1)
+        self._readQueue = Queue()
+        self._writeQueue = Queue()
+        self._readThread = threading.Thread(target=self._RunRead, daemon=True)
+        self._writeThread = threading.Thread(target=self._RunWrite, daemon=True)
+        self._readThread.start()
+        self._writeThread.start()
+
+    def Read(self, path):
+        """提交读取请求，返回请求ID"""
+        requestId = next(self._ids)
+        self._readQueue.put((requestId, path))
+        return requestId
+
+    def Write(self, path, data):
+        """提交写入请求，返回请求ID；多个写入按提交顺序依次执行"""
+        requestId = next(self._ids)
+        self._writeQueue.put((requestId, path, data))
+        return requestId
+
+    def Stop(self):
+        self._readQueue.put(None)
+        self._writeQueue.put(None)
+
+    def _RunRead(self):
+        while True:
+            item = self._readQueue.get(True)
+            if item is None:
+                return
+            requestId, path = item
+            data = b""
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except Exception as es:
+                Log.Error(es)
+            self.readBack.emit(requestId, data)
+            del data
+
+    def _RunWrite(self):
+        while True:
+            item = self._writeQueue.get(True)
+            if item is None:
+                return
+            requestId, path, data = item
+            isOk = self.WriteFile(path, data,
+                                  lambda done, total: self.writeProgress.emit(requestId, done, total))
+            del data
+            self.writeBack.emit(requestId, isOk, path)
+
+    @classmethod
+    def WriteFile(cls, path, data, progressBack=None):
+        """分块写入临时文件再改名，progressBack(done, total)最多每隔config.ProgressInterval调用一次"""
+        tmp = path + ".tmp"
+        total = len(data)
+        view = memoryview(data)
+        tick = 0
+        try:
+            with open(tmp, "wb") as f:
+                for offset in range(0, total, cls.ChunkSize):
+                    f.write(view[offset:offset + cls.ChunkSize])
+                    now = time.time()
+                    if progressBack and now - tick >= config.ProgressInterval:
+                        tick = now
+                        progressBack(min(offset + cls.ChunkSize, total), total)
+            os.replace(tmp, path)
+        except Exception as es:
+            Log.Error(es)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return False
+        if progressBack:
+            progressBack(total, total)
+        return True
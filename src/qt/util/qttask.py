@@ -7,17 +7,28 @@
 """
 
 import hashlib
+import itertools
 import os
 import threading
 import time
 import weakref
-from queue import Queue  # 线程安全的队列，用于任务调度
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+from queue import Queue
 
 from PySide6.QtCore import Signal, QObject  # Qt的信号机制，用于跨线程通信
 
 from conf import config
 from src.util import Singleton, Log
+from src.util.cache import ConvertCache
+from src.util.engine import CreateEngines, InitWaifu2x
+from src.util.metrics import Metrics
+from src.util.registry import TaskRegistry, TaskState
+from src.util.scheduler import TaskScheduler, TaskPriority  # 带优先级和公平性的任务队列
+from src.util.stats import ConvertStats
+from src.util.tile import TiledImage
 from src.util.tool import CTime, ToolUtil
+from src.util.trace import Trace
 
 
 # ============================================================
@@ -29,11 +40,23 @@ class QtTaskQObject(QObject):
     # 定义信号：当图像转换完成时发射，参数为任务ID
     # 这个信号会自动被Qt的事件循环调度到主线程执行
     convertBack = Signal(int)
+    # 转换进度更新时发射，参数为任务ID，进度保存在引擎任务中，同一个任务同时最多只有一个信号在排队
+    progressBack = Signal(int)
+    # 后台初始化引擎完成时发射，参数为InitWaifu2x的结果，waifu2x不可用时为空字典
+    engineBack = Signal(dict)
 
     def __init__(self):
         super(self.__class__, self).__init__()
 
 
+class ConvertError(Exception):
+    """转换失败，通过Future返回结果时使用"""
+
+    def __init__(self, taskId):
+        Exception.__init__(self, "convert failed, taskId:{}".format(taskId))
+        self.taskId = taskId
+
+
 # ============================================================
 # QtDownloadTask: 任务数据对象
 # ============================================================
@@ -66,8 +89,28 @@ class QtDownloadTask(object):
         # 任务执行耗时（秒）
         self.tick = 0
 
+        # 取消标记：取消后即使结果已经返回也不会再回调
+        self.isCancel = False
+        # 任务状态，由TaskRegistry转换：Wait -> Done/Cancel，只能转换一次
+        self.state = TaskState.Wait
+        # AddConvertTask(isFuture=True)时返回给调用者的Future
+        self.future = None
+
+        # 进度回调（可选）
+        # 函数签名：progressCallBack(taskId, doneNum, totalNum, doneBytes, backParam)
+        self.progressBack = None
+        # 部分结果回调（可选），regions为新完成的区域[(x, y, data)]，坐标为结果图片中的坐标
+        # 函数签名：partialCallBack(taskId, regions, outSize, backParam)
+        self.partialBack = None
+        self.isProgressPending = False  # 已经有进度信号在排队
+        self.progressTick = 0           # 上次发射进度信号的时间
+        self.regionIndex = 0            # 已经回调过的部分结果数
+
         # 图像处理相关字段
-        self.imgData = b""          # 原始图像数据（二进制）
+        self.imgData = b""          # 原始图像数据（二进制），创建引擎任务后释放
+        self.priority = TaskPriority.Interactive  # 添加时的调度优先级
+        self.focus = None           # 优先转换的区域，还没有创建引擎任务时SetConvertFocus修改这里
+        self.jobId = 0              # 实际执行的引擎任务ID（相同请求会合并到同一个引擎任务）
         
         # 处理模型参数
         self.model = {
@@ -78,6 +121,151 @@ class QtDownloadTask(object):
         }
 
 
+# ============================================================
+# QtConvertJob: 引擎任务对象
+# ============================================================
+# 作用：相同图片+相同参数的多个转换请求合并成一个引擎任务
+# 引擎只执行一次，结果分发给所有订阅的任务（每个任务有自己的回调）
+class QtConvertJob(object):
+    def __init__(self, jobId, key, imgData, model):
+        self.jobId = jobId          # 提交给引擎的ID（等于第一个请求的taskId）
+        self.key = key              # 输入数据+参数的哈希，用于合并请求和转换缓存
+        self.imgData = imgData      # 原始图像数据，提交给引擎后释放
+        self.model = model          # 处理参数
+        self.taskIds = set()        # 等待该结果的任务ID集合
+        self.priority = TaskPriority.Batch  # 当前排队使用的优先级
+        self.cleanFlag = ""         # 排队使用的分组
+        self.worker = None          # 执行该任务的QtEngineWorker
+        self.engineName = ""        # 缓存key对应的引擎（添加时的主引擎），分块只在同名的引擎上执行
+        self.runNames = set()       # 实际执行的引擎，分块任务记在所属的大图任务上，只有主引擎的结果才缓存
+        self.isSubmit = False       # 是否已经提交给引擎
+        self.isCancel = False       # 所有订阅者都已取消，提交前会检查这个标记
+        self.queueTick = time.time()    # 进入调度队列的时间，重新排队时不变
+        self.submitTick = 0         # 提交给引擎的时间
+        # ===== 分块转换 =====
+        self.tiled = None           # 大图被拆分时为TiledImage，本任务不再提交给引擎
+        self.tileJobIds = set()     # 还没完成的分块任务
+        self.isFail = False         # 有分块无法完成
+        self.startTick = 0          # 开始分块的时间
+        self.parent = None          # 分块任务所属的大图任务
+        self.tile = None            # 分块任务负责的区域 (core, box)
+        # ===== 进度 =====
+        self.doneNum = 0            # 已完成的分块数
+        self.totalNum = 1           # 总分块数，不分块时为1
+        self.doneBytes = 0          # 已完成的分块的数据量
+        self.isPartial = False      # 有订阅者需要部分结果
+        self.regions = []           # 已完成的区域[(x, y, data)]，isPartial时才保存
+        self.focus = None           # 优先转换的区域 (x0, y0, x1, y1)，原图坐标
+
+
+# ============================================================
+# QtEngineWorker: 单个引擎的工作者
+# ============================================================
+# 作用：每个引擎实例（一块GPU、一个CPU线程池……）对应一个工作者
+# - jobs: 本设备的待提交队列，由调度线程按负载分配
+# - running: 已经提交给引擎、还没有返回结果的任务
+# - submitThread: 有空闲名额时从本设备队列取任务提交，本设备队列为空时从其他设备队列尾部窃取
+# - collectThread: 阻塞等待本引擎的结果
+# 所有工作者共用QtTask的_workCond，任意工作者状态变化都会唤醒调度线程和其他工作者
+class QtEngineWorker(object):
+    def __init__(self, owner, engine):
+        self.owner = owner
+        self.engine = engine
+        # 同时提交给引擎的任务数，由引擎的workers能力决定（VulkanEngine使用config.Waifu2xThread）
+        self.slots = max(1, int(engine.Capabilities().get("workers", 1)))
+        self.jobs = deque()
+        self.running = set()
+        self.doneNum = 0
+        self.isStop = False
+        self.submitThread = None
+        self.collectThread = None
+
+    @property
+    def name(self):
+        return self.engine.Name
+
+    def Load(self):
+        """负载：已提交和排队的任务数 / 名额数"""
+        return (len(self.running) + len(self.jobs)) / self.slots
+
+    def HasRoom(self):
+        """设备队列保持较短，大部分任务留在调度队列中，优先级才有意义"""
+        return len(self.running) + len(self.jobs) < self.slots * 2
+
+    def Start(self):
+        self.isStop = False
+        if not self.submitThread or not self.submitThread.is_alive():
+            self.submitThread = threading.Thread(target=self.RunSubmit, daemon=True)
+            self.submitThread.start()
+        if not self.collectThread or not self.collectThread.is_alive():
+            self.collectThread = threading.Thread(target=self.RunCollect, daemon=True)
+            self.collectThread.start()
+
+    def CanRun(self, jobId):
+        """分块任务只能在与大图任务的主引擎同名的引擎上执行，避免一张图中混合不同引擎的结果"""
+        job = self.owner.convertJobs.get(jobId)
+        return not job or not job.parent or self.name in self.owner.GetEngineNames(job.parent)
+
+    def _FindSteal(self):
+        """在排队最多的其他设备队列中，从尾部找一个可以窃取的任务"""
+        victims = sorted((w for w in self.owner.workers if w is not self and w.jobs), key=lambda w: -len(w.jobs))
+        for victim in victims:
+            for index in range(len(victim.jobs) - 1, -1, -1):
+                if self.CanRun(victim.jobs[index]):
+                    return victim, index
+        return None
+
+    def _Steal(self):
+        """从排队最多的其他设备队列尾部窃取一个任务"""
+        found = self._FindSteal()
+        if not found:
+            return None
+        victim, index = found
+        jobId = victim.jobs[index]
+        del victim.jobs[index]
+        return jobId
+
+    def RunSubmit(self):
+        cond = self.owner._workCond
+        while True:
+            with cond:
+                cond.wait_for(lambda: self.isStop or (len(self.running) < self.slots and
+                                                      (self.jobs or self._FindSteal())))
+                if self.isStop:
+                    return
+                jobId = self.jobs.popleft() if self.jobs else self._Steal()
+                if jobId is None:
+                    continue
+                # 先登记再提交，避免结果在登记前就返回
+                self.running.add(jobId)
+                cond.notify_all()
+            try:
+                sts = self.owner.SubmitJob(self, jobId)
+            except Exception as es:
+                Log.Error(es)
+                sts = -1
+            if sts <= 0:
+                with cond:
+                    self.running.discard(jobId)
+                    cond.notify_all()
+
+    def RunCollect(self):
+        cond = self.owner._workCond
+        while True:
+            # 阻塞等待引擎处理结果，返回None说明引擎已停止
+            info = self.engine.Collect()
+            if not info:
+                break
+            with cond:
+                self.running.discard(info[2])
+                self.doneNum += 1
+                cond.notify_all()
+            try:
+                self.owner.OnJobResult(info)
+            except Exception as es:
+                Log.Error(es)
+
+
 # ============================================================
 # QtTask: 多线程任务管理器（核心类）
 # ============================================================
@@ -88,8 +276,9 @@ class QtDownloadTask(object):
 #
 # 线程架构：
 # - 主线程（UI线程）：负责UI更新，接收信号回调
-# - convertThread（任务提交线程）：从队列取任务，提交给GPU处理
-# - convertThread2（结果接收线程）：从GPU获取处理结果，发射信号
+# - convertThread（调度线程）：从调度队列取任务，按负载分配给各个引擎的工作者
+# - 每个QtEngineWorker的提交线程和结果接收线程：提交任务给引擎，获取处理结果，发射信号
+# - engineThread：创建时初始化waifu2x并创建引擎，完成后退出
 class QtTask(Singleton, threading.Thread):
 
     def __init__(self):
@@ -98,9 +287,10 @@ class QtTask(Singleton, threading.Thread):
         threading.Thread.__init__(self)
         
         # ===== 任务队列 =====
-        # 线程安全的队列，用于存储待处理的任务ID
+        # 线程安全的调度队列，用于存储待处理的任务ID
+        # 按优先级出队，同一优先级内按cleanFlag分组轮询，低优先级任务会随等待时间老化
         # UI线程通过AddConvertTask添加任务，convertThread从这里取出
-        self._inQueue = Queue()
+        self._inQueue = TaskScheduler()
         
         # ===== 主窗口引用 =====
         # 使用弱引用避免循环引用导致的内存泄漏
@@ -111,32 +301,64 @@ class QtTask(Singleton, threading.Thread):
         self.taskObj = QtTaskQObject()
         # 当convertBack信号发射时，会在主线程调用HandlerConvertTask
         self.taskObj.convertBack.connect(self.HandlerConvertTask)
+        self.taskObj.progressBack.connect(self.HandlerProgressTask)
 
-        # ===== 后台线程1：任务提交线程 =====
-        # 职责：从队列取出任务，调用waifu2x_vulkan.add()提交给GPU
-        self.convertThread = threading.Thread(target=self.RunLoad)
-        self.convertThread.setDaemon(True)  # 守护线程，主程序退出时自动结束
-        self.convertThread.start()
+        # ===== 统计 =====
+        # 各个阶段最近一段时间的耗时和吞吐，通过GetStats查询
+        self.stats = ConvertStats()
 
-        # ===== 后台线程2：结果接收线程 =====
-        # 职责：调用waifu2x_vulkan.load()获取GPU处理结果，发射信号
-        self.convertThread2 = threading.Thread(target=self.RunLoad2)
-        self.convertThread2.setDaemon(True)
-        self.convertThread2.start()
+        # ===== 转换结果缓存 =====
+        # 相同图片+相同参数的转换结果保存在磁盘上，命中时不再经过引擎
+        self.cache = ConvertCache(config.CachePath, config.CacheSize * 1024 * 1024)
 
         # ===== 任务存储字典 =====
         self.downloadTask = {}   # 下载任务字典（预留，当前未使用）
-        self.convertLoad = {}    # 转换任务字典：{taskId: QtDownloadTask对象}
+        # 任务登记表，负责任务ID的原子分配和状态转换，可以在任意线程添加和取消任务
+        self.registry = TaskRegistry()
+        self.convertLoad = self.registry.tasks  # 等待中的转换任务：{taskId: QtDownloadTask对象}
         self.convertId = 1000000 # 转换任务起始ID（预留）
 
-        self.taskId = 0          # 任务ID计数器，每添加一个任务自增1
         self.tasks = {}          # 通用任务字典（预留）
 
+        # ===== 引擎任务管理 =====
+        # 相同的请求在排队或执行时会合并成一个引擎任务，避免重复转换
+        self.convertJobs = {}    # {jobId: QtConvertJob对象}
+        self.jobKeys = {}        # {key: jobId}，用于查找正在进行的相同请求
+        self._jobLock = threading.Lock()  # 保护convertJobs/jobKeys以及任务的订阅关系
+        # 分块任务的ID，从一个很大的数开始，不会和taskId冲突
+        self._tileIds = itertools.count(1 << 30)
+
         # ===== 任务分组管理 =====
         self.flagToIds = {}      # 预留字段
         # 清理标记到任务ID集合的映射：{cleanFlag: set(taskId1, taskId2, ...)}
-        # 用于批量取消同一组任务，例如：{"QtImg": {1001, 1002, 1003}}
-        self.convertFlag = {}
+        # 用于批量取消同一组任务，例如：{"QtImg": {1001, 1002, 1003}}，由registry维护
+        self.convertFlag = self.registry.groups
+
+        # ===== 转换引擎 =====
+        # waifu2x可用时使用VulkanEngine，否则退回到多核CPU引擎，也可以同时使用多个引擎
+        # 每个引擎由一个QtEngineWorker驱动，没有引擎时所有任务都会失败
+        # 导入waifu2x和探测GPU比较慢，在engineThread中完成，期间提交的任务留在调度队列中
+        self._workCond = threading.Condition()
+        self._workers = {}       # {engine: QtEngineWorker}，移除后再加入的引擎复用原来的工作者
+        self.workers = []        # 当前使用的工作者
+        self.isEngineLoad = True
+        self.engineInfo = {}     # InitWaifu2x的结果
+
+        # ===== 调度线程 =====
+        # 职责：从调度队列取出任务，分配给负载最低的引擎工作者
+        self.convertThread = threading.Thread(target=self.RunLoad)
+        self.convertThread.setDaemon(True)  # 守护线程，主程序退出时自动结束
+        self.convertThread.start()
+
+        # ===== 查询线程 =====
+        # 职责：计算缓存key、查询转换缓存，没有命中时创建引擎任务放入调度队列
+        self._lookupQueue = Queue()
+        self.lookupThread = threading.Thread(target=self.RunLookup, daemon=True)
+        self.lookupThread.start()
+
+        # ===== 引擎初始化线程 =====
+        self.engineThread = threading.Thread(target=self.RunLoadEngine, daemon=True)
+        self.engineThread.start()
 
     # ===== 属性访问器 =====
     # 提供对信号对象的便捷访问
@@ -145,6 +367,11 @@ class QtTask(Singleton, threading.Thread):
         """返回转换完成信号，外部可以连接自定义槽函数"""
         return self.taskObj.convertBack
 
+    @property
+    def engineBack(self):
+        """引擎初始化完成信号，连接之前已经完成的不会再发射，需要先检查isEngineLoad"""
+        return self.taskObj.engineBack
+
     @property
     def taskBack(self):
         """预留：通用任务完成信号"""
@@ -155,6 +382,101 @@ class QtTask(Singleton, threading.Thread):
         """预留：下载完成信号"""
         return self.taskObj.downloadBack
 
+    @property
+    def taskId(self):
+        """最近分配的任务ID"""
+        return self.registry.lastId
+
+    @property
+    def engine(self):
+        """主引擎，用于解析模型参数和计算缓存key"""
+        return self.workers[0].engine if self.workers else None
+
+    @property
+    def engines(self):
+        return [worker.engine for worker in self.workers]
+
+    def SetEngines(self, engines):
+        """
+        设置使用的引擎列表
+        被移除的引擎上还没提交的任务会放回调度队列，已经提交的任务仍然会正常返回
+        """
+        with self._workCond:
+            # 手动设置引擎后，后台初始化的结果不再使用
+            self.isEngineLoad = False
+            workers = []
+            for engine in engines:
+                worker = self._workers.get(engine)
+                if not worker:
+                    worker = self._workers[engine] = QtEngineWorker(self, engine)
+                workers.append(worker)
+            requeue = []
+            for worker in self.workers:
+                if worker not in workers:
+                    worker.isStop = True
+                    requeue.extend(worker.jobs)
+                    worker.jobs.clear()
+            self.workers = workers
+            for worker in workers:
+                worker.Start()
+            self._workCond.notify_all()
+        for jobId in requeue:
+            job = self.convertJobs.get(jobId)
+            if job:
+                Trace.Begin("queue", jobId)
+                self._inQueue.Put(jobId, job.priority, job.cleanFlag)
+
+    def RunLoadEngine(self):
+        """后台线程：初始化waifu2x并创建引擎，完成后通过engineBack通知主线程"""
+        info, engines = {}, []
+        try:
+            info = InitWaifu2x()
+            engines = CreateEngines()
+        except Exception as es:
+            Log.Error(es)
+        with self._workCond:
+            # 初始化期间已经通过SetEngines设置了引擎时丢弃创建的引擎，
+            # 不调用Stop，VulkanEngine.Stop会停止整个waifu2x模块
+            if self.isEngineLoad:
+                self.SetEngines(engines)
+            self.engineInfo = info
+            self._workCond.notify_all()
+        self.taskObj.engineBack.emit(info)
+
+    def WaitEngines(self, timeout=None):
+        """等待后台初始化引擎完成，返回是否完成，用于命令行等不需要界面的场景"""
+        with self._workCond:
+            return self._workCond.wait_for(lambda: not self.isEngineLoad, timeout)
+
+    def GetStats(self):
+        """
+        转换流水线的统计
+        queue/engine/callback/images: 各阶段最近一段时间的统计，见ConvertStats
+        queueDepth: 排队中的引擎任务数（调度队列+设备队列）
+        running: 已经提交给引擎的任务数
+        waiting: 等待结果的任务数
+        workers: 各个引擎的负载
+        """
+        info = self.stats.Get()
+        workers = self.GetWorkerInfo()
+        info["queueDepth"] = self._inQueue.Size() + sum(worker["queue"] for worker in workers)
+        info["running"] = sum(worker["running"] for worker in workers)
+        info["waiting"] = self.registry.Size()
+        info["workers"] = workers
+        return info
+
+    def GetWorkerInfo(self):
+        """各个引擎的负载情况"""
+        with self._workCond:
+            return [{"name": w.name, "slots": w.slots, "running": len(w.running), "queue": len(w.jobs),
+                     "done": w.doneNum} for w in self.workers]
+
+    def GetEngineNames(self, job):
+        """大图任务的分块可以使用的引擎，添加时的主引擎已经被移除时可以使用任意引擎"""
+        with self._workCond:
+            names = {w.name for w in self.workers}
+        return {job.engineName} if job.engineName in names else names
+
     @property
     def owner(self):
         """获取主窗口的强引用（从弱引用转换）"""
@@ -169,7 +491,9 @@ class QtTask(Singleton, threading.Thread):
     # ============================================================
     # 添加图像转换任务（主线程调用）
     # ============================================================
-    def AddConvertTask(self, imgData, model, completeCallBack, backParam=None, cleanFlag=""):
+    def AddConvertTask(self, imgData, model, completeCallBack=None, backParam=None, cleanFlag="",
+                       priority=TaskPriority.Interactive, progressCallBack=None, partialCallBack=None,
+                       isFuture=False, focus=None):
         """
         添加一个图像处理任务到队列
         
@@ -183,36 +507,157 @@ class QtTask(Singleton, threading.Thread):
             completeCallBack: 完成时的回调函数
                 函数签名：callback(data, taskId, backParam, tick)
             backParam: 传递给回调函数的额外参数（可选）
-            cleanFlag: 清理标记，用于批量取消任务（可选）
+            cleanFlag: 清理标记，用于批量取消任务（可选），同时也是公平调度的分组
+            priority: 调度优先级（TaskPriority.Interactive/Prefetch/Batch）
+            progressCallBack: 进度回调（可选），大图分块转换时每完成一些分块回调一次
+                函数签名：callback(taskId, doneNum, totalNum, doneBytes, backParam)
+            partialCallBack: 部分结果回调（可选），回调新完成的分块，可以用来逐步显示结果
+                函数签名：callback(taskId, regions, outSize, backParam)
+            isFuture: 返回concurrent.futures.Future而不是任务ID，可以和completeCallBack同时使用
+                成功时结果为转换后的数据，失败时抛出ConvertError，future.taskId为任务ID
+                future.cancel()会取消任务，任务被CancelConver等取消时future也会被取消
+            focus: 优先转换的区域（可选），原图坐标(x0, y0, x1, y1)，通常是当前可见的区域或者用户的选区
+                大图分块时与该区域相交的分块最先转换，其余分块按距离由近到远，可以用SetConvertFocus修改
         
         返回：
-            taskId: 任务的唯一标识符
+            taskId: 任务的唯一标识符，isFuture时返回Future
         """
         # 创建任务对象
         info = QtDownloadTask()
         info.downloadCompleteBack = completeCallBack  # 保存回调函数
+        info.progressBack = progressCallBack
+        info.partialBack = partialCallBack
         info.backParam = backParam                    # 保存额外参数
         
-        # 生成唯一的任务ID
-        self.taskId += 1
-        self.convertLoad[self.taskId] = info         # 加入任务字典
-        info.downloadId = self.taskId
+        # 生成唯一的任务ID（原子操作，可以在任意线程调用）
+        info.downloadId = self.registry.NewId()
+        Metrics.Count("convert.add")
         
-        # 保存任务数据
-        info.imgData = imgData
+        # 保存任务数据（原始数据保存在引擎任务中）
         info.model = model
+        info.cleanFlag = cleanFlag
         
-        # 如果指定了清理标记，加入分组管理
-        if cleanFlag:
-            info.cleanFlag = cleanFlag
-            # setdefault: 如果key不存在则创建空set，然后返回该set
-            taskIds = self.convertFlag.setdefault(cleanFlag, set())
-            taskIds.add(self.taskId)  # 将任务ID加入该组
-        
-        # 将任务ID放入队列，convertThread会取出处理
-        self._inQueue.put(self.taskId)
+        if isFuture:
+            info.future = Future()
+            info.future.taskId = info.downloadId
+
+        # 加入登记表，如果指定了清理标记，同时加入分组管理
+        self.registry.Add(info.downloadId, info, cleanFlag)
+        result = info.future or info.downloadId
+        if info.future:
+            # 可能在任意线程取消，CancelTask是线程安全的
+            info.future.add_done_callback(self._OnFutureDone)
         
-        return self.taskId
+        # 计算缓存key（整张图片的sha256）和读取缓存文件都比较慢，交给查询线程，不阻塞调用者（通常是UI线程）
+        # 缓存命中时结果由查询线程发射信号，回调总是在AddConvertTask返回之后才执行
+        info.imgData = imgData
+        info.priority = priority
+        info.focus = focus
+        self._lookupQueue.put(info)
+        return result
+
+    # ============================================================
+    # 查询缓存并创建引擎任务（在lookupThread中运行）
+    # ============================================================
+    def RunLookup(self):
+        """按添加的顺序逐个处理AddConvertTask添加的任务"""
+        while True:
+            info = self._lookupQueue.get(True)
+            try:
+                self.AddJob(info)
+            except Exception as es:
+                Log.Error(es)
+                # 没有创建引擎任务，直接通知失败，回调不会丢失
+                info.saveData = b""
+                self.convertBack.emit(info.downloadId)
+            finally:
+                info.imgData = b""
+
+    def AddJob(self, info):
+        """查询转换缓存，没有命中时合并到相同的引擎任务或者创建新的引擎任务"""
+        if info.isCancel:
+            return
+        imgData, model, priority, cleanFlag = info.imgData, info.model, info.priority, info.cleanFlag
+        engineName = self.engine.Name if self.engine else ""
+        key = ConvertCache.GetKey(imgData, model, engineName)
+
+        # 查询转换缓存，命中时直接返回结果，不经过引擎
+        if config.IsCacheConvert and self.engine:
+            data = self.cache.Get(key)
+            if data:
+                info.saveData = data
+                Trace.Instant("cache hit", info.downloadId)
+                Metrics.Count("convert.cacheHit")
+                Trace.Begin("signal", info.downloadId)
+                self.convertBack.emit(info.downloadId)
+                return
+
+        with self._jobLock:
+            # 在查询期间被取消了，_CancelTasks也持有_jobLock，不会留下没有订阅者的引擎任务
+            if self.convertLoad.get(info.downloadId) is not info:
+                return
+            # 相同的请求正在排队或执行，订阅它的结果即可，不再重复提交
+            jobId = self.jobKeys.get(key)
+            if jobId is not None:
+                job = self.convertJobs[jobId]
+                info.jobId = jobId
+                job.taskIds.add(info.downloadId)
+                Metrics.Count("convert.merge")
+                job.isPartial = job.isPartial or bool(info.partialBack)
+                job.focus = job.focus or info.focus
+                # 还在调度队列中时，按订阅者中最高的优先级重新排队
+                if priority < job.priority and self._inQueue.Remove(jobId):
+                    job.priority = priority
+                    job.cleanFlag = cleanFlag
+                    self._inQueue.Put(jobId, priority, cleanFlag)
+                return
+
+            # 创建新的引擎任务
+            job = QtConvertJob(info.downloadId, key, imgData, model)
+            job.engineName = engineName
+            job.taskIds.add(info.downloadId)
+            job.isPartial = bool(info.partialBack)
+            job.focus = info.focus
+            job.priority = priority
+            job.cleanFlag = cleanFlag
+            info.jobId = job.jobId
+            self.convertJobs[job.jobId] = job
+            self.jobKeys[key] = job.jobId
+
+        # 将引擎任务ID放入调度队列，convertThread会按优先级取出处理
+        Trace.Begin("queue", info.jobId)
+        self._inQueue.Put(info.jobId, priority, cleanFlag)
+
+    def SetConvertFocus(self, taskId, focus):
+        """
+        修改优先转换的区域，还在调度队列中的分块按新的区域重新排队，已经分配给引擎的分块不变
+
+        返回：
+            bool: 任务是否还在转换
+        """
+        with self._jobLock:
+            info = self.convertLoad.get(taskId)
+            if not info:
+                return False
+            job = self.convertJobs.get(info.jobId)
+            if not job:
+                # 还在查询缓存，创建引擎任务时使用新的区域
+                info.focus = focus
+                return True
+            job.focus = focus
+            if not job.tiled:
+                # 还没有拆分，拆分时使用新的区域
+                return True
+            tileJobs = [self.convertJobs[jobId] for jobId in job.tileJobIds if jobId in self.convertJobs]
+            tileJobs.sort(key=lambda tileJob: TiledImage.GetFocusKey(tileJob.tile[0], focus))
+            for tileJob in tileJobs:
+                if self._inQueue.Remove(tileJob.jobId):
+                    self._inQueue.Put(tileJob.jobId, tileJob.priority, tileJob.cleanFlag)
+        return True
+
+    def _OnFutureDone(self, future):
+        if future.cancelled():
+            self.CancelTask(future.taskId)
 
     # ============================================================
     # 处理转换完成的任务（主线程调用）
@@ -227,185 +672,413 @@ class QtTask(Singleton, threading.Thread):
         参数：
             taskId: 任务ID
         """
-        # 检查任务是否还存在（可能已被取消）
-        if taskId not in self.convertLoad:
+        # 转换到完成状态，同时从登记表和分组中删除
+        # 任务已被取消或者已经回调过时转换失败，保证回调最多只调用一次
+        Trace.End("signal", taskId)
+        info = self.registry.Transit(taskId, TaskState.Done)
+        if not info or info.isCancel:
             return
         
         # 计时器，用于性能分析
         t1 = CTime()
-        info = self.convertLoad[taskId]
         assert isinstance(info, QtDownloadTask)
 
-        # 从分组中移除该任务（如果有清理标记）
-        if info.cleanFlag:
-            taskIds = self.convertFlag.get(info.cleanFlag, set())
-            taskIds.discard(info.downloadId)  # discard不会抛异常，即使元素不存在
-        
         # 调用用户提供的回调函数，传递处理结果
         # 回调函数在主线程执行，可以安全更新UI
-        info.downloadCompleteBack(info.saveData, taskId, info.backParam, info.tick)
-        
-        # 再次从分组中移除（双重保障）
-        if info.cleanFlag:
-            taskIds = self.convertFlag.get(info.cleanFlag, set())
-            taskIds.discard(info.downloadId)
-        
-        # 从任务字典中删除，释放内存
-        del self.convertLoad[taskId]
+        tick = time.time()
+        with Trace.Span("HandlerConvertTask", taskId):
+            if info.downloadCompleteBack:
+                info.downloadCompleteBack(info.saveData, taskId, info.backParam, info.tick)
+            if info.future:
+                self._SetFuture(info)
+        self.stats.Add("callback", time.time() - tick)
         
         # 记录执行时间
-        t1.Refresh("RunLoad")
+        t1.Refresh("HandlerConvertTask")
+
+    @staticmethod
+    def _SetFuture(info):
+        info.future.tick = info.tick
+        try:
+            if info.saveData:
+                info.future.set_result(info.saveData)
+            else:
+                info.future.set_exception(ConvertError(info.downloadId))
+        except InvalidStateError:
+            # 同时在其他线程被取消了
+            pass
 
     # ============================================================
-    # 从底层引擎加载处理结果（后台线程调用）
+    # 转换进度（工作者线程发射，主线程处理）
     # ============================================================
-    def LoadData(self):
+    def EmitProgress(self, job, isForce=False):
         """
-        从waifu2x_vulkan引擎获取一个处理完成的结果
-        
-        返回：
-            None: 如果引擎不可用或没有结果
-            tuple: (data, convertId, taskId, tick)
-                - data: 处理后的图像数据（bytes）
-                - convertId: 转换ID（底层引擎的内部ID）
-                - taskId: 任务ID（与我们的taskId对应）
-                - tick: 处理耗时（秒）
-        
-        注意：waifu2x_vulkan.load(0)是阻塞调用，会等待直到有结果返回
+        通知订阅者进度更新，限制频率避免信号淹没Qt事件循环：
+        1. 同一个任务的上一个进度信号还没处理时不再发射，处理时读取的总是最新的进度
+        2. 两次发射的间隔至少为config.ProgressInterval，isForce时忽略间隔
+        被跳过的部分结果会在下一次回调时一起返回，最终结果总是由convertBack返回
         """
-        if not config.CanWaifu2x:
-            return None
-        from waifu2x_vulkan import waifu2x_vulkan
-        return waifu2x_vulkan.load(0)  # 阻塞等待GPU处理结果
+        now = time.time()
+        for taskId in list(job.taskIds):
+            info = self.convertLoad.get(taskId)
+            if not info or not (info.progressBack or info.partialBack) or info.isProgressPending:
+                continue
+            if not isForce and now - info.progressTick < config.ProgressInterval:
+                continue
+            info.isProgressPending = True
+            info.progressTick = now
+            self.taskObj.progressBack.emit(taskId)
+
+    def HandlerProgressTask(self, taskId):
+        """调用进度回调和部分结果回调（主线程）"""
+        info = self.convertLoad.get(taskId)
+        if not info or info.isCancel:
+            return
+        info.isProgressPending = False
+        job = self.convertJobs.get(info.jobId)
+        if not job or job.isCancel:
+            # 已经完成，结果由convertBack返回
+            return
+        try:
+            with Trace.Span("HandlerProgressTask", taskId):
+                if info.progressBack:
+                    info.progressBack(taskId, job.doneNum, job.totalNum, job.doneBytes, info.backParam)
+                regions = job.regions[info.regionIndex:]
+                if info.partialBack and regions and job.tiled:
+                    info.regionIndex += len(regions)
+                    info.partialBack(taskId, regions, job.tiled.outSize, info.backParam)
+        except Exception as es:
+            Log.Error(es)
 
     # ============================================================
-    # 后台线程1：任务提交线程（在convertThread中运行）
+    # 调度线程（在convertThread中运行）
     # ============================================================
     def RunLoad(self):
         """
-        持续从任务队列中取出任务，提交给GPU处理
+        持续从调度队列中取出任务，分配给负载最低的引擎工作者
         
         工作流程：
-        1. 从队列中阻塞式获取任务ID
-        2. 根据任务参数调用waifu2x_vulkan.add()提交给GPU
-        3. 如果提交失败，立即发射信号通知主线程
+        1. 等待任意一个工作者的设备队列有空位
+        2. 从调度队列中阻塞式获取引擎任务ID
+        3. 放入负载最低的工作者的设备队列，由工作者的提交线程提交给引擎
         
         注意：这是一个无限循环，在独立线程中运行
         """
         while True:  # 无限循环，持续监听队列
             try:
-                # 从队列中获取任务ID（阻塞式，队列为空时等待）
-                taskId = self._inQueue.get(True)
-                
-                # 检查任务是否还存在（可能已被取消）
-                if taskId not in self.convertLoad:
-                    continue
-                
-                # 获取任务对象
-                task = self.convertLoad.get(taskId)
-                
-                if config.CanWaifu2x:
-                    from waifu2x_vulkan import waifu2x_vulkan
-                    
-                    # 获取缩放参数
-                    scale = task.model.get("scale", 0)
-                    
-                    # 根据scale参数选择不同的调用方式
-                    if scale <= 0:
-                        # 使用固定宽高模式
-                        sts = waifu2x_vulkan.add(
-                            task.imgData,                    # 原始图像数据
-                            task.model.get('model', 0),      # 模型类型
-                            task.downloadId,                 # 任务ID
-                            task.model.get("width", 0),      # 目标宽度
-                            task.model.get("high", 0),       # 目标高度
-                            task.model.get("format", "jpg")  # 输出格式
-                        )
+                # 先等待有空位再取任务，这样任务在分配前一直留在调度队列中，
+                # 新来的高优先级任务仍然可以排到前面
+                # 引擎还在初始化时也在这里等待，不会因为没有引擎而失败
+                with self._workCond:
+                    self._workCond.wait_for(lambda: not self.isEngineLoad and
+                                            (not self.workers or any(w.HasRoom() for w in self.workers)))
+
+                # 从调度队列中获取引擎任务ID（阻塞式，队列为空时等待）
+                jobId = self._inQueue.Get(True)
+                Trace.End("queue", jobId)
+                Metrics.Gauge("convert.queueDepth", self._inQueue.Size())
+
+                with self._workCond:
+                    job = self.convertJobs.get(jobId)
+                    if not job:
+                        # 取出后马上被取消了
+                        continue
+                    self.stats.Add("queue", time.time() - job.queueTick)
+                    workers = [w for w in self.workers if w.CanRun(jobId)]
+                    if not workers:
+                        worker = None
                     else:
-                        # 使用缩放倍数模式
-                        sts = waifu2x_vulkan.add(
-                            task.imgData,                    # 原始图像数据
-                            task.model.get('model', 0),      # 模型类型
-                            task.downloadId,                 # 任务ID
-                            scale,                           # 缩放倍数
-                            task.model.get("format", "jpg")  # 输出格式
-                        )
-
-                    # Log.Warn("add convert info, taskId: {}, model:{}, sts:{}".format(str(task.taskId), task.model,
-                    #                                                                          str(sts)))
-                else:
-                    # waifu2x引擎不可用
-                    sts = -1
-                
-                # 如果提交失败（sts <= 0），立即发射信号通知主线程
-                if sts <= 0:
-                    self.convertBack.emit(taskId)
-                    continue
+                        worker = min(workers, key=lambda w: w.Load())
+                        worker.jobs.append(jobId)
+                        self._workCond.notify_all()
+
+                if not worker:
+                    # 没有可用的引擎，立即通知所有订阅的任务失败
+                    self.FinishJob(jobId, b"", 0)
                     
             except Exception as es:
                 # 捕获所有异常，避免线程崩溃
+                Log.Error(es)
                 continue
 
     # ============================================================
-    # 后台线程2：结果接收线程（在convertThread2中运行）
+    # 提交任务给引擎（工作者的提交线程调用）
     # ============================================================
-    def RunLoad2(self):
+    def SubmitJob(self, worker, jobId):
+        """
+        提交一个引擎任务
+
+        返回：
+            sts: 大于0表示提交成功；任务已取消时返回0，提交失败时返回负数
         """
-        持续从GPU获取处理完成的结果，并发射信号通知主线程
+        # 提交前检查取消标记（所有订阅者都取消后任务会被删除）
+        with self._jobLock:
+            job = self.convertJobs.get(jobId)
+            if not job or job.isSubmit or job.isCancel:
+                return 0
+            job.isSubmit = True
+            job.worker = worker
+            tiled = job.parent.tiled if job.parent else None
+
+        if job.parent:
+            if not tiled:
+                # 所属的大图任务已经结束
+                return 0
+            # 分块任务提交前才裁剪，避免所有分块的数据同时堆积在内存中
+            with Trace.Span("crop tile", jobId):
+                job.imgData = tiled.GetTileData(job.tile[1])
+                job.model = tiled.GetTileModel(job.tile[1])
+        else:
+            with Trace.Span("split", jobId):
+                isSplit = self.SplitJob(job)
+            if isSplit:
+                # 大图已拆分成分块任务，本任务不占用引擎
+                return 0
+
+        with self._jobLock:
+            (job.parent or job).runNames.add(worker.name)
+
+        # 提交给引擎，scale<=0时引擎使用固定宽高模式
+        job.submitTick = time.time()
+        Trace.Begin("engine", jobId)
+        with Trace.Span("engine.Submit", jobId, engine=worker.name):
+            sts = worker.engine.Submit(job.jobId, job.imgData, job.model)
+        # Log.Warn("add convert info, taskId: {}, model:{}, sts:{}".format(str(task.taskId), task.model,
+        #                                                                          str(sts)))
+
+        # 如果提交失败（sts <= 0），立即通知所有订阅的任务
+        if sts <= 0:
+            Trace.End("engine", jobId)
+            self.FinishJob(jobId, b"", 0)
+            return sts
+
+        # 提交成功后原始数据由引擎持有，这里释放引用，
+        # 避免大量排队任务的原始图片一直堆积在内存中
+        job.imgData = b""
+
+        # 提交过程中被取消了，补发一次取消
+        if job.isCancel:
+            worker.engine.Cancel([jobId])
+        return sts
+
+    # ============================================================
+    # 处理引擎返回的结果（工作者的结果接收线程调用）
+    # ============================================================
+    def OnJobResult(self, info):
+        """
+        保存引擎返回的结果，并发射信号通知主线程
         
-        工作流程：
-        1. 调用LoadData()阻塞等待GPU处理结果
-        2. 将结果保存到任务对象中
-        3. 发射convertBack信号，触发主线程的HandlerConvertTask
+        参数：
+            info: (data, convertId, jobId, tick)
+                - data: 处理后的图像数据（bytes）
+                - convertId: 转换ID（底层引擎的内部ID）
+                - jobId: 引擎任务ID
+                - tick: 处理耗时（秒）
+        """
+        # 计时器，用于性能分析
+        t1 = CTime()
         
-        注意：这是一个无限循环，在独立线程中运行
+        # 解包结果
+        data, convertId, jobId, tick = info
+        Trace.End("engine", jobId)
+        
+        # 记录处理成功的日志，在日志线程中才格式化
+        Log.Warn("convert suc, taskId: {}, dataLen:{}, sts:{} tick:{}", jobId, len(data) if data else 0,
+                 convertId, tick)
+        
+        # 把结果分发给所有订阅的任务
+        with Trace.Span("OnJobResult", jobId):
+            self.FinishJob(jobId, data, tick)
+        
+        # 记录执行时间
+        t1.Refresh("OnJobResult")
+
+    def FinishJob(self, jobId, data, tick):
         """
-        while True:  # 无限循环，持续监听GPU结果
-            # 阻塞式获取GPU处理结果
-            info = self.LoadData()
-            
-            # 如果返回None，说明引擎不可用或已停止
-            if not info:
-                break
-            
-            # 计时器，用于性能分析
-            t1 = CTime()
-            
-            # 解包结果
-            data, convertId, taskId, tick = info
-            
+        引擎任务完成，把结果保存到每个订阅任务中并发射信号
+        Qt会自动将信号调度到主线程的事件循环中，最终触发HandlerConvertTask
+
+        返回：
+            job: 引擎任务对象，已经被全部取消时返回None
+        """
+        with self._jobLock:
+            job = self.convertJobs.pop(jobId, None)
+            if not job:
+                return None
+            if self.jobKeys.get(job.key) == jobId:
+                del self.jobKeys[job.key]
+            taskIds = list(job.taskIds)
+
+        if job.submitTick:
+            self.stats.Add("engine", time.time() - job.submitTick)
+
+        if job.parent:
+            # 分块任务的结果交给所属的大图任务
+            self.FinishTile(job, data)
+            return job
+
+        for taskId in taskIds:
             # 检查任务是否还存在（可能已被取消）
-            if taskId not in self.convertLoad:
+            info = self.convertLoad.get(taskId)
+            if not info:
                 continue
-            
-            # 计算数据长度（用于日志）
-            if not data:
-                lenData = 0
-            else:
-                lenData = len(data)
-
-            # 记录处理成功的日志
-            Log.Warn("convert suc, taskId: {}, dataLen:{}, sts:{} tick:{}".format(
-                str(taskId), lenData, str(convertId), str(tick)
-            ))
-            
-            # 将处理结果保存到任务对象中
-            info = self.convertLoad[taskId]
-            assert isinstance(info, QtDownloadTask)
             info.saveData = data  # 处理后的图像数据
             info.tick = tick      # 处理耗时
-            
-            # 发射信号，任务ID号，通知主线程任务完成
-            # Qt会自动将这个信号调度到主线程的事件循环中
-            # 最终会触发HandlerConvertTask方法的执行
+            Trace.Begin("signal", taskId)
             self.convertBack.emit(taskId)
-            
-            # 记录执行时间
-            t1.Refresh("RunLoad")
+
+        # 保存到转换缓存，key按主引擎计算，其他引擎（比如辅助的CPU引擎）的结果不缓存，
+        # 否则之后的请求会把其他引擎的结果当作主引擎的结果命中
+        if data and config.IsCacheConvert and job.runNames == {job.engineName}:
+            self.cache.Put(job.key, data)
+
+        # 记录完成的图片和像素数
+        if data:
+            try:
+                w, h = ToolUtil.GetPictureSize(data)
+            except Exception:
+                w, h = 0, 0
+            self.stats.Add("images", w * h / 1000000)
+            Metrics.Count("convert.done")
+        else:
+            Metrics.Count("convert.fail")
+        return job
+
+    # ============================================================
+    # 大图分块（工作者线程调用）
+    # ============================================================
+    def SplitJob(self, job):
+        """
+        超过config.TileSize的图片拆分成互相重叠的分块任务，分块任务和普通任务一样排队，
+        可以在多个引擎上并行处理
+
+        返回：
+            bool: 是否已拆分
+        """
+        if not config.TileSize or not TiledImage.NeedTile(job.imgData, config.TileSize):
+            return False
+        try:
+            tiled = TiledImage(job.imgData, job.model, config.TileOverlap)
+        except Exception as es:
+            Log.Error(es)
+            return False
+
+        with self._jobLock:
+            if job.isCancel:
+                return True
+            job.tiled = tiled
+            job.imgData = b""
+            job.startTick = time.time()
+            tiles = tiled.Split(config.TileSize)
+            tiles.sort(key=lambda tile: TiledImage.GetFocusKey(tile[0], job.focus))
+            tileJobs = self._NewTileJobs(job, tiles)
+            job.totalNum = len(tileJobs)
+        Log.Info("split convert, taskId:{}, size:{}, tiles:{}", job.jobId, tiled.size, len(tileJobs))
+        for tileJob in tileJobs:
+            Trace.Begin("queue", tileJob.jobId, parent=job.jobId)
+            self._inQueue.Put(tileJob.jobId, tileJob.priority, tileJob.cleanFlag)
+        Metrics.Count("tile.split", len(tileJobs))
+        self.EmitProgress(job, True)
+        return True
+
+    def _NewTileJobs(self, parent, tiles):
+        """创建分块任务，调用时需要持有_jobLock"""
+        tileJobs = []
+        for core, box in tiles:
+            tileJob = QtConvertJob(next(self._tileIds), "", b"", parent.model)
+            tileJob.parent = parent
+            tileJob.tile = (core, box)
+            tileJob.priority = parent.priority
+            tileJob.cleanFlag = parent.cleanFlag
+            self.convertJobs[tileJob.jobId] = tileJob
+            parent.tileJobIds.add(tileJob.jobId)
+            tileJobs.append(tileJob)
+        return tileJobs
+
+    def FinishTile(self, tileJob, data):
+        """
+        一个分块完成
+        失败时（通常是内存不足）把该分块拆成一半大小的分块重试，小于config.TileMinSize后不再重试，
+        所有分块完成后拼接出完整的结果
+        """
+        parent = tileJob.parent
+        tiled = parent.tiled
+        core, box = tileJob.tile
+        if not tiled:
+            return
+        if data:
+            try:
+                with Trace.Span("add tile", tileJob.jobId):
+                    tiled.Add(core, box, data)
+            except Exception as es:
+                Log.Error(es)
+                data = b""
+
+        tileJobs = []
+        cancelJobs, queueJobIds = [], set()
+        with self._jobLock:
+            parent.tileJobIds.discard(tileJob.jobId)
+            if parent.isCancel or parent.isFail:
+                return
+            if data:
+                parent.doneNum += 1
+                parent.doneBytes += len(data)
+                if parent.isPartial:
+                    parent.regions.append(tiled.GetOutBox(box)[:2] + (data,))
+            else:
+                tileSize = max(core[2] - core[0], core[3] - core[1]) // 2
+                if tileSize >= config.TileMinSize:
+                    tileJobs = self._NewTileJobs(parent, tiled.Split(tileSize, core))
+                    Metrics.Count("tile.retry")
+                    parent.totalNum += len(tileJobs) - 1
+                else:
+                    # 无法再拆分，整个任务失败，剩余的分块没有必要再转换
+                    parent.isFail = True
+                    for jobId in list(parent.tileJobIds):
+                        self._DropJob(self.convertJobs.get(jobId), cancelJobs, queueJobIds)
+                    parent.tileJobIds.clear()
+            isDone = not parent.tileJobIds
+
+        if tileJobs:
+            Log.Warn("convert tile fail, retry, taskId:{}, tile:{}, tiles:{}", parent.jobId, core, len(tileJobs))
+            for job in tileJobs:
+                Trace.Begin("queue", job.jobId, parent=parent.jobId)
+                self._inQueue.Put(job.jobId, job.priority, job.cleanFlag)
+            return
+        self._CancelJobs(cancelJobs, queueJobIds)
+        if not isDone:
+            if data:
+                self.EmitProgress(parent)
+            return
+
+        data = b""
+        if not parent.isFail:
+            try:
+                with Trace.Span("merge", parent.jobId):
+                    data = tiled.Merge()
+            except Exception as es:
+                Log.Error(es)
+        parent.tiled = None
+        self.FinishJob(parent.jobId, data, time.time() - parent.startTick)
 
     # ============================================================
-    # 批量取消任务（主线程调用）
+    # 取消任务（主线程调用）
     # ============================================================
+    def CancelTask(self, taskId):
+        """
+        取消单个任务
+
+        返回：
+            bool: 任务存在并被取消时返回True
+        """
+        return self._CancelTasks([taskId]) > 0
+
+    def CancelAll(self):
+        """取消所有任务，包括没有清理标记的任务"""
+        taskIds = self.registry.Ids()
+        self._CancelTasks(taskIds)
+        Log.Info("cancel all convert, num:{}", len(taskIds))
+
     def CancelConver(self, cleanFlag):
         """
         根据清理标记批量取消一组任务
@@ -418,29 +1091,101 @@ class QtTask(Singleton, threading.Thread):
             cleanFlag: 清理标记，例如"QtImg"
         
         工作流程：
-        1. 从convertFlag字典中获取该标记对应的所有任务ID
-        2. 从convertLoad字典中删除这些任务
-        3. 通知底层引擎取消GPU上的处理
+        1. 从convertFlag字典中取出该标记对应的所有任务ID
+        2. 对每个任务调用_CancelTasks，每个任务的代价都是O(1)
         """
-        # 获取该标记对应的所有任务ID
-        taskIds = self.convertFlag.get(cleanFlag, set())
+        # 获取并移除该标记对应的所有任务ID
+        taskIds = self.registry.PopGroup(cleanFlag)
         
         # 如果没有任务，直接返回
         if not taskIds:
             return
         
-        # 遍历所有任务ID，从任务字典中删除
-        for taskId in taskIds:
-            if taskId in self.convertLoad:
-                del self.convertLoad[taskId]  # 删除任务，释放内存
+        self._CancelTasks(taskIds)
         
         # 记录日志
-        Log.Info("cancel convert taskId, {}".format(taskIds))
-        
-        # 从分组字典中移除该标记
-        self.convertFlag.pop(cleanFlag)
-        
-        # 通知底层引擎取消GPU上的处理
-        if config.CanWaifu2x:
-            from waifu2x_vulkan import waifu2x_vulkan
-            waifu2x_vulkan.remove(list(taskIds))  # 取消GPU上的任务
+        Log.Info("cancel convert taskId, {}", taskIds)
+
+    def _CancelTasks(self, taskIds):
+        """
+        取消一组任务
+        1. 把任务转换到取消状态并从登记表中删除，结果返回后不会再回调
+        2. 退订对应的引擎任务，只有引擎任务的所有订阅者都取消了，才真正取消引擎任务
+        3. 还在排队的引擎任务直接从调度队列或设备队列中删除，不会再提交给引擎
+        4. 已经提交的引擎任务通知引擎取消
+
+        返回：
+            int: 实际取消的任务数
+        """
+        cancelNum = 0
+        cancelJobs = []
+        queueJobIds = set()
+        futures = []
+        with self._jobLock:
+            for taskId in taskIds:
+                # 已经完成或者已经取消的任务转换失败
+                info = self.registry.Transit(taskId, TaskState.Cancel)
+                if not info:
+                    continue
+                info.isCancel = True
+                cancelNum += 1
+                if info.future:
+                    futures.append(info.future)
+                job = self.convertJobs.get(info.jobId)
+                if not job:
+                    continue
+                job.taskIds.discard(taskId)
+                if job.taskIds:
+                    continue
+                self._DropJob(job, cancelJobs, queueJobIds)
+
+        self._CancelJobs(cancelJobs, queueJobIds)
+        # 在锁外取消Future，Future的回调中可能再次调用CancelTask
+        for future in futures:
+            future.cancel()
+        Metrics.Count("convert.cancel", cancelNum)
+        return cancelNum
+
+    def _DropJob(self, job, cancelJobs, queueJobIds):
+        """
+        删除一个引擎任务，调用时需要持有_jobLock
+        已经提交给引擎的放入cancelJobs，已经分到设备队列的放入queueJobIds，由_CancelJobs处理
+        """
+        if not job:
+            return
+        job.isCancel = True
+        job.imgData = b""
+        self.convertJobs.pop(job.jobId, None)
+        if self.jobKeys.get(job.key) == job.jobId:
+            del self.jobKeys[job.key]
+        if job.tiled:
+            # 拆分过的大图，取消它的所有分块
+            for jobId in list(job.tileJobIds):
+                self._DropJob(self.convertJobs.get(jobId), cancelJobs, queueJobIds)
+            job.tileJobIds.clear()
+            job.tiled = None
+        elif job.isSubmit:
+            cancelJobs.append(job)
+        elif not self._inQueue.Remove(job.jobId):
+            # 不在调度队列中，说明已经分到了某个设备队列
+            queueJobIds.add(job.jobId)
+
+    def _CancelJobs(self, cancelJobs, queueJobIds):
+        """从设备队列中删除还没提交的任务，通知引擎取消已经提交的任务"""
+        # 设备队列很短，直接过滤
+        if queueJobIds:
+            with self._workCond:
+                for worker in self.workers:
+                    if any(jobId in queueJobIds for jobId in worker.jobs):
+                        worker.jobs = deque(jobId for jobId in worker.jobs if jobId not in queueJobIds)
+                self._workCond.notify_all()
+
+        # 通知底层引擎取消已经提交的任务，并释放工作者的名额
+        workerIds = {}
+        for job in cancelJobs:
+            workerIds.setdefault(job.worker, []).append(job.jobId)
+        for worker, jobIds in workerIds.items():
+            worker.engine.Cancel(jobIds)
+            with self._workCond:
+                worker.running.difference_update(jobIds)
+                self._workCond.notify_all()
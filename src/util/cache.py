@@ -0,0 +1,156 @@
+"""
+转换结果缓存
+按 输入图片内容 + 规范化后的转换参数 计算哈希，把转换结果保存在磁盘上：
+1. 总大小有上限，超出时按最近最少使用（LRU）淘汰
+2. 索引保存在 index.json 中，重启后仍然有效；启动时会与磁盘上的文件核对
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from src.util import Log
+
+
+class ConvertCache(object):
+    IndexName = "index.json"
+    SaveInterval = 5        # 索引最多每隔多少秒写一次磁盘
+
+    def __init__(self, path, maxSize):
+        self.path = path
+        self.maxSize = maxSize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # {key: size}，顺序即LRU顺序，最久未使用的在前
+        self._totalSize = 0
+        self._isDirty = False
+        self._saveTime = 0
+        self._Load()
+        atexit.register(self.Flush)
+
+    @staticmethod
+    def GetKey(imgData, model, engineName=""):
+        """输入数据的sha256 + 规范化的参数，不同引擎的结果不同，引擎名也参与计算"""
+        norm = {
+            "engine": engineName,
+            "model": model.get("model", 0),
+            "format": "jpg" if model.get("format", "jpg").lower() in ("jpg", "jpeg") else model.get("format").lower(),
+            "tta": bool(model.get("tta", False)),
+        }
+        scale = model.get("scale", 0)
+        if scale > 0:
+            norm["scale"] = round(float(scale), 2)
+        else:
+            norm["width"] = int(model.get("width", 0))
+            norm["high"] = int(model.get("high", 0))
+        h = hashlib.sha256(imgData)
+        h.update(json.dumps(norm, sort_keys=True).encode("utf-8"))
+        return h.hexdigest()
+
+    def _GetFile(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def Has(self, key):
+        return key in self._entries
+
+    def Get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            self._isDirty = True
+        try:
+            with open(self._GetFile(key), "rb") as f:
+                return f.read()
+        except OSError:
+            # 文件被外部删除，同步删除索引
+            with self._lock:
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._totalSize -= size
+            return None
+
+    def Put(self, key, data):
+        if not data or len(data) > self.maxSize:
+            return
+        fileName = self._GetFile(key)
+        try:
+            os.makedirs(os.path.dirname(fileName), exist_ok=True)
+            tmp = fileName + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, fileName)
+        except OSError as es:
+            Log.Error(es)
+            return
+
+        removeKeys = []
+        with self._lock:
+            oldSize = self._entries.pop(key, None)
+            if oldSize is not None:
+                self._totalSize -= oldSize
+            self._entries[key] = len(data)
+            self._totalSize += len(data)
+            while self._totalSize > self.maxSize:
+                oldKey, size = self._entries.popitem(last=False)
+                self._totalSize -= size
+                removeKeys.append(oldKey)
+            self._isDirty = True
+
+        for oldKey in removeKeys:
+            try:
+                os.remove(self._GetFile(oldKey))
+            except OSError:
+                pass
+        if time.time() - self._saveTime >= self.SaveInterval:
+            self.Flush()
+
+    def Size(self):
+        return self._totalSize
+
+    def Flush(self):
+        """把索引写入磁盘"""
+        with self._lock:
+            if not self._isDirty:
+                return
+            entries = list(self._entries.items())
+            self._isDirty = False
+            self._saveTime = time.time()
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            fileName = os.path.join(self.path, self.IndexName)
+            with open(fileName + ".tmp", "w") as f:
+                json.dump(entries, f)
+            os.replace(fileName + ".tmp", fileName)
+        except OSError as es:
+            Log.Error(es)
+
+    def _Load(self):
+        if not os.path.isdir(self.path):
+            return
+        entries = []
+        try:
+            with open(os.path.join(self.path, self.IndexName), "r") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        # 以磁盘上实际存在的文件为准：索引中丢失的文件删除，索引中没有的文件补上
+        files = {}
+        for sub in os.scandir(self.path):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    files[entry.name] = entry.stat().st_size
+        for key, _ in entries:
+            size = files.pop(key, None)
+            if size is not None:
+                self._entries[key] = size
+        for key, size in files.items():
+            self._entries[key] = size
+        self._totalSize = sum(self._entries.values())
+        self._isDirty = bool(files) or len(self._entries) != len(entries)
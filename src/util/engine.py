@@ -0,0 +1,296 @@
+"""
+图像转换引擎模块
+QtTask 不直接调用 waifu2x_vulkan，而是通过统一的引擎接口工作：
+1. VulkanEngine: 封装 waifu2x_vulkan（GPU / ncnn）
+2. CpuEngine: 基于 Pillow 的多核 CPU 放大，作为没有 GPU 时的后备方案
+waifu2x的导入和GPU探测比较慢，由InitWaifu2x完成，QtTask在后台线程中调用，启动时界面不需要等待
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from queue import Queue
+
+from conf import config
+from src.util import Log
+
+
+class BaseEngine(object):
+    """
+    引擎接口，所有引擎实现以下方法：
+        Submit(taskId, imgData, model) -> sts: 提交任务，sts > 0 表示提交成功
+        Collect() -> (data, sts, taskId, tick): 阻塞等待一个完成的结果，返回None表示引擎已停止
+        Cancel(taskIds): 取消尚未完成的任务，被取消的任务不会再从Collect返回
+        Capabilities() -> dict: 引擎能力描述
+    """
+    Name = "base"
+
+    def Submit(self, taskId, imgData, model):
+        raise NotImplementedError
+
+    def Collect(self):
+        raise NotImplementedError
+
+    def Cancel(self, taskIds):
+        return
+
+    def Capabilities(self):
+        return {"name": self.Name}
+
+    def GetModel(self, modelName):
+        """根据模型名（如 MODEL_CUNET_NOISE3）返回引擎使用的模型参数"""
+        return modelName
+
+    def Stop(self):
+        return
+
+
+class VulkanEngine(BaseEngine):
+    Name = "vulkan"
+
+    def __init__(self):
+        from waifu2x_vulkan import waifu2x_vulkan
+        self._module = waifu2x_vulkan
+
+    def Submit(self, taskId, imgData, model):
+        scale = model.get("scale", 0)
+        if scale <= 0:
+            # 固定宽高模式
+            return self._module.add(imgData, model.get('model', 0), taskId,
+                                    model.get("width", 0), model.get("high", 0), model.get("format", "jpg"))
+        # 缩放倍数模式
+        return self._module.add(imgData, model.get('model', 0), taskId, scale, model.get("format", "jpg"))
+
+    def Collect(self):
+        # 阻塞等待GPU处理结果
+        return self._module.load(0)
+
+    def Cancel(self, taskIds):
+        self._module.remove(list(taskIds))
+
+    def Capabilities(self):
+        return {
+            "name": self.Name,
+            "device": config.EncodeGpu,
+            "workers": config.Waifu2xThread,
+            "models": True,
+            "tta": True,
+        }
+
+    def GetModel(self, modelName):
+        return getattr(self._module, modelName)
+
+    def Stop(self):
+        self._module.stop()
+
+
+def CpuUpscale(imgData, model):
+    """
+    使用 Pillow 在CPU上放大一张图片
+    支持与 waifu2x_vulkan 相同的 scale / width+high / format 参数，模型和降噪参数会被忽略
+    """
+    from PIL import Image, ImageFilter
+    img = Image.open(BytesIO(imgData))
+    img.load()
+    w, h = img.size
+
+    scale = model.get("scale", 0)
+    if scale > 0:
+        toW, toH = max(1, round(w * scale)), max(1, round(h * scale))
+    else:
+        toW, toH = model.get("width", 0) or w, model.get("high", 0) or h
+
+    picFormat = model.get("format", "jpg")
+    if picFormat == "png":
+        if img.mode not in ("RGB", "RGBA", "L"):
+            img = img.convert("RGBA")
+    elif img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    if (toW, toH) != (w, h):
+        img = img.resize((toW, toH), Image.LANCZOS)
+        if toW > w or toH > h:
+            # 放大后做一次轻微锐化，弥补插值带来的模糊
+            img = img.filter(ImageFilter.UnsharpMask(radius=2, percent=60, threshold=3))
+
+    out = BytesIO()
+    if picFormat == "png":
+        img.save(out, "PNG")
+    else:
+        img.save(out, "JPEG", quality=95)
+    return out.getvalue()
+
+
+class CpuEngine(BaseEngine):
+    """
+    多核CPU引擎
+    Pillow 的解码、缩放和编码都会释放GIL，所以用线程池即可占满所有核心，
+    同时避免了在进程间拷贝图片数据
+    """
+    Name = "cpu"
+
+    def __init__(self, workers=0):
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="CpuEngine")
+        self._outQueue = Queue()
+        self._lock = threading.Lock()
+        self._futures = {}      # {taskId: Future}，取消时从这里移除
+        self._isStop = False
+
+    def Submit(self, taskId, imgData, model):
+        if self._isStop:
+            return -1
+        with self._lock:
+            # 先登记再提交，避免任务在登记前就完成
+            self._futures[taskId] = None
+        future = self._pool.submit(self._Convert, taskId, imgData, model)
+        with self._lock:
+            if taskId in self._futures:
+                self._futures[taskId] = future
+        return 1
+
+    def _Convert(self, taskId, imgData, model):
+        tick = time.time()
+        try:
+            data = CpuUpscale(imgData, model)
+        except Exception as es:
+            Log.Error(es)
+            data = b""
+        tick = time.time() - tick
+        with self._lock:
+            if taskId not in self._futures:
+                # 已被取消
+                return
+            del self._futures[taskId]
+        self._outQueue.put((data, 1 if data else 0, taskId, tick))
+
+    def Collect(self):
+        return self._outQueue.get(True)
+
+    def Cancel(self, taskIds):
+        with self._lock:
+            for taskId in taskIds:
+                future = self._futures.pop(taskId, None)
+                if future:
+                    future.cancel()
+
+    def Capabilities(self):
+        return {
+            "name": self.Name,
+            "device": "CPU",
+            "workers": self.workers,
+            "models": False,
+            "tta": False,
+        }
+
+    def Stop(self):
+        self._isStop = True
+        # shutdown的cancel_futures参数需要Python3.9，这里自己取消还没开始的任务
+        with self._lock:
+            futures = [future for future in self._futures.values() if future]
+            self._futures.clear()
+        for future in futures:
+            future.cancel()
+        self._pool.shutdown(wait=False)
+        self._outQueue.put(None)
+
+
+_waifu2xInfo = None        # InitWaifu2x的结果，一个进程只初始化一次
+_waifu2xLock = threading.Lock()
+
+
+def SelectDevice(gpuInfos, cpuNum):
+    """按保存的设置（config.SelectEncodeGpu/UseCpuNum）选择使用的GPU，保存的GPU不存在时使用第一个"""
+    config.EncodeGpu = config.SelectEncodeGpu
+    if not gpuInfos:
+        config.EncodeGpu = "CPU"
+        config.Encode = -1
+        return
+    if not config.EncodeGpu or (config.EncodeGpu != "CPU" and config.EncodeGpu not in gpuInfos):
+        config.EncodeGpu = gpuInfos[0]
+    config.Encode = -1 if config.EncodeGpu == "CPU" else gpuInfos.index(config.EncodeGpu)
+    if config.UseCpuNum > cpuNum:
+        config.UseCpuNum = cpuNum
+
+
+def InitWaifu2x(encode=None):
+    """
+    导入并初始化waifu2x，导入和探测GPU比较慢，可以在后台线程调用
+    一个进程只初始化一次，之后的调用直接返回第一次的结果
+    encode: 使用的GPU序号，-1表示CPU，None表示按保存的设置选择
+
+    返回：
+        {"stat", "gpuInfo", "cpuNum", "version"}，waifu2x不可用时返回{}
+    """
+    global _waifu2xInfo
+    with _waifu2xLock:
+        if _waifu2xInfo is not None:
+            return _waifu2xInfo
+        _waifu2xInfo = {}
+        if not config.CanWaifu2x:
+            # 已经禁用了waifu2x，比如测试时
+            return _waifu2xInfo
+        try:
+            from waifu2x_vulkan import waifu2x_vulkan
+        except Exception as es:
+            config.CanWaifu2x = False
+            if hasattr(es, "msg"):
+                config.ErrorMsg = es.msg
+            return _waifu2xInfo
+        config.CanWaifu2x = True
+        stat = waifu2x_vulkan.init()
+        waifu2x_vulkan.setDebug(True)
+        gpuInfo = waifu2x_vulkan.getGpuInfo()
+        cpuNum = waifu2x_vulkan.getCpuCoreNum()
+        if encode is None:
+            SelectDevice(gpuInfo, cpuNum)
+        else:
+            config.Encode = encode
+        waifu2x_vulkan.initSet(config.Encode, config.UseCpuNum)
+        _waifu2xInfo = {"stat": stat, "gpuInfo": gpuInfo, "cpuNum": cpuNum, "version": waifu2x_vulkan.getVersion()}
+        Log.Info("waifu2x init: {} encode: {} version: {}", stat, config.Encode, _waifu2xInfo["version"])
+        return _waifu2xInfo
+
+
+def StopWaifu2x():
+    """退出时停止waifu2x，还在初始化时等待初始化完成"""
+    with _waifu2xLock:
+        if not _waifu2xInfo:
+            return
+        from waifu2x_vulkan import waifu2x_vulkan
+        waifu2x_vulkan.stop()
+
+
+def CreateEngine():
+    """根据当前环境创建引擎，waifu2x不可用时退回到CPU引擎，两者都不可用时返回None"""
+    if config.CanWaifu2x:
+        try:
+            return VulkanEngine()
+        except ImportError as es:
+            Log.Error(es)
+    try:
+        import PIL
+    except ImportError:
+        return None
+    return CpuEngine(config.CpuEngineWorkers)
+
+
+def CreateEngines():
+    """
+    创建所有要使用的引擎，第一个为主引擎
+    waifu2x模块在一个进程内只能初始化一块GPU，所以最多只有一个VulkanEngine，
+    开启IsCpuEngineAssist时额外加入CPU引擎分担任务
+    """
+    engine = CreateEngine()
+    if not engine:
+        return []
+    engines = [engine]
+    if config.IsCpuEngineAssist and not isinstance(engine, CpuEngine):
+        try:
+            import PIL
+            engines.append(CpuEngine(config.CpuEngineWorkers))
+        except ImportError as es:
+            Log.Error(es)
+    return engines
@@ -0,0 +1,220 @@
+"""
+图片文件头解析
+只读取文件头就得到格式、宽高、位深、是否有透明通道和内嵌的文本，不解码图片：
+1. 支持 PNG、JPEG、WebP、GIF、BMP，直接在memoryview上按偏移解析，不复制数据
+2. 读取文件时只读开头的一小段，JPEG的EXIF等段落较大时才逐步多读
+3. 无法识别的数据返回None，调用者可以退回到PIL
+"""
+
+import struct
+
+ProbeReadSize = 16 * 1024   # 读取文件时第一次读取的字节数
+
+
+class ImageInfo(object):
+    def __init__(self, picFormat, width=0, height=0, bitDepth=8, hasAlpha=False):
+        self.format = picFormat     # png/jpg/webp/gif/bmp
+        self.width = width
+        self.height = height
+        self.bitDepth = bitDepth    # 每个通道的位数，调色板图片为索引的位数
+        self.hasAlpha = hasAlpha
+        self.text = {}              # PNG的tEXt，{关键字: 文本}
+        self.comments = []          # JPEG的COM段、GIF的注释扩展
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def __repr__(self):
+        return "ImageInfo({}, {}x{}, bitDepth:{}, alpha:{})".format(
+            self.format, self.width, self.height, self.bitDepth, self.hasAlpha)
+
+
+class _NeedMore(Exception):
+    """数据不够，offset为需要读取到的位置"""
+
+    def __init__(self, offset):
+        Exception.__init__(self, offset)
+        self.offset = offset
+
+
+def _Check(buf, end):
+    if end > len(buf):
+        raise _NeedMore(end)
+
+
+def _ProbePng(buf):
+    # 签名(8) + IHDR长度(4) + "IHDR"(4) + 宽(4) + 高(4) + 位深(1) + 颜色类型(1)
+    _Check(buf, 26)
+    if bytes(buf[12:16]) != b"IHDR":
+        return None
+    width, height, bitDepth, colorType = struct.unpack_from(">IIBB", buf, 16)
+    info = ImageInfo("png", width, height, bitDepth, colorType in (4, 6))
+
+    # 遍历IDAT之前的块，读取tEXt和tRNS，数据不够时停止，文本不是必需的
+    offset = 33
+    while offset + 8 <= len(buf):
+        length, = struct.unpack_from(">I", buf, offset)
+        chunkType = bytes(buf[offset + 4:offset + 8])
+        if chunkType in (b"IDAT", b"IEND"):
+            break
+        if chunkType == b"tRNS":
+            info.hasAlpha = True
+        elif chunkType == b"tEXt":
+            if offset + 8 + length > len(buf):
+                break
+            key, _, value = bytes(buf[offset + 8:offset + 8 + length]).partition(b"\0")
+            info.text[key.decode("latin-1")] = value.decode("latin-1")
+        offset += 12 + length
+    return info
+
+
+def _ProbeJpeg(buf):
+    info = None
+    comments = []
+    offset = 2
+    while True:
+        _Check(buf, offset + 4)
+        if buf[offset] != 0xFF:
+            return None
+        marker = buf[offset + 1]
+        if marker == 0xFF:
+            # 填充字节
+            offset += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            # 图片结束或者扫描开始，都没有找到SOF
+            return None
+        length, = struct.unpack_from(">H", buf, offset + 2)
+        if marker == 0xFE:
+            _Check(buf, offset + 2 + length)
+            comments.append(bytes(buf[offset + 4:offset + 2 + length]).decode("utf-8", "replace"))
+        elif 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            # SOFn: 精度(1) + 高(2) + 宽(2) + 分量数(1)
+            _Check(buf, offset + 10)
+            bitDepth, height, width = struct.unpack_from(">BHH", buf, offset + 4)
+            info = ImageInfo("jpg", width, height, bitDepth, False)
+            info.comments = comments
+            return info
+        offset += 2 + length
+
+
+def _ProbeWebp(buf):
+    _Check(buf, 30)
+    chunkType = bytes(buf[12:16])
+    if chunkType == b"VP8 ":
+        # 帧标签(3) + 起始码(3) + 宽(2) + 高(2)，高2位是缩放
+        if bytes(buf[23:26]) != b"\x9d\x01\x2a":
+            return None
+        width, height = struct.unpack_from("<HH", buf, 26)
+        return ImageInfo("webp", width & 0x3FFF, height & 0x3FFF, 8, False)
+    if chunkType == b"VP8L":
+        # 签名0x2f + 14位宽-1 + 14位高-1 + 1位alpha
+        if buf[20] != 0x2F:
+            return None
+        bits, = struct.unpack_from("<I", buf, 21)
+        return ImageInfo("webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1, 8, bool(bits >> 28 & 1))
+    if chunkType == b"VP8X":
+        # 标志(1) + 保留(3) + 24位宽-1 + 24位高-1
+        flags = buf[20]
+        width = int.from_bytes(buf[24:27], "little") + 1
+        height = int.from_bytes(buf[27:30], "little") + 1
+        return ImageInfo("webp", width, height, 8, bool(flags & 0x10))
+    return None
+
+
+def _ProbeGif(buf):
+    _Check(buf, 13)
+    width, height, flags = struct.unpack_from("<HHB", buf, 6)
+    info = ImageInfo("gif", width, height, (flags & 0x07) + 1, False)
+
+    # 跳过全局颜色表，遍历第一帧之前的扩展块，读取透明色和注释，数据不够时停止
+    offset = 13
+    if flags & 0x80:
+        offset += 3 << ((flags & 0x07) + 1)
+    while offset + 2 <= len(buf) and buf[offset] == 0x21:
+        label = buf[offset + 1]
+        offset += 2
+        blocks = []
+        while offset < len(buf) and buf[offset]:
+            size = buf[offset]
+            blocks.append(bytes(buf[offset + 1:offset + 1 + size]))
+            offset += 1 + size
+        offset += 1
+        if offset > len(buf):
+            break
+        if label == 0xF9 and blocks and blocks[0]:
+            info.hasAlpha = info.hasAlpha or bool(blocks[0][0] & 0x01)
+        elif label == 0xFE:
+            info.comments.append(b"".join(blocks).decode("utf-8", "replace"))
+    return info
+
+
+def _ProbeBmp(buf):
+    _Check(buf, 30)
+    headerSize, = struct.unpack_from("<I", buf, 14)
+    if headerSize == 12:
+        # OS/2 BITMAPCOREHEADER
+        width, height, _, bitCount = struct.unpack_from("<HHHH", buf, 18)
+        return ImageInfo("bmp", width, height, bitCount, False)
+    width, height, _, bitCount = struct.unpack_from("<iiHH", buf, 18)
+    hasAlpha = False
+    if bitCount == 32 and headerSize >= 56:
+        _Check(buf, 14 + 56)
+        compression, = struct.unpack_from("<I", buf, 30)
+        alphaMask, = struct.unpack_from("<I", buf, 14 + 52)
+        # BI_BITFIELDS/BI_ALPHABITFIELDS并且有alpha掩码
+        hasAlpha = compression in (3, 6) and alphaMask != 0
+    # 高度为负表示从上到下存储
+    return ImageInfo("bmp", abs(width), abs(height), bitCount, hasAlpha)
+
+
+def _Probe(buf):
+    if bytes(buf[:8]) == b"\x89PNG\r\n\x1a\n":
+        return _ProbePng(buf)
+    if bytes(buf[:3]) == b"\xff\xd8\xff":
+        return _ProbeJpeg(buf)
+    if bytes(buf[:4]) == b"RIFF" and bytes(buf[8:12]) == b"WEBP":
+        return _ProbeWebp(buf)
+    if bytes(buf[:6]) in (b"GIF87a", b"GIF89a"):
+        return _ProbeGif(buf)
+    if bytes(buf[:2]) == b"BM":
+        return _ProbeBmp(buf)
+    return None
+
+
+def ProbeImage(data):
+    """
+    解析内存中的图片，data可以是bytes/bytearray/memoryview
+
+    返回：
+        ImageInfo，无法识别或者数据不完整时返回None
+    """
+    try:
+        return _Probe(memoryview(data))
+    except (_NeedMore, struct.error, IndexError, ValueError):
+        return None
+
+
+def ProbeImageFile(path, readSize=ProbeReadSize):
+    """
+    解析图片文件，只读取文件头，数据不够时按需要多读
+
+    返回：
+        ImageInfo，无法识别时返回None；文件不存在等错误抛出OSError
+    """
+    with open(path, "rb") as f:
+        data = f.read(readSize)
+        while True:
+            try:
+                return _Probe(memoryview(data))
+            except _NeedMore as es:
+                more = f.read(max(es.offset - len(data), len(data)))
+                if not more:
+                    return None
+                data += more
+            except (struct.error, IndexError, ValueError):
+                return None
@@ -0,0 +1,159 @@
+"""
+批量转换日志
+把提交、完成和失败的任务逐条追加写入磁盘，进程中途退出后可以从中断的地方继续：
+1. 每条记录一行JSON，包含源路径、输出路径和转换参数，只追加不修改，写到一半的最后一行在加载时丢弃
+2. 同一个源文件只有最后一条记录有效，无效记录超过一定数量时重写为每个文件一条记录
+3. 完成记录保存输出文件的大小和sha1，继续时输出文件校验通过才跳过
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+from src.util import Log
+
+
+class JournalState(object):
+    Submit = "submit"   # 已提交，还没有结果
+    Done = "done"       # 已写出输出文件
+    Fail = "fail"       # 转换或写入失败
+
+
+class JobJournal(object):
+    """
+    entries: {src: record}，每个源文件最后一条记录
+    """
+
+    def __init__(self, path, compactNum=1000):
+        self.path = path
+        self.compactNum = compactNum    # 无效记录超过这个数量并且超过有效记录数时压缩
+        self.entries = {}
+        self._lineNum = 0               # 文件中的记录数
+        self._lock = threading.Lock()
+        self._file = None
+        self._Load()
+
+    @staticmethod
+    def _ModelKey(model):
+        return json.dumps(model, sort_keys=True)
+
+    @staticmethod
+    def GetHash(data):
+        return hashlib.sha1(data).hexdigest()
+
+    def _Load(self):
+        isBroken = False
+        try:
+            with open(self.path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # 写到一半时进程退出
+                        isBroken = True
+                        break
+                    try:
+                        record = json.loads(line)
+                        self.entries[record["src"]] = record
+                        self._lineNum += 1
+                    except (ValueError, KeyError, TypeError):
+                        isBroken = True
+        except FileNotFoundError:
+            pass
+        except OSError as es:
+            Log.Error(es)
+
+        if isBroken:
+            Log.Warn("journal broken, compact: {}", self.path)
+            self.Compact()
+
+    def _Open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "ab")
+        return self._file
+
+    def _Append(self, record):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self.entries[record["src"]] = record
+            try:
+                f = self._Open()
+                f.write(line)
+                f.flush()
+                self._lineNum += 1
+            except OSError as es:
+                Log.Error(es)
+            isCompact = self._lineNum - len(self.entries) > max(self.compactNum, len(self.entries))
+        if isCompact:
+            self.Compact()
+
+    def Submit(self, src, dst, model):
+        self._Append({"op": JournalState.Submit, "src": src, "dst": dst, "model": model})
+
+    def Done(self, src, dst, model, data):
+        self._Append({"op": JournalState.Done, "src": src, "dst": dst, "model": model,
+                      "size": len(data), "sha1": self.GetHash(data)})
+
+    def Fail(self, src, dst, model):
+        self._Append({"op": JournalState.Fail, "src": src, "dst": dst, "model": model})
+
+    def GetState(self, src, dst, model):
+        """
+        源文件在日志中的状态，输出路径或转换参数变化时视为没有记录
+
+        返回：
+            JournalState或None；完成记录的输出文件被删除或修改时视为没有完成，返回Submit
+        """
+        record = self.entries.get(src)
+        if not record or record.get("dst") != dst or \
+                self._ModelKey(record.get("model")) != self._ModelKey(model):
+            return None
+        if record["op"] == JournalState.Done and not self.Verify(record):
+            return JournalState.Submit
+        return record["op"]
+
+    def Verify(self, record):
+        """输出文件存在并且大小和sha1与记录一致"""
+        try:
+            if os.path.getsize(record["dst"]) != record.get("size"):
+                return False
+            with open(record["dst"], "rb") as f:
+                return self.GetHash(f.read()) == record.get("sha1")
+        except OSError:
+            return False
+
+    def GetUnfinished(self):
+        """已经提交但没有结果的记录"""
+        with self._lock:
+            return [record for record in self.entries.values() if record["op"] == JournalState.Submit]
+
+    def Compact(self):
+        """每个源文件只保留最后一条记录，先写临时文件再替换，中途退出时原文件仍然有效"""
+        with self._lock:
+            lines = [(json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+                     for record in self.entries.values()]
+            try:
+                if self._file:
+                    self._file.close()
+                    self._file = None
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp = self.path + ".tmp"
+                with open(tmp, "wb") as f:
+                    f.writelines(lines)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+                self._lineNum = len(lines)
+            except OSError as es:
+                Log.Error(es)
+
+    def Close(self):
+        with self._lock:
+            if self._file:
+                try:
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    self._file.close()
+                except OSError as es:
+                    Log.Error(es)
+                self._file = None
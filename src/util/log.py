@@ -1,14 +1,107 @@
+"""
+日志
+调用线程只创建记录并放入队列，格式化和写文件都在单独的写线程中进行，不会因为磁盘卡住：
+1. 消息可以带参数延迟格式化：Log.Warn("taskId:{}, tick:{}", taskId, tick)，级别被过滤时不会格式化
+2. 同一个调用位置在config.LogRateInterval秒内最多输出config.LogRateNum条，多余的计数后合并提示
+3. 日志文件超过config.LogFileSize后轮转，最多保留config.LogFileNum个旧文件
+4. 使用单独的不向上传递的logger，根logger上其他的handler（比如pytest、第三方库添加的）不会在调用线程格式化
+"""
+
+import atexit
+import logging
 import os
 import sys
-import logging
+import threading
 import time
+import traceback
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import SimpleQueue
 
 from conf import config
 
 
+class _LazyMessage(object):
+    """延迟格式化的消息，在写线程中才调用str.format"""
+    __slots__ = ("fmt", "args")
+
+    def __init__(self, fmt, args):
+        self.fmt = fmt
+        self.args = args
+
+    def __str__(self):
+        try:
+            return str(self.fmt).format(*self.args)
+        except Exception:
+            return "{} {}".format(self.fmt, self.args)
+
+
+class _RateFilter(logging.Filter):
+    """按调用位置限制频率，在调用线程中执行，只做计数"""
+
+    def __init__(self):
+        logging.Filter.__init__(self)
+        self._lock = threading.Lock()
+        self._counts = {}   # {(文件, 行号): [窗口开始时间, 窗口内的条数, 被丢弃的条数]}
+
+    def filter(self, record):
+        rateNum = config.LogRateNum
+        if rateNum <= 0:
+            return True
+        now = time.monotonic()
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            count = self._counts.get(key)
+            if count is None:
+                count = self._counts[key] = [now, 0, 0]
+            elif now - count[0] >= config.LogRateInterval:
+                count[0] = now
+                count[1] = 0
+            if count[1] >= rateNum:
+                count[2] += 1
+                return False
+            count[1] += 1
+            suppressed, count[2] = count[2], 0
+        if suppressed:
+            record.msg = _LazyMessage("{} (suppressed {} similar messages)", (record.getMessage(), suppressed))
+            record.args = None
+        return True
+
+
+class _AsyncHandler(QueueHandler):
+    """只把记录放入队列，不在调用线程格式化"""
+
+    def prepare(self, record):
+        return record
+
+
+_srcFile = os.path.normcase(_LazyMessage.__str__.__code__.co_filename)
+
+
+class _Logger(logging.Logger):
+    """
+    调用位置跳过本文件中的Log.Info等函数，记为调用者的文件和行号
+    stacklevel参数需要Python3.8，打包使用的是Python3.7，所以在这里处理
+    """
+
+    def findCaller(self, stack_info=False, stacklevel=1):
+        f = sys._getframe(1)
+        while f and os.path.normcase(f.f_code.co_filename) in (_srcFile, logging._srcfile):
+            f = f.f_back
+        if not f:
+            return "(unknown file)", 0, "(unknown function)", None
+        sinfo = None
+        if stack_info:
+            sinfo = "Stack (most recent call last):\n" + "".join(traceback.format_stack(f)).rstrip("\n")
+        return f.f_code.co_filename, f.f_lineno, f.f_code.co_name, sinfo
+
+
 class Log(object):
-    logger = logging.getLogger()
+    # 不注册到logging.getLogger中，也不向根logger传递
+    logger = _Logger("waifu2x")
+    logger.propagate = False
     logger.setLevel(logging.DEBUG)
+    _listener = None
+    _handler = None
 
     @staticmethod
     def UpdateLoggingLevel():
@@ -21,38 +114,61 @@ class Log(object):
         return
 
     @staticmethod
-    def Init():
+    def Init(path="logs"):
+        Log.Stop()
         formatter = logging.Formatter("%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s")
 
         ch = logging.StreamHandler()
         ch.setLevel(logging.DEBUG)
         ch.setFormatter(formatter)
+        handlers = [ch]
 
-        Log.logger.addHandler(ch)
-
-        if not os.path.isdir("logs"):
-            os.mkdir("logs")
+        if not os.path.isdir(path):
+            os.makedirs(path)
         day = time.strftime('%Y%m%d', time.localtime(time.time()))
-        logfile = os.path.join("logs", day+".log")
-        fh = logging.FileHandler(logfile, mode='a', encoding="utf-8")
+        logfile = os.path.join(path, day+".log")
+        fh = RotatingFileHandler(logfile, mode='a', maxBytes=int(config.LogFileSize * 1024 * 1024),
+                                 backupCount=config.LogFileNum, encoding="utf-8")
         fh.setLevel(logging.DEBUG)
-        formatter = logging.Formatter("%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s")
         fh.setFormatter(formatter)
-        Log.logger.addHandler(fh)
+        handlers.append(fh)
 
+        queue = SimpleQueue()
+        Log._handler = _AsyncHandler(queue)
+        Log._handler.addFilter(_RateFilter())
+        Log._listener = QueueListener(queue, *handlers, respect_handler_level=True)
+        Log._listener.start()
+        Log.logger.addHandler(Log._handler)
+        atexit.register(Log.Stop)
         return
 
     @staticmethod
-    def Debug(data):
-        Log.logger.debug(data)
+    def Stop():
+        """写完队列中的日志后停止写线程"""
+        if Log._handler:
+            Log.logger.removeHandler(Log._handler)
+            Log._handler = None
+        if Log._listener:
+            Log._listener.stop()
+            for handler in Log._listener.handlers:
+                handler.close()
+            Log._listener = None
+
+    @staticmethod
+    def _Message(data, args):
+        return _LazyMessage(data, args) if args else data
+
+    @staticmethod
+    def Debug(data, *args):
+        Log.logger.debug(Log._Message(data, args))
 
     @staticmethod
-    def Info(data):
-        Log.logger.info(data)
+    def Info(data, *args):
+        Log.logger.info(Log._Message(data, args))
 
     @staticmethod
-    def Warn(data):
-        Log.logger.warning(data)
+    def Warn(data, *args):
+        Log.logger.warning(Log._Message(data, args))
 
     @staticmethod
     def Error(es):
@@ -69,4 +185,4 @@ class Log(object):
         #     message += '         local params:{}\n'.format(frame.f_locals)
         #     cur_tb = cur_tb.tb_next
         # Log.logger.error(message)
-        Log.logger.error(es, exc_info=True)
\ No newline at end of file
+        Log.logger.error(es, exc_info=True)
@@ -0,0 +1,188 @@
+"""
+热点路径计时
+按名字统计耗时分布、计数和当前值，随时可以生成报告：
+1. Timer用perf_counter_ns计时，结果放入对数分桶的直方图，不保存样本，内存占用与调用次数无关
+2. 直方图每个2倍区间分4个桶，分位数的相对误差不超过12.5%
+3. config.IsMetrics为False时Timer返回空对象，Record/Count/Gauge直接返回
+"""
+
+import threading
+import time
+
+from conf import config
+
+
+class Histogram(object):
+    """非负整数（纳秒）的对数分桶直方图"""
+    SubBits = 2     # 每个2倍区间分成2^SubBits个桶
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    @classmethod
+    def GetIndex(cls, value):
+        """小于2^(SubBits+1)的值每个值一个桶，更大的值按最高的SubBits+1位分桶"""
+        subNum = 1 << cls.SubBits
+        if value < subNum * 2:
+            return value
+        shift = value.bit_length() - cls.SubBits - 1
+        return (shift + 1) * subNum + (value >> shift) - subNum
+
+    @classmethod
+    def GetBound(cls, index):
+        """桶的下界和上界（不包含）"""
+        subNum = 1 << cls.SubBits
+        if index < subNum * 2:
+            return index, index + 1
+        shift = index // subNum - 1
+        top = index % subNum + subNum
+        return top << shift, (top + 1) << shift
+
+    def Add(self, value):
+        value = max(0, int(value))
+        index = self.GetIndex(value)
+        with self._lock:
+            self._buckets[index] = self._buckets.get(index, 0) + 1
+            if not self.count or value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+            self.count += 1
+            self.total += value
+
+    def GetPercentile(self, percent):
+        """分位数，返回所在桶的中点，并限制在最小值和最大值之间"""
+        with self._lock:
+            if not self.count:
+                return 0
+            rank = max(1, int(self.count * percent / 100 + 0.5))
+            num = 0
+            for index in sorted(self._buckets):
+                num += self._buckets[index]
+                if num >= rank:
+                    low, high = self.GetBound(index)
+                    return min(self.max, max(self.min, (low + high - 1) / 2))
+            return self.max
+
+    def Get(self):
+        with self._lock:
+            info = {"count": self.count, "mean": self.total / self.count if self.count else 0,
+                    "min": self.min, "max": self.max}
+        for percent in (50, 90, 99):
+            info["p{}".format(percent)] = self.GetPercentile(percent)
+        return info
+
+
+class _NoTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class _Timer(object):
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *args):
+        Metrics.Record(self.name, time.perf_counter_ns() - self.start)
+        return False
+
+
+class Metrics(object):
+    _histograms = {}    # {名字: Histogram}，耗时（纳秒）
+    _counters = {}      # {名字: 累计值}
+    _gauges = {}        # {名字: 当前值}
+    _lock = threading.Lock()
+    _noTimer = _NoTimer()
+
+    @staticmethod
+    def Timer(name):
+        """
+        计时一段代码：
+            with Metrics.Timer("decode"):
+                ...
+        """
+        if not config.IsMetrics:
+            return Metrics._noTimer
+        return _Timer(name)
+
+    @staticmethod
+    def Record(name, ns):
+        """记录一次耗时（纳秒）"""
+        if not config.IsMetrics:
+            return
+        histogram = Metrics._histograms.get(name)
+        if histogram is None:
+            with Metrics._lock:
+                histogram = Metrics._histograms.setdefault(name, Histogram())
+        histogram.Add(ns)
+
+    @staticmethod
+    def Count(name, num=1):
+        if not config.IsMetrics:
+            return
+        with Metrics._lock:
+            Metrics._counters[name] = Metrics._counters.get(name, 0) + num
+
+    @staticmethod
+    def Gauge(name, value):
+        if not config.IsMetrics:
+            return
+        Metrics._gauges[name] = value
+
+    @staticmethod
+    def Reset():
+        with Metrics._lock:
+            Metrics._histograms = {}
+            Metrics._counters = {}
+            Metrics._gauges = {}
+
+    @staticmethod
+    def GetReport():
+        """
+        返回：
+            {"timers": {名字: {count, mean, min, max, p50, p90, p99}}（毫秒）,
+             "counters": {名字: 累计值}, "gauges": {名字: 当前值}}
+        """
+        with Metrics._lock:
+            histograms = dict(Metrics._histograms)
+            counters = dict(Metrics._counters)
+            gauges = dict(Metrics._gauges)
+        timers = {}
+        for name, histogram in histograms.items():
+            info = histogram.Get()
+            timers[name] = {key: value if key == "count" else value / 1000000 for key, value in info.items()}
+        return {"timers": timers, "counters": counters, "gauges": gauges}
+
+    @staticmethod
+    def FormatReport(report=None):
+        """文本格式的报告，耗时按总耗时从大到小排列"""
+        report = report or Metrics.GetReport()
+        timers = report["timers"]
+        width = max([len(name) for name in timers] + [len("timer")])
+        lines = ["{:<{}} {:>8} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+            "timer", width, "count", "mean", "p50", "p90", "p99", "max")]
+        for name, info in sorted(timers.items(), key=lambda item: -item[1]["count"] * item[1]["mean"]):
+            lines.append("{:<{}} {:>8} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f}".format(
+                name, width, info["count"], info["mean"], info["p50"], info["p90"], info["p99"], info["max"]))
+        if report["counters"]:
+            lines.append("")
+            lines.extend("{} = {}".format(name, value) for name, value in sorted(report["counters"].items()))
+        if report["gauges"]:
+            lines.append("")
+            lines.extend("{} = {}".format(name, value) for name, value in sorted(report["gauges"].items()))
+        return "\n".join(lines)
@@ -0,0 +1,93 @@
+"""
+任务登记表
+QtTask 的任务会被UI线程、批量转换线程和引擎线程同时访问，这里统一管理：
+1. 任务ID原子分配，多个线程同时添加任务也不会重复
+2. 每个任务只能从 Wait 转换到 Done 或 Cancel 一次，回调因此只会被调用一次，不会丢失也不会重复
+3. 查询不加锁，状态转换按任务ID分片加锁，不同任务之间几乎没有竞争
+"""
+
+import itertools
+import threading
+
+
+class TaskState(object):
+    Wait = 0        # 等待结果
+    Done = 1        # 结果已经交付
+    Cancel = 2      # 已取消
+
+
+class TaskRegistry(object):
+    """
+    tasks: {taskId: task}，只包含还在等待的任务，task需要有state属性
+    groups: {group: set(taskId)}，按清理标记分组，空的分组会被删除
+    """
+
+    def __init__(self, shardNum=16):
+        self._ids = itertools.count(1)
+        self.lastId = 0
+        self.tasks = {}
+        self.groups = {}
+        self._groupOf = {}      # {taskId: group}
+        self._locks = [threading.Lock() for _ in range(shardNum)]
+        self._groupLock = threading.Lock()
+
+    def NewId(self):
+        """分配一个新的任务ID，itertools.count的next是原子操作"""
+        taskId = next(self._ids)
+        self.lastId = max(self.lastId, taskId)
+        return taskId
+
+    def Add(self, taskId, task, group=""):
+        task.state = TaskState.Wait
+        if not group:
+            with self._locks[taskId % len(self._locks)]:
+                self.tasks[taskId] = task
+            return
+        # 加入分组和加入任务表在同一个_groupLock中完成：
+        # PopGroup取出的任务一定已经在任务表中，可以取消；
+        # 在这之间完成或取消的任务要等_groupLock才能从分组中删除，不会在分组中留下已经删除的任务
+        with self._groupLock:
+            self._groupOf[taskId] = group
+            self.groups.setdefault(group, set()).add(taskId)
+            with self._locks[taskId % len(self._locks)]:
+                self.tasks[taskId] = task
+
+    def Get(self, taskId):
+        """查询等待中的任务，不存在时返回None"""
+        return self.tasks.get(taskId)
+
+    def Transit(self, taskId, state):
+        """
+        把等待中的任务转换到Done或Cancel，并从登记表中删除
+
+        返回：
+            task: 转换成功时返回任务对象；任务不存在或已经转换过时返回None
+        """
+        with self._locks[taskId % len(self._locks)]:
+            task = self.tasks.get(taskId)
+            if task is None or getattr(task, "state", TaskState.Wait) != TaskState.Wait:
+                return None
+            task.state = state
+            del self.tasks[taskId]
+        with self._groupLock:
+            group = self._groupOf.pop(taskId, None)
+            taskIds = self.groups.get(group)
+            if taskIds is not None:
+                taskIds.discard(taskId)
+                if not taskIds:
+                    del self.groups[group]
+        return task
+
+    def PopGroup(self, group):
+        """取出一个分组的所有任务ID"""
+        with self._groupLock:
+            taskIds = self.groups.pop(group, None) or set()
+            for taskId in taskIds:
+                self._groupOf.pop(taskId, None)
+        return taskIds
+
+    def Ids(self):
+        return list(self.tasks)
+
+    def Size(self):
+        return len(self.tasks)
@@ -0,0 +1,102 @@
+"""
+任务调度队列
+替代 QtTask 中的 FIFO 队列，提供：
+1. 优先级：交互(Interactive) > 预取(Prefetch) > 批量(Batch)
+2. 公平性：同一优先级内按 cleanFlag 分组轮询，一个窗口的大批量任务不会挡住其他窗口
+3. 老化：低优先级任务等待过久时获得一次服务机会，不会被饿死
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from queue import Empty
+
+
+class TaskPriority(object):
+    Interactive = 0     # 用户点击触发的转换，要求尽快响应
+    Prefetch = 1        # 预先转换，可能马上会用到
+    Batch = 2           # 批量转换，只关心吞吐
+    All = (Interactive, Prefetch, Batch)
+
+
+class TaskScheduler(object):
+    """
+    线程安全的调度队列
+    每个优先级内部结构为 {group: {taskId: 入队时间}}，外层字典的顺序即轮询顺序
+
+    老化规则：高优先级有任务时，低优先级只有在队首任务已等待 agingTime * 级差 秒，
+    并且该优先级在同样长的时间内没有被服务过，才会插队一次。
+    因此交互任务最多被插队一次/agingTime，而批量任务也总能得到最低限度的吞吐
+    """
+
+    def __init__(self, agingTime=2.0):
+        self.agingTime = agingTime
+        self.clock = time.monotonic
+        self._cond = threading.Condition()
+        self._levels = [OrderedDict() for _ in TaskPriority.All]
+        self._lastServe = [0.0 for _ in TaskPriority.All]
+        self._index = {}    # {taskId: (priority, group)}
+
+    def Put(self, taskId, priority=TaskPriority.Interactive, group=""):
+        """放入任务，任务已在队列中时按新的优先级和分组重新排队"""
+        with self._cond:
+            self._Remove(taskId)
+            level = self._levels[priority]
+            tasks = level.get(group)
+            if tasks is None:
+                tasks = level[group] = OrderedDict()
+            tasks[taskId] = self.clock()
+            self._index[taskId] = (priority, group)
+            self._cond.notify()
+
+    def Get(self, block=True, timeout=None):
+        """取出下一个任务ID，队列为空且超时时抛出 queue.Empty"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._index, timeout if block else 0):
+                raise Empty
+            return self._Pop()
+
+    def Remove(self, taskId):
+        """从队列中删除任务，O(1)，任务不在队列中时返回False"""
+        with self._cond:
+            return self._Remove(taskId)
+
+    def Size(self):
+        return len(self._index)
+
+    def _Remove(self, taskId):
+        info = self._index.pop(taskId, None)
+        if info is None:
+            return False
+        priority, group = info
+        level = self._levels[priority]
+        tasks = level[group]
+        del tasks[taskId]
+        if not tasks:
+            del level[group]
+        return True
+
+    def _Pop(self):
+        now = self.clock()
+        chosen = None
+        for priority, level in enumerate(self._levels):
+            if not level:
+                continue
+            if chosen is None:
+                chosen = priority
+                continue
+            wait = self.agingTime * (priority - chosen)
+            headTime = min(next(iter(tasks.values())) for tasks in level.values())
+            if now - headTime >= wait and now - self._lastServe[priority] >= wait:
+                chosen = priority
+
+        level = self._levels[chosen]
+        group, tasks = next(iter(level.items()))
+        taskId, _ = tasks.popitem(last=False)
+        # 轮询：本组移到队尾，空组直接删除
+        del level[group]
+        if tasks:
+            level[group] = tasks
+        del self._index[taskId]
+        self._lastServe[chosen] = now
+        return taskId
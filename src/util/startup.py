@@ -0,0 +1,55 @@
+"""
+启动耗时
+记录启动过程中每个阶段完成的时间，生成到第一次绘制主窗口为止的耗时报告：
+1. 从导入本模块开始计时，start.py最先导入，解释器本身的启动时间不包含在内
+2. Mark在每个阶段结束时调用，报告中列出距离启动的时间和与上一个阶段的间隔
+3. 第一次绘制之后完成的阶段（比如后台初始化引擎）同样记录，按完成的顺序排列
+"""
+
+import threading
+import time
+
+
+class Startup(object):
+    startTick = time.perf_counter_ns()
+    _marks = []     # [(名字, 距离启动的纳秒)]
+    _lock = threading.Lock()
+
+    @staticmethod
+    def Mark(name):
+        """记录一个阶段完成，可以在任意线程调用"""
+        with Startup._lock:
+            Startup._marks.append((name, time.perf_counter_ns() - Startup.startTick))
+
+    @staticmethod
+    def GetTime(name):
+        """阶段完成时距离启动的时间（毫秒），没有记录时返回0"""
+        with Startup._lock:
+            for markName, tick in Startup._marks:
+                if markName == name:
+                    return tick / 1000000
+        return 0
+
+    @staticmethod
+    def GetReport():
+        """
+        返回：
+            [(名字, 距离启动的时间, 与上一个阶段的间隔)]，单位为毫秒
+        """
+        with Startup._lock:
+            marks = list(Startup._marks)
+        report = []
+        last = 0
+        for name, tick in marks:
+            report.append((name, tick / 1000000, (tick - last) / 1000000))
+            last = tick
+        return report
+
+    @staticmethod
+    def FormatReport(report=None):
+        report = report or Startup.GetReport()
+        width = max([len(name) for name, _, _ in report] + [len("startup")])
+        lines = ["{:<{}} {:>9} {:>9}".format("startup", width, "total", "step")]
+        for name, total, step in report:
+            lines.append("{:<{}} {:>9.1f} {:>9.1f}".format(name, width, total, step))
+        return "\n".join(lines)
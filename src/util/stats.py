@@ -0,0 +1,91 @@
+"""
+滚动统计
+QtTask 用来记录每个阶段最近一段时间的耗时和吞吐：
+1. 每秒一个桶记录次数和总量，用来计算速率，内存占用与任务数量无关
+2. 保留最近的一部分样本，用来计算平均值和分位数
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class RollingStat(object):
+    def __init__(self, window=60, sampleSize=1024):
+        self.window = window
+        self.clock = time.monotonic
+        self._lock = threading.Lock()
+        self._buckets = deque()     # [[秒, 次数, 总量]]
+        self._samples = deque(maxlen=sampleSize)    # [(时间, 值)]
+        self._startTime = self.clock()
+        self.count = 0              # 累计次数
+        self.total = 0              # 累计总量
+
+    def Add(self, value=1):
+        now = self.clock()
+        second = int(now)
+        with self._lock:
+            if self._buckets and self._buckets[-1][0] == second:
+                bucket = self._buckets[-1]
+                bucket[1] += 1
+                bucket[2] += value
+            else:
+                self._buckets.append([second, 1, value])
+            self._samples.append((now, value))
+            self.count += 1
+            self.total += value
+            self._Prune(now)
+
+    def _Prune(self, now):
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+        while self._samples and self._samples[0][0] <= now - self.window:
+            self._samples.popleft()
+
+    def Get(self):
+        """
+        返回窗口内的统计：
+            count/total: 窗口内的次数和总量
+            rate/totalRate: 每秒次数和每秒总量
+            mean/p50/p95/max: 窗口内最近样本的平均值、分位数和最大值
+        """
+        now = self.clock()
+        with self._lock:
+            self._Prune(now)
+            count = sum(bucket[1] for bucket in self._buckets)
+            total = sum(bucket[2] for bucket in self._buckets)
+            values = sorted(value for _, value in self._samples)
+        span = max(1.0, min(self.window, now - self._startTime))
+        info = {
+            "count": count,
+            "total": total,
+            "rate": count / span,
+            "totalRate": total / span,
+            "mean": 0, "p50": 0, "p95": 0, "max": 0,
+        }
+        if values:
+            info["mean"] = sum(values) / len(values)
+            info["p50"] = values[(len(values) - 1) // 2]
+            info["p95"] = values[min(len(values) - 1, int(len(values) * 0.95))]
+            info["max"] = values[-1]
+        return info
+
+
+class ConvertStats(object):
+    """
+    转换流水线各个阶段的统计，阶段名：
+        queue: 在调度队列中等待的时间（秒）
+        engine: 从提交给引擎到返回结果的时间（秒）
+        callback: 主线程中回调函数的执行时间（秒）
+        images: 每完成一张图片记录一次，值为输出的百万像素数
+    """
+    Stages = ("queue", "engine", "callback", "images")
+
+    def __init__(self, window=60):
+        self.stats = {name: RollingStat(window) for name in self.Stages}
+
+    def Add(self, stage, value=1):
+        self.stats[stage].Add(value)
+
+    def Get(self):
+        return {name: stat.Get() for name, stat in self.stats.items()}
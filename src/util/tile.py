@@ -0,0 +1,192 @@
+"""
+大图分块转换
+整张放大超大图片时显存/内存会不够，这里把图片拆成互相重叠的分块：
+1. 每个分块作为独立的任务提交，可以在多个引擎上并行处理，单个任务的峰值内存有上限
+2. 所有分块完成后按位置拼接，重叠区域做线性过渡，不会出现接缝
+3. 分块失败（通常是内存不足）时可以把该分块再拆成更小的分块重试
+"""
+
+from io import BytesIO
+
+from src.util.imageprobe import ProbeImage
+
+
+class TiledImage(object):
+    """
+    一张被拆分的图片
+    分块用 (core, box) 表示，都是原图坐标 (x0, y0, x1, y1)：
+        core: 分块负责的区域，所有分块的core互不重叠并且正好铺满整张图
+        box: core向四周扩展overlap后的区域，即实际提交转换的区域
+    拼接时相邻分块在重叠区域内按权重相加，一个从0到1过渡，另一个从1到0过渡
+    """
+
+    def __init__(self, imgData, model, overlap=16):
+        from PIL import Image
+        img = Image.open(BytesIO(imgData))
+        img.load()
+        if img.mode not in ("RGB", "RGBA"):
+            hasAlpha = img.mode in ("LA", "PA") or "transparency" in img.info
+            img = img.convert("RGBA" if hasAlpha else "RGB")
+        self.img = img
+        self.model = model
+        self.overlap = overlap
+        self.size = img.size
+
+        w, h = img.size
+        scale = model.get("scale", 0)
+        if scale > 0:
+            self.outSize = (max(1, round(w * scale)), max(1, round(h * scale)))
+        else:
+            self.outSize = (model.get("width", 0) or w, model.get("high", 0) or h)
+        self._tiles = []    # [(core, box, Image)]
+
+    @staticmethod
+    def NeedTile(imgData, tileSize):
+        """只读取文件头判断图片是否超过分块大小，无法识别的格式不分块"""
+        info = ProbeImage(imgData)
+        return bool(info) and max(info.size) > tileSize
+
+    def _OutX(self, x):
+        return round(x * self.outSize[0] / self.size[0])
+
+    def _OutY(self, y):
+        return round(y * self.outSize[1] / self.size[1])
+
+    def GetOutBox(self, box):
+        """原图坐标的区域对应结果图片中的区域"""
+        return self._OutX(box[0]), self._OutY(box[1]), self._OutX(box[2]), self._OutY(box[3])
+
+    def Split(self, tileSize, core=None):
+        """把core区域（默认整张图）拆成不超过tileSize的分块，返回[(core, box)]"""
+        w, h = self.size
+        x0, y0, x1, y1 = core or (0, 0, w, h)
+        tileSize = max(1, tileSize)
+        # 均分，避免最后一块特别小
+        nx = -(-(x1 - x0) // tileSize)
+        ny = -(-(y1 - y0) // tileSize)
+        xs = [x0 + (x1 - x0) * i // nx for i in range(nx + 1)]
+        ys = [y0 + (y1 - y0) * i // ny for i in range(ny + 1)]
+        tiles = []
+        for j in range(ny):
+            for i in range(nx):
+                tileCore = (xs[i], ys[j], xs[i + 1], ys[j + 1])
+                box = (max(0, xs[i] - self.overlap), max(0, ys[j] - self.overlap),
+                       min(w, xs[i + 1] + self.overlap), min(h, ys[j + 1] + self.overlap))
+                tiles.append((tileCore, box))
+        return tiles
+
+    @staticmethod
+    def GetFocusKey(core, focus):
+        """
+        分块的转换顺序，与focus区域相交的分块最先，其余按中心到focus中心的距离由近到远
+        focus为None时所有分块相同，排序后保持原来的顺序
+        """
+        if not focus:
+            return 0, 0
+        isIn = core[0] < focus[2] and focus[0] < core[2] and core[1] < focus[3] and focus[1] < core[3]
+        dx = (core[0] + core[2]) - (focus[0] + focus[2])
+        dy = (core[1] + core[3]) - (focus[1] + focus[3])
+        return 0 if isIn else 1, dx * dx + dy * dy
+
+    @staticmethod
+    def Crop(imgData, box):
+        """裁剪出原图中的一块，使用无损的PNG"""
+        from PIL import Image
+        img = Image.open(BytesIO(imgData))
+        img.load()
+        if img.mode not in ("RGB", "RGBA"):
+            hasAlpha = img.mode in ("LA", "PA") or "transparency" in img.info
+            img = img.convert("RGBA" if hasAlpha else "RGB")
+        out = BytesIO()
+        img.crop(box).save(out, "PNG", compress_level=1)
+        return out.getvalue()
+
+    def GetTileData(self, box):
+        """裁剪出分块，使用无损的PNG提交"""
+        out = BytesIO()
+        self.img.crop(box).save(out, "PNG", compress_level=1)
+        return out.getvalue()
+
+    def GetTileModel(self, box):
+        """分块的转换参数，固定宽高模式下按比例计算每个分块的宽高"""
+        model = dict(self.model)
+        model["format"] = "png"
+        if model.get("scale", 0) <= 0:
+            x0, y0, x1, y1 = self.GetOutBox(box)
+            model["width"], model["high"] = x1 - x0, y1 - y0
+        return model
+
+    def Add(self, core, box, data):
+        """保存一个分块的转换结果，尺寸有舍入误差时缩放到目标大小"""
+        from PIL import Image
+        img = Image.open(BytesIO(data))
+        img.load()
+        x0, y0, x1, y1 = self.GetOutBox(box)
+        if img.size != (x1 - x0, y1 - y0):
+            img = img.resize((x1 - x0, y1 - y0), Image.LANCZOS)
+        self._tiles.append((core, box, img))
+
+    def _GetWeights(self, start, end, coreStart, coreEnd, size, Out):
+        """
+        一个方向上的权重，与相邻分块重叠的区域从0过渡到255，相邻的分块在同一区域从255过渡到0，
+        两者相加正好是255，与分块的大小和拼接的顺序无关
+        start/end: box的范围，coreStart/coreEnd: core的范围，size: 原图在该方向上的尺寸
+        """
+        outStart = Out(start)
+        weights = bytearray(b"\xff" * (Out(end) - outStart))
+        for edge, isStart in ((coreStart, True), (coreEnd, False)):
+            if (edge > start) if isStart else (edge < end):
+                # 这一侧有相邻的分块，过渡区域由分界线决定，两个分块使用相同的区域
+                x0 = Out(max(0, edge - self.overlap)) - outStart
+                x1 = Out(min(size, edge + self.overlap)) - outStart
+                for i in range(max(0, x0), min(x1, len(weights))):
+                    ramp = self._Ramp(i - x0, x1 - x0)
+                    weights[i] = weights[i] * (ramp if isStart else 255 - ramp) // 255
+        return bytes(weights)
+
+    @staticmethod
+    def _Ramp(i, length):
+        return int(255 * (i + 0.5) / length)
+
+    def _GetMask(self, core, box, size):
+        """分块四周与相邻分块重叠的区域的权重，没有相邻分块时返回None"""
+        from PIL import Image, ImageChops
+        w, h = size
+        if core == box:
+            return None
+        xs = self._GetWeights(box[0], box[2], core[0], core[2], self.size[0], self._OutX)
+        ys = self._GetWeights(box[1], box[3], core[1], core[3], self.size[1], self._OutY)
+        left = Image.frombytes("L", (w, 1), xs).resize((w, h), Image.NEAREST)
+        top = Image.frombytes("L", (1, h), ys).resize((w, h), Image.NEAREST)
+        return ImageChops.multiply(left, top)
+
+    def Merge(self):
+        """
+        拼接所有分块，编码为model中的格式
+        每个分块乘以自己的权重后累加，重叠区域的权重之和为255，拼接的顺序不影响结果，
+        重试时拆出的小分块与周围的大分块同样平滑过渡
+        """
+        from PIL import Image, ImageChops
+        mode = "RGBA" if any(img.mode in ("RGBA", "LA", "PA") for _, _, img in self._tiles) else "RGB"
+        canvas = Image.new(mode, self.outSize)
+        for core, box, img in self._tiles:
+            if img.mode != mode:
+                img = img.convert(mode)
+            mask = self._GetMask(core, box, img.size)
+            x0, y0, x1, y1 = self.GetOutBox(box)
+            if mask is None:
+                canvas.paste(img, (x0, y0))
+                continue
+            img = ImageChops.multiply(img, Image.merge(mode, [mask] * len(mode)))
+            canvas.paste(ImageChops.add(canvas.crop((x0, y0, x1, y1)), img), (x0, y0))
+        self._tiles = []
+
+        out = BytesIO()
+        picFormat = self.model.get("format", "jpg").lower()
+        if picFormat == "png":
+            canvas.save(out, "PNG")
+        elif picFormat == "webp":
+            canvas.save(out, "WEBP", quality=95)
+        else:
+            canvas.convert("RGB").save(out, "JPEG", quality=95)
+        return out.getvalue()
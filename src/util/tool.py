@@ -7,33 +7,40 @@ import hmac
 from hashlib import sha256
 
 from src.util import Log
+from src.util.imageprobe import ProbeImage
+from src.util.metrics import Metrics
 from conf import config
 
 
 class CTime(object):
+    """分段计时，每段耗时记录到Metrics中名为clsName的直方图，超过checkTime毫秒时输出日志"""
+
     def __init__(self):
-        self._t1 = time.time()
+        self._t1 = time.perf_counter_ns()
 
     def Refresh(self, clsName, des='', checkTime=100):
-        t2 = time.time()
-        diff = int((t2 - self._t1) * 1000)
+        t2 = time.perf_counter_ns()
+        Metrics.Record(clsName, t2 - self._t1)
+        diff = (t2 - self._t1) // 1000000
         if diff >= checkTime:
-            text = 'CTime2 consume:{} ms, {}.{}'.format(diff, clsName, des)
-            Log.Warn(text)
+            Log.Warn('CTime2 consume:{} ms, {}.{}', diff, clsName, des)
         self._t1 = t2
         return diff
 
 
 def time_me(fn):
+    """函数耗时记录到Metrics中名为函数限定名的直方图，超过100毫秒时输出日志"""
+    name = fn.__qualname__
+
     def _wrapper(*args, **kwargs):
-        start = time.time()
+        start = time.perf_counter_ns()
         rt = fn(*args, **kwargs)
-        diff = int((time.time() - start) * 1000)
+        diffNs = time.perf_counter_ns() - start
+        Metrics.Record(name, diffNs)
+        diff = diffNs // 1000000
         if diff >= 100:
             clsName = args[0]
-            strLog = 'time_me consume,{} ms, {}.{}'.format(diff, clsName, fn.__name__)
-            # Log.w(strLog)
-            Log.Warn(strLog)
+            Log.Warn('time_me consume,{} ms, {}.{}', diff, clsName, fn.__name__)
         return rt
     return _wrapper
 
@@ -185,7 +192,8 @@ class ToolUtil(object):
     def GetScaleAndNoise(w, h):
         dot = w * h
         # 条漫不放大
-        if max(w, h) >= 2561:
+        # 开启分块转换时大图也可以按原倍数放大
+        if max(w, h) >= 2561 and not config.TileSize:
             return 1, 3
         if dot >= 1920 * 1440:
             return 2, 3
@@ -202,8 +210,8 @@ class ToolUtil(object):
     def GetLookScaleModel(w, h, category):
         dot = w * h
         # 条漫不放大
-
-        if max(w, h) >= 2561:
+        # 开启分块转换时大图也可以按原倍数放大
+        if max(w, h) >= 2561 and not config.TileSize:
             return ToolUtil.GetModelByIndex(0)
         return ToolUtil.GetModelByIndex(ToolUtil.GetLookModel(category))
 
@@ -214,76 +222,40 @@ class ToolUtil(object):
         if not config.CanWaifu2x:
             return {}
         from waifu2x_vulkan import waifu2x_vulkan
-        if max(w, h) >= 2561:
+        # 开启分块转换时大图也可以按原倍数放大
+        if max(w, h) >= 2561 and not config.TileSize:
             return {"model": waifu2x_vulkan.MODEL_ANIME_STYLE_ART_RGB_NOISE3, "scale": 1, "index": 0}
         return ToolUtil.GetModelByIndex(config.DownloadModel)
 
     @staticmethod
     def GetPictureFormat(data):
-        if data[:8] == b"\x89\x50\x4e\x47\x0d\x0a\x1a\x0a":
-            return "png"
-        elif data[:2] == b"\xff\xd8":
-            return "jpg"
-        return "jpg"
+        info = ProbeImage(data)
+        return info.format if info else "jpg"
 
     @staticmethod
     def GetPictureSize(data):
+        # 只解析文件头，无法识别的格式才交给PIL
+        info = ProbeImage(data)
+        if info:
+            return info.width, info.height
         from PIL import Image
         from io import BytesIO
         a = BytesIO(data)
         img = Image.open(a)
         a.close()
         return img.width, img.height
-        # picFormat = ToolUtil.GetPictureFormat(data)
-        # weight, height = 1, 1
-        # if picFormat == "png":
-        #     # head = 8 + 4 + 4
-        #     data2 = data[16:24]
-        #     weight = int.from_bytes(data2[:4], byteorder='big', signed=False)
-        #     height = int.from_bytes(data2[5:], byteorder='big', signed=False)
-        # elif picFormat == "jpg":
-        #     size = min(1000, len(data))
-        #
-        #     index = 0
-        #     while index < size:
-        #         if data[index] == 255:
-        #             index += 1
-        #             if 192 <= data[index] <= 206:
-        #                 index += 4
-        #                 if index + 4 >= size:
-        #                     continue
-        #                 height = int.from_bytes(data[index:index + 2], byteorder='big', signed=False)
-        #                 weight = int.from_bytes(data[index + 2:index + 4], byteorder='big', signed=False)
-        #                 break
-        #             else:
-        #                 continue
-        #         index += 1
-        # return weight, height
 
     @staticmethod
     def GetDataModel(data):
-        picFormat = ToolUtil.GetPictureFormat(data)
-        if picFormat == "png":
-            IDATEnd = 8 + 25
-            dataSize = int.from_bytes(data[IDATEnd:IDATEnd + 4], byteorder="big", signed=False)
-            if dataSize >= 10:
-                return ""
-            dataType = data[IDATEnd + 4:IDATEnd + 8]
-            if dataType == b"tEXt":
-                return data[IDATEnd + 8:IDATEnd + 8 + dataSize].decode("utf-8")
+        """图片中保存的转换参数，PNG保存在tEXt中，JPEG保存在COM中"""
+        info = ProbeImage(data)
+        if not info:
             return ""
-        elif picFormat == "jpg":
-            if data[:4] != b"\xff\xd8\xff\xe0":
-                return ""
-            size = int.from_bytes(data[4:6], byteorder="big", signed=False)
-            if size >= 100:
-                return ""
-            if data[4 + size:4 + size + 2] != b"\xff\xfe":
-                return
-            size2 = int.from_bytes(data[4 + size + 2:4 + size + 2 + 2], byteorder="big", signed=False) - 2
-            if size2 >= 100:
-                return
-            return data[4 + size2 + 2 + 2:4 + size2 + 2 + 2 + size2].decode("utf-8")
+        if info.text:
+            key, value = next(iter(info.text.items()))
+            return key + "\0" + value if value else key
+        if info.comments:
+            return info.comments[0]
         return ""
 
     @staticmethod
@@ -331,6 +303,26 @@ class ToolUtil(object):
             return {"model": waifu2x_vulkan.MODEL_ANIME_STYLE_ART_RGB_NOISE3, "scale": 2, "index": index}
         return {"model": waifu2x_vulkan.MODEL_CUNET_NOISE3, "scale": 2, "index": index}
 
+    @staticmethod
+    def GetModelName(modelName, noise, isNoScale=False, isTTA=False):
+        """
+        拼接waifu2x模型名，例如 MODEL_CUNET_NOISE3、MODEL_PHOTO_NO_NOISE_TTA
+        :param modelName: CUNET / PHOTO / ANIME_STYLE_ART_RGB
+        :param noise: 降噪等级，-1表示不降噪
+        :param isNoScale: 是否使用不放大的模型（仅CUNET有）
+        """
+        if noise == -1:
+            noiseName = "NO_NOISE"
+        else:
+            noiseName = "NOISE" + str(noise)
+        if modelName == "CUNET" and isNoScale:
+            name = "MODEL_{}_NO_SCALE_{}".format(modelName, noiseName)
+        else:
+            name = "MODEL_{}_{}".format(modelName, noiseName)
+        if isTTA:
+            name += "_TTA"
+        return name
+
     @staticmethod
     def GetCanSaveName(name):
         return name.replace("/", "").replace("|", "").replace("*", "").\
@@ -0,0 +1,145 @@
+"""
+性能跟踪
+记录转换过程中每个阶段的起止时间，导出为Chrome/Perfetto可以打开的trace JSON（chrome://tracing、ui.perfetto.dev）：
+1. Span记录同一个线程内的一段时间，Begin/End记录跨线程的一段时间（比如排队、引擎处理），用任务ID关联
+2. 运行时通过Start/Stop开关，关闭时每个记录点只有一次判断
+3. 事件数量超过config.TraceMaxEvents后不再记录，避免忘记关闭时占满内存
+"""
+
+import json
+import os
+import threading
+import time
+
+from conf import config
+from src.util import Log
+
+
+class _NoSpan(object):
+    """关闭跟踪时使用的空Span"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class _Span(object):
+    __slots__ = ("name", "taskId", "args", "start")
+
+    def __init__(self, name, taskId, args):
+        self.name = name
+        self.taskId = taskId
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *args):
+        end = time.perf_counter_ns()
+        Trace._Add(("X", self.name, self.start, end - self.start, threading.get_ident(), self.taskId, self.args))
+        return False
+
+
+class Trace(object):
+    isEnable = False
+    _events = []    # [(类型, 名字, 开始时间ns, 持续时间ns, 线程, 任务ID, 参数)]
+    _threads = {}   # {线程ident: 线程名}
+    _lock = threading.Lock()
+    _noSpan = _NoSpan()
+
+    @staticmethod
+    def Start():
+        """开始记录，之前的记录被清空"""
+        with Trace._lock:
+            Trace._events = []
+            Trace._threads = {}
+            Trace.isEnable = True
+
+    @staticmethod
+    def Stop(path=""):
+        """
+        停止记录，path不为空时写入trace文件
+
+        返回：
+            事件数
+        """
+        with Trace._lock:
+            Trace.isEnable = False
+            events, Trace._events = Trace._events, []
+            threads, Trace._threads = Trace._threads, {}
+        if path:
+            Trace.Save(path, events, threads)
+        return len(events)
+
+    @staticmethod
+    def _Add(event):
+        events = Trace._events
+        if len(events) >= config.TraceMaxEvents:
+            return
+        # list.append是原子的，不需要加锁
+        events.append(event)
+        tid = event[4]
+        if tid not in Trace._threads:
+            Trace._threads[tid] = threading.current_thread().name
+
+    @staticmethod
+    def Span(name, taskId=0, **args):
+        """
+        记录当前线程内的一段时间：
+            with Trace.Span("submit", jobId):
+                ...
+        """
+        if not Trace.isEnable:
+            return Trace._noSpan
+        return _Span(name, taskId, args)
+
+    @staticmethod
+    def Begin(name, taskId, **args):
+        """跨线程的一段时间开始，和相同名字、相同任务ID的End配对"""
+        if Trace.isEnable:
+            Trace._Add(("b", name, time.perf_counter_ns(), 0, threading.get_ident(), taskId, args))
+
+    @staticmethod
+    def End(name, taskId, **args):
+        if Trace.isEnable:
+            Trace._Add(("e", name, time.perf_counter_ns(), 0, threading.get_ident(), taskId, args))
+
+    @staticmethod
+    def Instant(name, taskId=0, **args):
+        """一个时间点"""
+        if Trace.isEnable:
+            Trace._Add(("i", name, time.perf_counter_ns(), 0, threading.get_ident(), taskId, args))
+
+    @staticmethod
+    def ToJson(events, threads):
+        """转换为trace event格式，时间单位为微秒"""
+        pid = os.getpid()
+        traceEvents = [{"ph": "M", "name": "thread_name", "pid": pid, "tid": tid, "args": {"name": name}}
+                       for tid, name in threads.items()]
+        for ph, name, start, dur, tid, taskId, args in events:
+            event = {"ph": ph, "name": name, "pid": pid, "tid": tid, "ts": start / 1000, "cat": "convert"}
+            if taskId:
+                args = dict(args, taskId=taskId)
+            if args:
+                event["args"] = args
+            if ph == "X":
+                event["dur"] = dur / 1000
+            elif ph in ("b", "e"):
+                event["id"] = taskId
+            elif ph == "i":
+                event["s"] = "t"
+            traceEvents.append(event)
+        return {"traceEvents": traceEvents, "displayTimeUnit": "ms"}
+
+    @staticmethod
+    def Save(path, events, threads):
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(Trace.ToJson(events, threads), f, default=str)
+        except Exception as es:
+            Log.Error(es)
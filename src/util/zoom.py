@@ -0,0 +1,47 @@
+"""
+图片查看的缩放状态
+显示比例只由适应窗口的比例和缩放次数决定：scale = fitScale * step^steps
+窗口大小变化或者连续滚动滚轮时一次算出最终的比例，不需要逐次叠加变换
+"""
+
+
+class ZoomState(object):
+    def __init__(self, step=1.1, minScale=0.07, maxScale=100):
+        self.step = step
+        self.minScale = minScale    # 缩小时不低于这个比例
+        self.maxScale = maxScale    # 放大时不超过这个比例
+        self.steps = 0              # 相对适应窗口的缩放次数，正数为放大
+
+    def Reset(self):
+        self.steps = 0
+
+    @staticmethod
+    def GetFitScale(imageSize, viewSize):
+        """图片完整显示在窗口中的比例，尺寸无效时返回0"""
+        imageW, imageH = imageSize
+        viewW, viewH = viewSize
+        if imageW <= 0 or imageH <= 0 or viewW <= 0 or viewH <= 0:
+            return 0
+        return min(viewW / imageW, viewH / imageH)
+
+    def GetScale(self, fitScale):
+        return fitScale * self.step ** self.steps
+
+    def Zoom(self, num, fitScale):
+        """
+        缩放num次，正数为放大，负数为缩小；超大图适应窗口时比例可能已经小于下限，仍然允许放大
+
+        返回：
+            是否有变化
+        """
+        steps = self.steps
+        direction = 1 if num > 0 else -1
+        for _ in range(abs(num)):
+            scale = fitScale * self.step ** (steps + direction)
+            if (direction < 0 and scale < self.minScale) or (direction > 0 and scale > self.maxScale):
+                break
+            steps += direction
+        if steps == self.steps:
+            return False
+        self.steps = steps
+        return True
@@ -2,34 +2,34 @@
 """第一个程序"""
 import sys
 
+# 最先导入，从这里开始记录启动耗时
+from src.util.startup import Startup
+
 from PySide6.QtGui import QGuiApplication, Qt
 
 from conf import config
-try:
-    from waifu2x_vulkan import waifu2x_vulkan
-    config.CanWaifu2x = True
-except Exception as es:
-    config.CanWaifu2x = False
-    if hasattr(es, "msg"):
-        config.ErrorMsg = es.msg
-
 from PySide6 import QtWidgets  # 导入PySide6部件
 from src.qt.qtmain import QtMainWindow
 from src.util import Log
-import images_rc
+from src.util.engine import StopWaifu2x
+# waifu2x_vulkan在QtTask的后台线程中导入和初始化，images_rc在加载翻译时才导入
 
 
 if __name__ == "__main__":
     # QGuiApplication.setHighDpiScaleFactorRoundingPolicy(Qt.HighDpiScaleFactorRoundingPolicy.Floor)
     # QtWidgets.QApplication.setAttribute(Qt.AA_EnableHighDpiScaling)
+    Startup.Mark("import")
     Log.Init()
     app = QtWidgets.QApplication(sys.argv)  # 建立application对象
+    Startup.Mark("app")
     # app.addLibraryPath("./resources")
     main = QtMainWindow()
+    Startup.Mark("window")
 
     main.Init(app)
+    Startup.Mark("init")
     main.show()  # 显示窗体
+    Startup.Mark("show")
     sts = app.exec()
-    if config.CanWaifu2x:
-        waifu2x_vulkan.stop()
+    StopWaifu2x()
     sys.exit(sts)  # 运行程序
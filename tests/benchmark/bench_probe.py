@@ -0,0 +1,125 @@
+"""
+性能测试：图片文件头解析与PIL对比
+对同一批图片分别用ProbeImage和PIL.Image.open读取尺寸，比较耗时并核对结果
+
+运行：
+    python -m tests.benchmark.bench_probe                  # 生成各种格式的图片作为语料
+    python -m tests.benchmark.bench_probe -d D:/images     # 使用目录中的图片
+    python -m tests.benchmark.bench_probe --file            # 从文件读取而不是内存
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+Formats = (("JPEG", "RGB"), ("PNG", "RGBA"), ("WEBP", "RGB"), ("GIF", "P"), ("BMP", "RGB"))
+
+
+def MakeCorpus(num, maxSize=2048):
+    """生成num张随机尺寸、各种格式的图片，同样尺寸的图片内容相同，生成很快"""
+    from PIL import Image
+    rand = random.Random(1)
+    corpus = []
+    for i in range(num):
+        picFormat, mode = Formats[i % len(Formats)]
+        size = (rand.randint(16, maxSize), rand.randint(16, maxSize))
+        out = BytesIO()
+        Image.new(mode, size).save(out, picFormat)
+        corpus.append(out.getvalue())
+    return corpus
+
+
+def LoadCorpus(path):
+    from src.qt.util.qtbatch import WalkImages
+    corpus = []
+    for fileName in WalkImages(path):
+        with open(fileName, "rb") as f:
+            corpus.append(f.read())
+    return corpus
+
+
+def PilSize(data):
+    from PIL import Image
+    return Image.open(BytesIO(data)).size
+
+
+def PilFileSize(path):
+    from PIL import Image
+    with Image.open(path) as img:
+        return img.size
+
+
+def ProbeSize(data):
+    from src.util.imageprobe import ProbeImage
+    info = ProbeImage(data)
+    return info.size if info else None
+
+
+def ProbeFileSize(path):
+    from src.util.imageprobe import ProbeImageFile
+    info = ProbeImageFile(path)
+    return info.size if info else None
+
+
+def Measure(fn, items, repeat):
+    best = None
+    results = None
+    for _ in range(repeat):
+        tick = time.perf_counter()
+        results = [fn(item) for item in items]
+        tick = time.perf_counter() - tick
+        best = tick if best is None else min(best, tick)
+    return best, results
+
+
+def RunProbe(corpus, repeat=3, paths=None):
+    """返回 {"pil": 秒, "probe": 秒, "mismatch": 结果不一致的数量}"""
+    if paths:
+        pilTick, pilSizes = Measure(PilFileSize, paths, repeat)
+        probeTick, probeSizes = Measure(ProbeFileSize, paths, repeat)
+    else:
+        pilTick, pilSizes = Measure(PilSize, corpus, repeat)
+        probeTick, probeSizes = Measure(ProbeSize, corpus, repeat)
+    mismatch = sum(1 for a, b in zip(pilSizes, probeSizes) if a != b)
+    return {"num": len(paths or corpus), "pil": pilTick, "probe": probeTick, "mismatch": mismatch}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片文件头解析性能测试")
+    parser.add_argument("-n", "--num", type=int, default=500, help="生成的图片数")
+    parser.add_argument("-d", "--dir", default="", help="使用目录中的图片")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="重复次数，取最快的一次")
+    parser.add_argument("--file", action="store_true", help="从文件读取")
+    args = parser.parse_args()
+
+    corpus = LoadCorpus(args.dir) if args.dir else MakeCorpus(args.num)
+    paths = None
+    tmpDir = ""
+    if args.file:
+        import tempfile
+        tmpDir = tempfile.mkdtemp()
+        paths = []
+        for i, data in enumerate(corpus):
+            paths.append(os.path.join(tmpDir, "{}.img".format(i)))
+            with open(paths[-1], "wb") as f:
+                f.write(data)
+
+    try:
+        result = RunProbe(corpus, args.repeat, paths)
+    finally:
+        if tmpDir:
+            import shutil
+            shutil.rmtree(tmpDir, ignore_errors=True)
+    num = result["num"]
+    print("images:{}, pil:{:.1f}us/img, probe:{:.1f}us/img, speedup:{:.1f}x, mismatch:{}".format(
+        num, result["pil"] / num * 1e6, result["probe"] / num * 1e6, result["pil"] / result["probe"],
+        result["mismatch"]))
+    return 1 if result["mismatch"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
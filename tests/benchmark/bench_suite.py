@@ -0,0 +1,486 @@
+"""
+性能基准：转换流程
+用可以设置延迟的模拟引擎代替waifu2x_vulkan，测量：
+1. QtTask在不同队列深度下的吞吐量和延迟分位数（保持depth个任务在队列中，完成一个提交一个）
+2. ToolUtil解析文件头（格式、尺寸、转换参数）和选择模型的耗时
+3. 不同尺寸的图片在QtImg中从后台解码、生成预览金字塔到第一次绘制完成的耗时（QtImg._ShowImg到分块绘制的过程）
+4. 进程的峰值内存
+每个测试重复--rounds次，结果为中位数和标准差，可以保存为JSON基线
+之后用--compare与基线比较，变差同时超过阈值和噪声（标准差的--noise倍）的项目标记为回归并返回1
+p99这类尾部延迟波动较大，使用更宽的阈值TailThreshold
+微秒级的项目受机器当时的速度影响很大，同时测量一段固定的Python代码（calibrate），比较时按它的变化换算
+图片和模拟引擎的延迟都由固定的种子生成，同一台机器上多次运行的结果可以直接比较
+
+运行：
+    python -m tests.benchmark.bench_suite                                  # 运行并打印结果
+    python -m tests.benchmark.bench_suite -o baseline.json                 # 保存为基线
+    python -m tests.benchmark.bench_suite --compare baseline.json          # 与基线比较
+    python -m tests.benchmark.bench_suite --only task --depth 1 16 --delay 10
+    python -m tests.benchmark.bench_suite --only probe model --rounds 9 --compare baseline.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import queue
+import random
+import statistics
+import sys
+import threading
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from src.util.engine import BaseEngine
+
+Sections = ("task", "probe", "model", "show")
+TailThreshold = 0.3     # 尾部延迟的回归阈值
+
+
+class LatencyEngine(BaseEngine):
+    """
+    模拟waifu2x_vulkan的引擎：workers个线程依次处理任务，每个任务耗时delay±jitter秒后原样返回数据
+    延迟由固定种子的随机数生成，同样的参数每次运行的延迟序列相同
+    """
+    Name = "latency"
+
+    def __init__(self, delay=0.005, jitter=0.0, workers=4, seed=1):
+        self.delay = delay
+        self.jitter = jitter
+        self.workers = workers
+        self._rand = random.Random(seed)
+        self._randLock = threading.Lock()
+        self._inQueue = queue.Queue()
+        self._outQueue = queue.Queue()
+        self._cancelIds = set()
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._Run, daemon=True, name="LatencyEngine")
+                         for _ in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def GetDelay(self):
+        with self._randLock:
+            delay = self._rand.gauss(self.delay, self.jitter) if self.jitter else self.delay
+        return max(0.0, delay)
+
+    def Submit(self, taskId, imgData, model):
+        self._inQueue.put((taskId, imgData))
+        return 1
+
+    def _Run(self):
+        while True:
+            item = self._inQueue.get()
+            if item is None:
+                return
+            taskId, imgData = item
+            with self._lock:
+                if taskId in self._cancelIds:
+                    self._cancelIds.discard(taskId)
+                    continue
+            delay = self.GetDelay()
+            time.sleep(delay)
+            self._outQueue.put((imgData, 1, taskId, delay))
+
+    def Collect(self):
+        return self._outQueue.get()
+
+    def Cancel(self, taskIds):
+        with self._lock:
+            self._cancelIds.update(taskIds)
+
+    def Capabilities(self):
+        return {"name": self.Name, "device": "latency", "workers": self.workers, "models": True, "tta": True}
+
+    def Stop(self):
+        for _ in self._threads:
+            self._inQueue.put(None)
+        self._outQueue.put(None)
+
+
+def GetPeakRss():
+    """进程的峰值常驻内存（MB）"""
+    try:
+        import resource
+    except ImportError:
+        return GetWindowsPeakRss()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux单位为KB，macOS为字节
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def GetWindowsPeakRss():
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+    try:
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return 0
+        return counters.PeakWorkingSetSize / 1024 / 1024
+    except Exception:
+        return 0
+
+
+def GetPercentile(values, percent):
+    """最近秩法的分位数"""
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, int(len(values) * percent / 100 + 0.5) - 1))]
+
+
+def AddMetric(results, name, value, unit, better="lower", threshold=0, isCpu=False):
+    """
+    threshold不为0时，与基线比较使用这个阈值和命令行阈值中较大的一个
+    isCpu为纯计算的耗时，与基线比较时按calibrate的变化换算；better为"none"的项目只记录，不比较
+    """
+    results[name] = {"value": value, "unit": unit, "better": better}
+    if threshold:
+        results[name]["threshold"] = threshold
+    if isCpu:
+        results[name]["cpu"] = True
+
+
+def MakeImage(w, h, seed=0, picFormat="PNG", text=""):
+    """生成w*h的渐变图片，seed不同时内容不同，text写入PNG的tEXt或JPEG的注释"""
+    from PIL import Image, PngImagePlugin
+    img = Image.linear_gradient("L").resize((w, h)).convert("RGB")
+    if seed:
+        img.putpixel((0, 0), (seed % 256, seed // 256 % 256, seed // 65536 % 256))
+    out = BytesIO()
+    if picFormat == "PNG":
+        info = PngImagePlugin.PngInfo()
+        if text:
+            info.add_text("waifu2x", text)
+        img.save(out, "PNG", pnginfo=info)
+    elif text:
+        img.save(out, picFormat, comment=text.encode())
+    else:
+        img.save(out, picFormat)
+    return out.getvalue()
+
+
+def RunTask(app, depths=(1, 8, 64), num=2000, delay=0.002, jitter=0.001, workers=4, timeout=120):
+    """
+    每个队列深度：先提交depth个任务，每完成一个再提交一个，直到完成num个
+    延迟为AddConvertTask到完成回调的时间，包括排队、引擎处理和信号回到主线程
+    """
+    from conf import config
+    from src.qt.util.qttask import QtTask
+
+    task = QtTask()
+    task.WaitEngines()
+    oldEngines, oldCache = task.engines, config.IsCacheConvert
+    # 每个任务的数据都不同，关闭缓存避免命中
+    config.IsCacheConvert = False
+    corpus = [MakeImage(32, 32, i + 1) for i in range(num)]
+    results = {}
+    try:
+        for depth in depths:
+            engine = LatencyEngine(delay, jitter, workers)
+            task.SetEngines([engine])
+            latencies = []
+            startTicks = {}
+            state = {"submit": 0}
+
+            def Submit():
+                index = state["submit"]
+                state["submit"] += 1
+                tick = time.perf_counter()
+                taskId = task.AddConvertTask(corpus[index], {"scale": 2}, Back, cleanFlag="Bench")
+                startTicks[taskId] = tick
+
+            def Back(data, taskId, backParam, tick):
+                latencies.append(time.perf_counter() - startTicks.pop(taskId))
+                if state["submit"] < num:
+                    Submit()
+
+            tick = time.perf_counter()
+            for _ in range(min(depth, num)):
+                Submit()
+            end = time.time() + timeout
+            while len(latencies) < num and time.time() < end:
+                app.processEvents()
+            tick = time.perf_counter() - tick
+            task.SetEngines(oldEngines)
+            engine.Stop()
+            if len(latencies) < num:
+                raise TimeoutError("depth {}: {}/{} tasks done".format(depth, len(latencies), num))
+
+            prefix = "task.depth{}".format(depth)
+            AddMetric(results, prefix + ".throughput", num / tick, "task/s", "higher")
+            for percent in (50, 95, 99):
+                AddMetric(results, "{}.p{}".format(prefix, percent), GetPercentile(latencies, percent) * 1000, "ms",
+                          threshold=TailThreshold if percent >= 99 else 0)
+    finally:
+        task.SetEngines(oldEngines)
+        config.IsCacheConvert = oldCache
+    return results
+
+
+def Measure(fn, items, repeat):
+    """repeat次中最快一次的每次调用耗时（微秒）"""
+    best = None
+    for _ in range(repeat):
+        tick = time.perf_counter()
+        for item in items:
+            fn(item)
+        tick = time.perf_counter() - tick
+        best = tick if best is None else min(best, tick)
+    return best / len(items) * 1e6
+
+
+def Calibrate(num=20000, repeat=5):
+    """一段固定的纯Python代码的耗时（微秒），代表机器当时的速度"""
+    return Measure(lambda i: sum(ord(c) for c in "{:08x}".format(i * 2654435761 % 4294967296)), range(num), repeat)
+
+
+def RunProbe(num=500, repeat=5):
+    """ToolUtil解析文件头的耗时，图片为PNG/JPEG/WEBP，一半带有转换参数"""
+    from src.util.tool import ToolUtil
+    rand = random.Random(1)
+    corpus = []
+    for i in range(num):
+        picFormat = ("PNG", "JPEG", "WEBP")[i % 3]
+        text = "MODEL_CUNET_NOISE3\0scale=2" if i % 2 and picFormat != "WEBP" else ""
+        corpus.append(MakeImage(rand.randint(16, 256), rand.randint(16, 256), i + 1, picFormat, text))
+    results = {}
+    AddMetric(results, "probe.format", Measure(ToolUtil.GetPictureFormat, corpus, repeat), "us", isCpu=True)
+    AddMetric(results, "probe.size", Measure(ToolUtil.GetPictureSize, corpus, repeat), "us", isCpu=True)
+    AddMetric(results, "probe.dataModel", Measure(ToolUtil.GetDataModel, corpus, repeat), "us", isCpu=True)
+    AddMetric(results, "calibrate", Calibrate(repeat=repeat), "us", "none")
+    return results
+
+
+def RunModel(num=10000, repeat=5):
+    """选择模型的耗时：QtImg拼接模型名，以及下载、浏览时按尺寸选择模型"""
+    from src.util.tool import ToolUtil
+    rand = random.Random(1)
+    names = [(name, noise, isNoScale, isTTA) for name in ("CUNET", "PHOTO", "ANIME_STYLE_ART_RGB")
+             for noise in (-1, 0, 1, 2, 3) for isNoScale in (False, True) for isTTA in (False, True)]
+    sizes = [(rand.randint(100, 6000), rand.randint(100, 6000)) for _ in range(num)]
+    results = {}
+    AddMetric(results, "model.name", Measure(lambda args: ToolUtil.GetModelName(*args), names * 50, repeat), "us", isCpu=True)
+    AddMetric(results, "model.scaleNoise", Measure(lambda size: ToolUtil.GetScaleAndNoise(*size), sizes, repeat), "us",
+              isCpu=True)
+    AddMetric(results, "calibrate", Calibrate(repeat=repeat), "us", "none")
+    try:
+        import waifu2x_vulkan
+    except ImportError:
+        # 按尺寸选择模型需要读取waifu2x_vulkan中的模型常量
+        return results
+    AddMetric(results, "model.download", Measure(lambda size: ToolUtil.GetDownloadScaleModel(*size), sizes, repeat), "us",
+              isCpu=True)
+    return results
+
+
+def RunShow(app, sizes=((800, 1200), (2400, 3600), (6000, 9000)), repeat=3, viewSize=(1280, 800), timeout=60):
+    """
+    从提交解码到第一次绘制完成的耗时：在不显示的窗口中直接使用QtImg，
+    QtImg._ShowImg提交后台解码，AddPyramidBack回到主线程显示金字塔后，同步绘制一次视图
+    每个尺寸取repeat次的中位数
+    """
+    from src.qt.com.qtimg import QtImg
+
+    widget = QtImg()
+    widget.resize(*viewSize)
+    widget.show()
+    app.processEvents()
+    results = {}
+    try:
+        for w, h in sizes:
+            data = MakeImage(w, h, 1, "JPEG")
+            ticks = []
+            for _ in range(repeat):
+                oldPyramid = widget.pyramid
+                tick = time.perf_counter()
+                widget._ShowImg(data)
+                end = time.time() + timeout
+                while widget.decodeId and time.time() < end:
+                    app.processEvents()
+                if widget.pyramid is oldPyramid or widget.pyramid.size != (w, h):
+                    raise RuntimeError("decode {}x{} fail".format(w, h))
+                # grab同步绘制视口，包括分块图片的绘制
+                widget.graphicsView.viewport().grab()
+                ticks.append(time.perf_counter() - tick)
+            AddMetric(results, "show.{}x{}".format(w, h), statistics.median(ticks) * 1000, "ms")
+    finally:
+        widget.decoder.Stop()
+        widget.close()
+    return results
+
+
+def RunSection(app, section, depths, num, delay, jitter, workers):
+    if section == "task":
+        return RunTask(app, depths, num, delay, jitter, workers)
+    elif section == "probe":
+        return RunProbe()
+    elif section == "model":
+        return RunModel()
+    elif section == "show":
+        return RunShow(app)
+    return {}
+
+
+def Summarize(samples):
+    """每个项目的多次结果合并为中位数，stdev为标准差，与基线比较时作为噪声"""
+    results = {}
+    for name, (info, values) in samples.items():
+        results[name] = dict(info, value=statistics.median(values),
+                             stdev=statistics.stdev(values) if len(values) > 1 else 0, rounds=len(values))
+    return results
+
+
+def RunSuite(app, sections=Sections, depths=(1, 8, 64), num=2000, delay=0.002, jitter=0.001, workers=4, rounds=5):
+    """
+    运行选中的测试，每个测试重复rounds次，每次之后记录一次峰值内存，可以看出内存在哪一步增长
+    返回每个项目的中位数和标准差
+    """
+    samples = {}    # {name: (info, [value])}
+    for section in sections:
+        for _ in range(max(1, rounds)):
+            results = RunSection(app, section, depths, num, delay, jitter, workers)
+            AddMetric(results, "rss.{}".format(section), GetPeakRss(), "MB")
+            for name, info in results.items():
+                samples.setdefault(name, (info, []))[1].append(info["value"])
+    results = Summarize(samples)
+    AddMetric(results, "rss.peak", GetPeakRss(), "MB")
+    return results
+
+
+def GetMeta(args):
+    from PySide6 import __version__ as qtVersion
+    from conf import config
+    return {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "qt": qtVersion,
+        "platform": platform.platform(),
+        "cpu": os.cpu_count(),
+        "args": args,
+        "config": {"TileSize": config.TileSize, "PreviewLevelSize": config.PreviewLevelSize,
+                   "ViewTileSize": config.ViewTileSize, "IsMetrics": config.IsMetrics},
+    }
+
+
+def Save(path, meta, results):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2, ensure_ascii=False)
+
+
+def Load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def Compare(baseline, results, threshold=0.1, noise=3):
+    """
+    与基线比较，返回[(名字, 基线值, 当前值, 变化比例, 状态)]
+    变化比例为正表示变好；变差超过阈值时状态为"regression"，变好超过阈值时为"improved"
+    阈值为threshold和项目自己的threshold中较大的一个，并且变化的绝对值还要超过两边标准差中较大的一个的noise倍，
+    同一份代码多次运行的波动不算回归
+    纯计算的项目先按两边calibrate的比例换算成基线时机器的速度，再计算变化比例
+    只在一边出现的项目状态为"new"或"missing"，不算回归
+    """
+    speed = 1
+    if baseline.get("calibrate", {}).get("value") and results.get("calibrate", {}).get("value"):
+        speed = results["calibrate"]["value"] / baseline["calibrate"]["value"]
+    rows = []
+    for name in sorted(set(baseline) | set(results)):
+        if name not in baseline:
+            rows.append((name, None, results[name]["value"], 0, "new"))
+            continue
+        if name not in results:
+            rows.append((name, baseline[name]["value"], None, 0, "missing"))
+            continue
+        old, new = baseline[name]["value"], results[name]["value"]
+        if baseline[name].get("better", "lower") == "none":
+            rows.append((name, old, new, 0, ""))
+            continue
+        ratio = speed if baseline[name].get("cpu") else 1
+        new, stdev = new / ratio, results[name].get("stdev", 0) / ratio
+        if old:
+            change = (new - old) / old
+        else:
+            change = 0 if not new else float("inf")
+        if baseline[name].get("better", "lower") == "lower":
+            change = -change
+        limit = max(threshold, baseline[name].get("threshold", 0))
+        isNoise = abs(new - old) <= noise * max(baseline[name].get("stdev", 0), stdev)
+        status = ""
+        if change < -limit and not isNoise:
+            status = "regression"
+        elif change > limit and not isNoise:
+            status = "improved"
+        rows.append((name, old, results[name]["value"], change, status))
+    return rows
+
+
+def FormatResults(results):
+    width = max([len(name) for name in results] + [4])
+    return "\n".join("{:<{}} {:>12.3f} ±{:<10.3f} {}".format(name, width, info["value"], info.get("stdev", 0),
+                                                            info["unit"])
+                     for name, info in results.items())
+
+
+def FormatCompare(rows):
+    width = max([len(row[0]) for row in rows] + [4])
+    lines = ["{:<{}} {:>12} {:>12} {:>8}".format("name", width, "baseline", "current", "change")]
+    for name, old, new, change, status in rows:
+        lines.append("{:<{}} {:>12} {:>12} {:>+7.1%} {}".format(
+            name, width, "-" if old is None else "{:.3f}".format(old),
+            "-" if new is None else "{:.3f}".format(new), change, status).rstrip())
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="转换流程性能基准")
+    parser.add_argument("--only", nargs="+", choices=Sections, default=list(Sections), help="只运行部分测试")
+    parser.add_argument("--depth", nargs="+", type=int, default=[1, 8, 64], help="QtTask的队列深度")
+    parser.add_argument("-n", "--num", type=int, default=2000, help="每个队列深度完成的任务数")
+    parser.add_argument("--delay", type=float, default=2, help="模拟引擎每个任务的耗时（毫秒）")
+    parser.add_argument("--jitter", type=float, default=1, help="模拟引擎耗时的标准差（毫秒）")
+    parser.add_argument("--workers", type=int, default=4, help="模拟引擎的线程数")
+    parser.add_argument("-o", "--output", default="", help="结果保存为JSON基线")
+    parser.add_argument("--compare", default="", help="与JSON基线比较，有回归时返回1")
+    parser.add_argument("--threshold", type=float, default=0.1, help="变差超过该比例时视为回归")
+    parser.add_argument("--noise", type=float, default=3, help="变化不超过标准差的多少倍时视为噪声")
+    parser.add_argument("--rounds", type=int, default=5, help="每个测试重复的次数，结果取中位数")
+    args = parser.parse_args()
+
+    from PySide6.QtWidgets import QApplication
+    from src.util import Log
+    app = QApplication(sys.argv)
+    # 每个任务都会打印日志，测试时只保留错误
+    Log.logger.setLevel(logging.ERROR)
+
+    results = RunSuite(app, args.only, args.depth, args.num, args.delay / 1000, args.jitter / 1000, args.workers,
+                       args.rounds)
+    print(FormatResults(results))
+    if args.output:
+        Save(args.output, GetMeta(vars(args)), results)
+    if args.compare:
+        rows = Compare(Load(args.compare)["results"], results, args.threshold, args.noise)
+        print()
+        print(FormatCompare(rows))
+        regressions = [row[0] for row in rows if row[4] == "regression"]
+        if regressions:
+            print("\nregression: " + ", ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""
+压力测试：任务登记表
+多个线程同时提交、取消、完成大量任务，统计吞吐量以及丢失和重复的回调
+
+运行：
+    python -m tests.benchmark.stress_registry                 # 只测试TaskRegistry
+    python -m tests.benchmark.stress_registry --qt -n 100000  # 通过QtTask完整地跑一遍
+"""
+import argparse
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+
+class StressResult(object):
+    def __init__(self, num, tick, doneIds, cancelIds):
+        self.num = num
+        self.tick = tick
+        doneCount = Counter(doneIds)
+        cancelCount = Counter(cancelIds)
+        self.doneNum = len(doneCount)
+        self.cancelNum = len(cancelCount)
+        # 同一个任务回调了多次，或者既回调又取消
+        self.dupNum = sum(n - 1 for n in doneCount.values()) + sum(n - 1 for n in cancelCount.values()) + \
+            len(doneCount.keys() & cancelCount.keys())
+        # 既没有回调也没有取消
+        self.lostNum = num - len(doneCount.keys() | cancelCount.keys())
+        # 结束后还留在登记表中的任务
+        self.leftNum = 0
+
+    def __str__(self):
+        return "tasks:{}, done:{}, cancel:{}, lost:{}, dup:{}, left:{}, tick:{:.3f}s, {:.0f} tasks/s".format(
+            self.num, self.doneNum, self.cancelNum, self.lostNum, self.dupNum, self.leftNum, self.tick,
+            self.num / self.tick)
+
+
+def RunRegistry(num=300000, threadNum=4, cancelRate=0.3):
+    """
+    threadNum个线程提交任务，threadNum个线程完成任务，一个线程随机取消任务
+    完成和取消同时竞争同一个任务，每个任务最终只能有一个结果
+    """
+    from src.util.registry import TaskRegistry, TaskState
+
+    class Task(object):
+        state = TaskState.Wait
+
+    registry = TaskRegistry()
+    pending = queue.Queue()
+    doneIds, cancelIds = [], []
+    isSubmitEnd = threading.Event()
+
+    def Submit(count):
+        for i in range(count):
+            taskId = registry.NewId()
+            registry.Add(taskId, Task(), "group{}".format(i % 8))
+            pending.put(taskId)
+
+    def Complete():
+        while True:
+            try:
+                taskId = pending.get(timeout=0.05)
+            except queue.Empty:
+                if isSubmitEnd.is_set():
+                    return
+                continue
+            if registry.Transit(taskId, TaskState.Done):
+                doneIds.append(taskId)
+
+    def Cancel():
+        rand = random.Random(1)
+        while not isSubmitEnd.is_set() or registry.Size():
+            taskId = rand.randint(1, max(1, registry.lastId))
+            if rand.random() < cancelRate and registry.Transit(taskId, TaskState.Cancel):
+                cancelIds.append(taskId)
+            for group in ("group0", "group1"):
+                if rand.random() < cancelRate * 0.001:
+                    for taskId in registry.PopGroup(group):
+                        if registry.Transit(taskId, TaskState.Cancel):
+                            cancelIds.append(taskId)
+
+    tick = time.perf_counter()
+    submitters = [threading.Thread(target=Submit, args=(num // threadNum + (i < num % threadNum),))
+                  for i in range(threadNum)]
+    workers = [threading.Thread(target=Complete) for _ in range(threadNum)] + [threading.Thread(target=Cancel)]
+    for t in submitters + workers:
+        t.start()
+    for t in submitters:
+        t.join()
+    isSubmitEnd.set()
+    for t in workers:
+        t.join()
+    result = StressResult(num, time.perf_counter() - tick, doneIds, cancelIds)
+    result.leftNum = registry.Size() + sum(len(ids) for ids in registry.groups.values())
+    return result
+
+
+class InstantEngine(object):
+    """提交后立即返回原数据的引擎"""
+    Name = "instant"
+
+    def __init__(self):
+        self._outQueue = queue.Queue()
+
+    def Capabilities(self):
+        return {"name": self.Name, "workers": 64}
+
+    def Submit(self, taskId, imgData, model):
+        self._outQueue.put((imgData, 1, taskId, 0))
+        return 1
+
+    def Collect(self):
+        return self._outQueue.get()
+
+    def Cancel(self, taskIds):
+        pass
+
+    def Stop(self):
+        self._outQueue.put(None)
+
+
+def RunQtTask(app, num=100000, threadNum=4, cancelRate=0.3, timeout=600):
+    """
+    threadNum个线程通过AddConvertTask提交任务，一个线程随机取消任务，
+    主线程处理回调，直到所有任务都有了结果
+    """
+    from conf import config
+    from src.qt.util.qttask import QtTask
+
+    task = QtTask()
+    task.WaitEngines()
+    oldEngines, oldCache = task.engines, config.IsCacheConvert
+    engine = InstantEngine()
+    task.SetEngines([engine])
+    config.IsCacheConvert = False
+
+    doneIds, cancelIds, allIds = [], [], []
+    submitIds = queue.Queue()
+    isSubmitEnd = threading.Event()
+
+    def Back(data, taskId, backParam, tick):
+        doneIds.append(taskId)
+
+    def Submit(index, count):
+        for i in range(count):
+            taskId = task.AddConvertTask("{}-{}".format(index, i).encode(), {"scale": 2}, Back,
+                                         cleanFlag="Stress{}".format(i % 8))
+            submitIds.put(taskId)
+            allIds.append(taskId)
+
+    def Cancel():
+        rand = random.Random(1)
+        while not isSubmitEnd.is_set() or not submitIds.empty():
+            try:
+                taskId = submitIds.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            if rand.random() < cancelRate and task.CancelTask(taskId):
+                cancelIds.append(taskId)
+
+    tick = time.perf_counter()
+    try:
+        submitters = [threading.Thread(target=Submit, args=(i, num // threadNum + (i < num % threadNum)))
+                      for i in range(threadNum)]
+        canceller = threading.Thread(target=Cancel)
+        for t in submitters + [canceller]:
+            t.start()
+        end = time.time() + timeout
+        while time.time() < end:
+            app.processEvents()
+            if not any(t.is_alive() for t in submitters):
+                isSubmitEnd.set()
+                if not canceller.is_alive() and len(doneIds) + len(cancelIds) >= num:
+                    break
+        app.processEvents()
+        isSubmitEnd.set()
+        canceller.join()
+        result = StressResult(num, time.perf_counter() - tick, doneIds, cancelIds)
+        result.leftNum = sum(1 for taskId in allIds if task.registry.Get(taskId))
+        return result
+    finally:
+        task.SetEngines(oldEngines)
+        engine.Stop()
+        config.IsCacheConvert = oldCache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="任务登记表压力测试")
+    parser.add_argument("-n", "--num", type=int, default=0, help="任务数")
+    parser.add_argument("-t", "--threads", type=int, default=4, help="提交线程数")
+    parser.add_argument("--cancel", type=float, default=0.3, help="取消比例")
+    parser.add_argument("--qt", action="store_true", help="通过QtTask测试")
+    args = parser.parse_args()
+
+    if args.qt:
+        from PySide6.QtCore import QCoreApplication
+        from src.util import Log
+        app = QCoreApplication(sys.argv)
+        # 每个任务都会打印日志，压力测试时只保留错误
+        Log.logger.setLevel(logging.ERROR)
+        result = RunQtTask(app, args.num or 100000, args.threads, args.cancel)
+    else:
+        result = RunRegistry(args.num or 300000, args.threads, args.cancel)
+    print(result)
+    return 1 if result.lostNum or result.dupNum or result.leftNum else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -40,11 +40,32 @@ def mock_config():
     """
     from conf import config
     original_can_waifu2x = config.CanWaifu2x
+    original_is_cache_convert = config.IsCacheConvert
+    original_tile_size = config.TileSize
+    original_progress_interval = config.ProgressInterval
+    original_preview_level_size = config.PreviewLevelSize
+    original_preview_full_scale = config.PreviewFullScale
+    original_image_allocation_limit = config.ImageAllocationLimit
+    original_log = (config.LogFileSize, config.LogFileNum, config.LogRateNum, config.LogRateInterval)
+    original_trace_max_events = config.TraceMaxEvents
+    original_is_metrics = config.IsMetrics
+    original_device = (config.SelectEncodeGpu, config.EncodeGpu, config.Encode, config.UseCpuNum)
     
     # 设置测试配置
     config.CanWaifu2x = False  # 测试时禁用GPU，避免依赖硬件
+    config.IsCacheConvert = False  # 测试时不读写转换缓存，避免测试之间互相影响
     
     yield config
     
     # 恢复原始配置
     config.CanWaifu2x = original_can_waifu2x
+    config.IsCacheConvert = original_is_cache_convert
+    config.TileSize = original_tile_size
+    config.ProgressInterval = original_progress_interval
+    config.PreviewLevelSize = original_preview_level_size
+    config.PreviewFullScale = original_preview_full_scale
+    config.ImageAllocationLimit = original_image_allocation_limit
+    config.LogFileSize, config.LogFileNum, config.LogRateNum, config.LogRateInterval = original_log
+    config.TraceMaxEvents = original_trace_max_events
+    config.IsMetrics = original_is_metrics
+    config.SelectEncodeGpu, config.EncodeGpu, config.Encode, config.UseCpuNum = original_device
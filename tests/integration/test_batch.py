@@ -0,0 +1,201 @@
+"""
+集成测试：批量转换
+使用CPU引擎把一个目录树完整地跑一遍 读取 -> 转换 -> 写入
+"""
+import os
+import shutil
+import time
+
+import pytest
+
+pytest.importorskip("PIL")
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), "..", "test_data")
+
+
+def wait_finish(qapp, batch, timeout=30):
+    finished = []
+    batch.finishBack.connect(lambda: finished.append(True))
+    batch.Start()
+    end = time.time() + timeout
+    while not finished and time.time() < end:
+        qapp.processEvents()
+        time.sleep(0.005)
+    qapp.processEvents()
+    return bool(finished)
+
+
+@pytest.fixture
+def image_tree(tmp_path):
+    src = tmp_path / "input"
+    (src / "sub").mkdir(parents=True)
+    for i in range(3):
+        shutil.copy(os.path.join(TEST_DATA, "sample.jpg"), src / "img{}.jpg".format(i))
+        shutil.copy(os.path.join(TEST_DATA, "sample.png"), src / "sub" / "img{}.png".format(i))
+    (src / "readme.txt").write_text("not an image")
+    return src
+
+
+class TestWalkImages:
+    """测试目录遍历"""
+
+    def test_walk_is_lazy_and_filtered(self, image_tree):
+        """测试只产出图片文件，并且是生成器"""
+        from src.qt.util.qtbatch import WalkImages
+
+        walker = WalkImages(str(image_tree))
+        first = next(walker)
+        rest = list(walker)
+
+        names = sorted(os.path.basename(p) for p in [first] + rest)
+        assert names == ["img0.jpg", "img0.png", "img1.jpg", "img1.png", "img2.jpg", "img2.png"]
+
+    def test_walk_not_recursive(self, image_tree):
+        """测试不递归子目录"""
+        from src.qt.util.qtbatch import WalkImages
+
+        assert len(list(WalkImages(str(image_tree), recursive=False))) == 3
+
+    def test_walk_skip_path(self, image_tree):
+        """测试不进入跳过的目录"""
+        from src.qt.util.qtbatch import WalkImages
+
+        names = [os.path.basename(p) for p in WalkImages(str(image_tree), skipPath=str(image_tree / "sub"))]
+        assert sorted(names) == ["img0.jpg", "img1.jpg", "img2.jpg"]
+
+
+class TestBatchConvert:
+    """测试批量转换流程"""
+
+    def test_convert_tree(self, qapp, mock_config, image_tree, tmp_path):
+        """测试整个目录树被转换并保持目录结构"""
+        from src.qt.util.qtbatch import QtBatch
+
+        out = tmp_path / "output"
+        results = []
+        batch = QtBatch(str(image_tree), str(out), {"scale": 0.5, "format": "png"}, maxInFlight=2)
+        batch.fileBack.connect(lambda src, dst, isOk: results.append(isOk))
+
+        assert wait_finish(qapp, batch)
+        assert batch.okNum == 6
+        assert batch.failNum == 0
+        assert all(results) and len(results) == 6
+        assert (out / "img0.png").is_file()
+        assert (out / "sub" / "img2.png").is_file()
+        assert not list(out.rglob("*.tmp"))
+
+    def test_output_inside_input(self, qapp, mock_config, image_tree):
+        """测试输出目录在输入目录中时，不会转换刚写出的文件"""
+        from src.qt.util.qtbatch import QtBatch
+
+        out = image_tree / "output"
+        out.mkdir()
+        batch = QtBatch(str(image_tree), str(out), {"scale": 0.5, "format": "png"}, maxInFlight=2)
+
+        assert wait_finish(qapp, batch)
+        assert batch.okNum == 6
+        assert not (out / "output").exists()
+
+    def test_output_name_conflict(self, qapp, mock_config, tmp_path):
+        """测试同名不同扩展名的源文件输出到不同的文件，重新运行时输出路径不变"""
+        from src.qt.util.qtbatch import QtBatch
+
+        src = tmp_path / "input"
+        src.mkdir()
+        shutil.copy(os.path.join(TEST_DATA, "sample.jpg"), src / "a.jpg")
+        shutil.copy(os.path.join(TEST_DATA, "sample.png"), src / "a.png")
+        out = tmp_path / "output"
+        model = {"scale": 0.5, "format": "png"}
+
+        results = []
+        batch = QtBatch(str(src), str(out), model, maxInFlight=2)
+        batch.fileBack.connect(lambda s, dst, isOk: results.append((os.path.basename(s), os.path.basename(dst))))
+        assert wait_finish(qapp, batch)
+        assert sorted(results) == [("a.jpg", "a.png"), ("a.png", "a_png.png")]
+        assert batch.okNum == 2
+
+        batch = QtBatch(str(src), str(out), model, maxInFlight=2)
+        assert wait_finish(qapp, batch)
+        assert batch.skipNum == 2
+
+    def test_skip_existing_outputs(self, qapp, mock_config, image_tree, tmp_path):
+        """测试已存在的输出被跳过"""
+        from src.qt.util.qtbatch import QtBatch
+
+        out = tmp_path / "output"
+        out.mkdir()
+        (out / "img0.jpg").write_bytes(b"done")
+
+        batch = QtBatch(str(image_tree), str(out), {"scale": 0.5, "format": "jpg"}, maxInFlight=3)
+
+        assert wait_finish(qapp, batch)
+        assert batch.skipNum == 1
+        assert batch.okNum == 5
+        assert (out / "img0.jpg").read_bytes() == b"done"
+
+    def test_resume_from_journal(self, qapp, mock_config, image_tree, tmp_path):
+        """测试有日志时只重新转换没有完成或者输出校验失败的文件"""
+        from src.qt.util.qtbatch import QtBatch
+        from src.util.journal import JobJournal
+
+        out = tmp_path / "output"
+        journalPath = str(tmp_path / "batch.journal")
+        model = {"scale": 0.5, "format": "png"}
+        batch = QtBatch(str(image_tree), str(out), model, maxInFlight=2, journalPath=journalPath)
+        assert wait_finish(qapp, batch)
+        assert batch.okNum == 6
+
+        # 模拟中途退出：一个文件只有提交记录，一个输出被删除，一个输出被改写
+        journal = JobJournal(journalPath)
+        journal.Submit(str(image_tree / "img0.jpg"), str(out / "img0.png"), model)
+        journal.Close()
+        (out / "sub" / "img1.png").unlink()
+        (out / "img2.png").write_bytes(b"broken")
+
+        batch = QtBatch(str(image_tree), str(out), model, maxInFlight=2, journalPath=journalPath)
+        assert batch.resumeNum == 1
+        converted = []
+        batch.fileBack.connect(lambda src, dst, isOk: converted.append(os.path.basename(dst)))
+        assert wait_finish(qapp, batch)
+
+        assert sorted(converted) == ["img0.png", "img1.png", "img2.png"]
+        assert batch.skipNum == 3
+        assert (out / "img2.png").read_bytes() != b"broken"
+        assert not JobJournal(journalPath).GetUnfinished()
+
+    def test_retry_failed(self, qapp, mock_config, image_tree, tmp_path):
+        """测试日志中失败的文件默认跳过，retryFailed时重新转换"""
+        from src.qt.util.qtbatch import QtBatch
+        from src.util.journal import JobJournal
+
+        out = tmp_path / "output"
+        journalPath = str(tmp_path / "batch.journal")
+        model = {"scale": 0.5, "format": "png"}
+        journal = JobJournal(journalPath)
+        journal.Fail(str(image_tree / "img1.jpg"), str(out / "img1.png"), model)
+        journal.Close()
+
+        batch = QtBatch(str(image_tree), str(out), model, maxInFlight=2, journalPath=journalPath)
+        assert wait_finish(qapp, batch)
+        assert batch.skipNum == 1
+        assert not (out / "img1.png").exists()
+
+        batch = QtBatch(str(image_tree), str(out), model, maxInFlight=2, journalPath=journalPath, retryFailed=True)
+        assert wait_finish(qapp, batch)
+        assert batch.okNum == 1
+        assert batch.skipNum == 5
+        assert (out / "img1.png").is_file()
+
+
+class TestBatchArgs:
+    """测试命令行参数"""
+
+    def test_journal_args(self):
+        """测试日志和重试失败的参数"""
+        from batch import ParseArgs
+
+        args = ParseArgs(["in", "out"])
+        assert args.journal == "" and not args.retryFailed
+
+        args = ParseArgs(["in", "out", "--journal", "batch.journal", "--retry-failed"])
+        assert args.journal == "batch.journal" and args.retryFailed
@@ -343,3 +343,51 @@ class TestTaskCancellation:
         assert 6001 not in task_manager.convertLoad
         assert 6002 not in task_manager.convertLoad
         assert clean_flag not in task_manager.convertFlag
+
+
+class TestPartialDisplay:
+    """测试分块转换的部分结果显示"""
+
+    def test_hide_result_drops_partial(self, qapp, mock_config):
+        """测试转换期间关闭显示结果后，部分结果不再画到重新生成的原图金字塔上"""
+        import os
+        from PySide6.QtCore import QBuffer, QIODevice
+        from PySide6.QtGui import QColor, QImage
+        from src.qt.com.qtimg import QtImg
+
+        def wait(check, timeout=10):
+            end = time.time() + timeout
+            while not check() and time.time() < end:
+                qapp.processEvents()
+                time.sleep(0.005)
+            return check()
+
+        path = os.path.join(os.path.dirname(__file__), "..", "test_data", "sample.png")
+        with open(path, "rb") as f:
+            data = f.read()
+        widget = QtImg()
+        widget.ShowImg(data)
+        assert wait(lambda: widget.pyramid)
+        oldPyramid = widget.pyramid
+
+        # 模拟收到一块红色的部分结果
+        tile = QImage(64, 64, QImage.Format_RGB32)
+        tile.fill(QColor(255, 0, 0))
+        buffer = QBuffer()
+        buffer.open(QIODevice.WriteOnly)
+        tile.save(buffer, "PNG")
+        widget.checkBox.setChecked(True)
+        widget._AddConvertPartial([(0, 0, bytes(buffer.data()))], (1201, 503))
+        assert widget.partialRegions
+
+        widget.checkBox.click()
+        assert not widget.checkBox.isChecked()
+        assert widget.partialRegions is None and not widget.regionIds
+        assert wait(lambda: widget.pyramid is not oldPyramid)
+        # 等待可能重新提交的部分结果画完
+        assert wait(lambda: not widget.regionIds)
+
+        widget.AddConvertBack(data, 0, None, 0)
+        assert wait(lambda: not widget.decodeId)
+        level = min(widget.pyramid.levels)
+        assert widget.pyramid.levels[level].pixelColor(1, 1) != QColor(255, 0, 0)
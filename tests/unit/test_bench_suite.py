@@ -0,0 +1,90 @@
+"""
+单元测试：性能基准工具
+测试与基线比较时按方向判断回归，以及模拟引擎的延迟和取消
+"""
+import time
+
+from tests.benchmark.bench_suite import Compare, LatencyEngine, Load, Save, Summarize
+
+
+def metric(value, better="lower", **kwargs):
+    return dict({"value": value, "unit": "ms", "better": better}, **kwargs)
+
+
+class TestCompare:
+    """测试与基线比较"""
+
+    def test_direction_and_threshold(self):
+        """测试耗时变大、吞吐量变小超过阈值时为回归，阈值以内不标记"""
+        baseline = {"latency": metric(10), "throughput": metric(100, "higher"),
+                    "small": metric(10), "faster": metric(10)}
+        results = {"latency": metric(12), "throughput": metric(80, "higher"),
+                   "small": metric(10.5), "faster": metric(5)}
+        rows = {row[0]: row for row in Compare(baseline, results, 0.1)}
+        assert rows["latency"][4] == "regression"
+        assert rows["throughput"][4] == "regression"
+        assert rows["small"][4] == ""
+        assert rows["faster"][4] == "improved" and rows["faster"][3] == 0.5
+
+    def test_new_and_missing(self):
+        """测试只在一边出现的项目不算回归"""
+        rows = {row[0]: row[4] for row in Compare({"old": metric(1)}, {"new": metric(1)})}
+        assert rows == {"old": "missing", "new": "new"}
+
+    def test_noise(self):
+        """测试变化没有超过标准差的noise倍时不算回归，项目自己的阈值更宽时使用自己的阈值"""
+        baseline = {"noisy": metric(10, stdev=1), "stable": metric(10, stdev=0.1), "p99": metric(10, threshold=0.3)}
+        results = {"noisy": metric(12, stdev=0.5), "stable": metric(12, stdev=0.1), "p99": metric(12)}
+        rows = {row[0]: row[4] for row in Compare(baseline, results, 0.1, noise=3)}
+        assert rows == {"noisy": "", "stable": "regression", "p99": ""}
+
+    def test_calibrate(self):
+        """测试机器整体变慢时纯计算的项目按calibrate换算，不算回归"""
+        baseline = {"calibrate": metric(1, "none"), "probe": metric(10, cpu=True), "task": metric(10)}
+        results = {"calibrate": metric(2, "none"), "probe": metric(20, cpu=True), "task": metric(20)}
+        rows = {row[0]: row for row in Compare(baseline, results)}
+        assert rows["calibrate"][4] == ""
+        assert rows["probe"][4] == "" and rows["probe"][2] == 20
+        assert rows["task"][4] == "regression"
+
+    def test_summarize(self):
+        """测试多次结果合并为中位数和标准差"""
+        results = Summarize({"latency": (metric(0), [3, 1, 2])})
+        assert results["latency"]["value"] == 2
+        assert results["latency"]["stdev"] == 1
+        assert results["latency"]["rounds"] == 3
+
+    def test_save_load(self, tmp_path):
+        path = str(tmp_path / "bench" / "baseline.json")
+        Save(path, {"python": "3"}, {"latency": metric(1.5)})
+        assert Load(path)["results"]["latency"]["value"] == 1.5
+
+
+class TestLatencyEngine:
+    """测试模拟引擎"""
+
+    def test_delay_and_cancel(self):
+        """测试每个任务至少耗时delay，取消的任务不返回"""
+        engine = LatencyEngine(delay=0.02, workers=1)
+        try:
+            tick = time.perf_counter()
+            engine.Submit(1, b"a", {})
+            engine.Submit(2, b"b", {})
+            engine.Cancel([2])
+            engine.Submit(3, b"c", {})
+            results = [engine.Collect(), engine.Collect()]
+            assert time.perf_counter() - tick >= 0.04
+            assert [(data, taskId) for data, sts, taskId, _ in results] == [(b"a", 1), (b"c", 3)]
+        finally:
+            engine.Stop()
+
+    def test_jitter_reproducible(self):
+        """测试相同种子的延迟序列相同"""
+        engines = [LatencyEngine(delay=0.01, jitter=0.005, workers=1, seed=7) for _ in range(2)]
+        try:
+            delays = [[engine.GetDelay() for _ in range(20)] for engine in engines]
+            assert delays[0] == delays[1]
+            assert len(set(delays[0])) > 1 and min(delays[0]) >= 0
+        finally:
+            for engine in engines:
+                engine.Stop()
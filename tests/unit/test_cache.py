@@ -0,0 +1,170 @@
+"""
+单元测试：转换结果缓存
+测试key规范化、LRU淘汰、重启后索引恢复以及QtTask的缓存命中
+"""
+import os
+import time
+from unittest.mock import Mock
+
+from src.util.cache import ConvertCache
+
+
+class TestCacheKey:
+    """测试缓存key"""
+
+    def test_same_input_same_key(self):
+        """测试规范化后等价的参数得到相同的key"""
+        key1 = ConvertCache.GetKey(b"img", {"model": 1, "scale": 2, "format": "jpeg"})
+        key2 = ConvertCache.GetKey(b"img", {"model": 1, "scale": 2.0, "format": "JPG", "index": 3})
+
+        assert key1 == key2
+
+    def test_different_input_different_key(self):
+        """测试数据、参数或引擎不同时key不同"""
+        base = ConvertCache.GetKey(b"img", {"model": 1, "scale": 2, "format": "jpg"})
+
+        assert base != ConvertCache.GetKey(b"img2", {"model": 1, "scale": 2, "format": "jpg"})
+        assert base != ConvertCache.GetKey(b"img", {"model": 2, "scale": 2, "format": "jpg"})
+        assert base != ConvertCache.GetKey(b"img", {"model": 1, "scale": 3, "format": "jpg"})
+        assert base != ConvertCache.GetKey(b"img", {"model": 1, "scale": 2, "format": "png"})
+        assert base != ConvertCache.GetKey(b"img", {"model": 1, "scale": 2, "format": "jpg"}, "cpu")
+
+    def test_fixed_size_key(self):
+        """测试固定宽高模式使用宽高参与计算"""
+        key1 = ConvertCache.GetKey(b"img", {"model": 1, "width": 100, "high": 200})
+        key2 = ConvertCache.GetKey(b"img", {"model": 1, "width": 200, "high": 100})
+
+        assert key1 != key2
+
+
+class TestConvertCache:
+    """测试缓存读写"""
+
+    def test_put_and_get(self, tmp_path):
+        """测试写入后可以读出"""
+        cache = ConvertCache(str(tmp_path), 1024)
+        cache.Put("ab01", b"result")
+
+        assert cache.Has("ab01")
+        assert cache.Get("ab01") == b"result"
+        assert cache.Get("cd02") is None
+
+    def test_lru_eviction(self, tmp_path):
+        """测试超过上限时淘汰最久未使用的结果"""
+        cache = ConvertCache(str(tmp_path), 250)
+        cache.Put("aa01", b"a" * 100)
+        cache.Put("bb02", b"b" * 100)
+        cache.Get("aa01")
+        cache.Put("cc03", b"c" * 100)
+
+        assert cache.Has("aa01")
+        assert not cache.Has("bb02")
+        assert cache.Has("cc03")
+        assert cache.Size() == 200
+        assert not os.path.isfile(os.path.join(str(tmp_path), "bb", "bb02"))
+
+    def test_index_survives_restart(self, tmp_path):
+        """测试重启后索引和LRU顺序仍然有效"""
+        cache = ConvertCache(str(tmp_path), 250)
+        cache.Put("aa01", b"a" * 100)
+        cache.Put("bb02", b"b" * 100)
+        cache.Get("aa01")
+        cache.Flush()
+
+        cache = ConvertCache(str(tmp_path), 250)
+        assert cache.Get("bb02") == b"b" * 100
+        cache.Put("cc03", b"c" * 100)
+
+        assert not cache.Has("aa01")
+        assert cache.Has("bb02")
+
+    def test_reconcile_with_disk(self, tmp_path):
+        """测试启动时与磁盘核对：删除丢失的文件，补上索引中没有的文件"""
+        cache = ConvertCache(str(tmp_path), 1024)
+        cache.Put("aa01", b"a" * 10)
+        cache.Put("bb02", b"b" * 20)
+        cache.Flush()
+        os.remove(os.path.join(str(tmp_path), "aa", "aa01"))
+        os.makedirs(os.path.join(str(tmp_path), "cc"))
+        with open(os.path.join(str(tmp_path), "cc", "cc03"), "wb") as f:
+            f.write(b"c" * 30)
+
+        cache = ConvertCache(str(tmp_path), 1024)
+
+        assert not cache.Has("aa01")
+        assert cache.Has("bb02")
+        assert cache.Get("cc03") == b"c" * 30
+        assert cache.Size() == 50
+
+
+class TestTaskCacheHit:
+    """测试QtTask使用缓存"""
+
+    def test_cache_hit_skips_engine(self, qapp, mock_config, tmp_path):
+        """测试缓存命中时直接回调，不提交给引擎"""
+        from src.qt.util.qttask import QtTask
+
+        task = QtTask()
+        task.WaitEngines()
+        oldEngines, oldCache = task.engines, task.cache
+        engine = Mock()
+        engine.Name = "mock"
+        engine.Capabilities.return_value = {"workers": 1}
+        engine.Collect.return_value = None
+        task.SetEngines([engine])
+        task.cache = ConvertCache(str(tmp_path), 1024)
+        mock_config.IsCacheConvert = True
+        try:
+            model = {"model": 1, "scale": 2, "format": "png"}
+            task.cache.Put(ConvertCache.GetKey(b"img", model, "mock"), b"cached")
+            results = []
+            task.AddConvertTask(b"img", model, lambda data, taskId, param, tick: results.append(data))
+
+            end = time.time() + 5
+            while not results and time.time() < end:
+                qapp.processEvents()
+
+            assert results == [b"cached"]
+            engine.Submit.assert_not_called()
+        finally:
+            task.SetEngines(oldEngines)
+            task.cache = oldCache
+
+    def test_cache_hit_is_async(self, qapp, mock_config, tmp_path):
+        """测试缓存命中时AddConvertTask返回前不回调，查询缓存不在调用的线程执行"""
+        import threading
+        from src.qt.util.qttask import QtTask
+
+        threads = []
+
+        class RecordCache(ConvertCache):
+            def Get(self, key):
+                threads.append(threading.current_thread())
+                return ConvertCache.Get(self, key)
+
+        task = QtTask()
+        task.WaitEngines()
+        oldEngines, oldCache = task.engines, task.cache
+        engine = Mock()
+        engine.Name = "mock"
+        engine.Capabilities.return_value = {"workers": 1}
+        engine.Collect.return_value = None
+        task.SetEngines([engine])
+        task.cache = RecordCache(str(tmp_path), 1024)
+        mock_config.IsCacheConvert = True
+        try:
+            model = {"model": 1, "scale": 2, "format": "png"}
+            task.cache.Put(ConvertCache.GetKey(b"img", model, "mock"), b"cached")
+            results = []
+            taskId = task.AddConvertTask(b"img", model, lambda data, taskId, param, tick: results.append(taskId))
+            assert results == []
+
+            end = time.time() + 5
+            while not results and time.time() < end:
+                qapp.processEvents()
+
+            assert results == [taskId]
+            assert threads and threading.current_thread() not in threads
+        finally:
+            task.SetEngines(oldEngines)
+            task.cache = oldCache
@@ -0,0 +1,174 @@
+"""
+单元测试：转换引擎
+使用真实的CPU引擎测试提交、收取、取消等接口
+"""
+import os
+from io import BytesIO
+
+import pytest
+
+PIL = pytest.importorskip("PIL")
+
+
+def read_sample(name="sample.png"):
+    path = os.path.join(os.path.dirname(__file__), "..", "test_data", name)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def get_size(data):
+    from PIL import Image
+    return Image.open(BytesIO(data)).size
+
+
+class TestCpuUpscale:
+    """测试CPU放大函数"""
+
+    def test_scale_mode(self):
+        """测试倍数放大"""
+        from src.util.engine import CpuUpscale
+
+        data = CpuUpscale(read_sample(), {"scale": 2, "format": "png"})
+
+        assert data[:8] == b"\x89PNG\r\n\x1a\n"
+        assert get_size(data) == (2402, 1006)
+
+    def test_fixed_size_mode(self):
+        """测试固定宽高模式（scale=0）"""
+        from src.util.engine import CpuUpscale
+
+        data = CpuUpscale(read_sample("sample.jpg"), {"scale": 0, "width": 300, "high": 200, "format": "jpg"})
+
+        assert data[:2] == b"\xff\xd8"
+        assert get_size(data) == (300, 200)
+
+
+class TestCpuEngine:
+    """测试CPU引擎接口"""
+
+    def test_submit_and_collect(self):
+        """测试提交后能收取到对应任务的结果"""
+        from src.util.engine import CpuEngine
+
+        engine = CpuEngine(2)
+        try:
+            assert engine.Submit(1, read_sample(), {"scale": 1.5, "format": "jpg"}) > 0
+            data, sts, taskId, tick = engine.Collect()
+
+            assert taskId == 1
+            assert sts > 0
+            assert get_size(data) == (1802, 754)
+            assert tick >= 0
+        finally:
+            engine.Stop()
+
+    def test_failed_task_returns_empty_data(self):
+        """测试无法解码的数据返回空结果而不是抛异常"""
+        from src.util.engine import CpuEngine
+
+        engine = CpuEngine(1)
+        try:
+            engine.Submit(2, b"not_an_image", {"scale": 2})
+            data, sts, taskId, tick = engine.Collect()
+
+            assert taskId == 2
+            assert data == b""
+            assert sts <= 0
+        finally:
+            engine.Stop()
+
+    def test_cancelled_task_not_collected(self):
+        """测试被取消的任务不会返回结果"""
+        from src.util.engine import CpuEngine
+
+        engine = CpuEngine(1)
+        try:
+            engine.Submit(3, read_sample(), {"scale": 2, "format": "png"})
+            engine.Submit(4, read_sample(), {"scale": 2, "format": "png"})
+            engine.Cancel([4])
+            engine.Submit(5, read_sample(), {"scale": 1, "format": "jpg"})
+
+            taskIds = {engine.Collect()[2], engine.Collect()[2]}
+            assert taskIds == {3, 5}
+        finally:
+            engine.Stop()
+
+    def test_stop_unblocks_collect(self):
+        """测试停止引擎后Collect返回None"""
+        from src.util.engine import CpuEngine
+
+        engine = CpuEngine(1)
+        engine.Stop()
+
+        assert engine.Collect() is None
+        assert engine.Submit(6, read_sample(), {"scale": 2}) <= 0
+
+    def test_stop_cancels_pending(self):
+        """测试停止引擎时还没开始的任务被取消，不会再执行"""
+        from src.util.engine import CpuEngine
+
+        engine = CpuEngine(1)
+        for taskId in range(10):
+            engine.Submit(taskId, read_sample(), {"scale": 2, "format": "png"})
+        futures = [future for future in engine._futures.values() if future]
+        engine.Stop()
+
+        assert sum(future.cancelled() for future in futures) >= 8
+        assert engine._futures == {}
+
+    def test_capabilities(self):
+        """测试引擎能力描述"""
+        from src.util.engine import CpuEngine
+
+        engine = CpuEngine(3)
+        try:
+            caps = engine.Capabilities()
+            assert caps["name"] == "cpu"
+            assert caps["workers"] == 3
+            assert caps["tta"] is False
+            assert engine.GetModel("MODEL_CUNET_NOISE3") == "MODEL_CUNET_NOISE3"
+        finally:
+            engine.Stop()
+
+
+class TestCreateEngine:
+    """测试引擎选择"""
+
+    def test_fallback_to_cpu(self, mock_config):
+        """测试waifu2x不可用时退回到CPU引擎"""
+        from src.util.engine import CreateEngine, CpuEngine
+
+        engine = CreateEngine()
+        try:
+            assert isinstance(engine, CpuEngine)
+        finally:
+            engine.Stop()
+
+
+class TestInitWaifu2x:
+    """测试waifu2x的初始化和GPU选择"""
+
+    def test_disabled(self, mock_config):
+        """测试waifu2x不可用时返回空字典"""
+        from src.util.engine import InitWaifu2x
+        assert InitWaifu2x() == {}
+
+    @pytest.mark.parametrize("select, encodeGpu, encode", [
+        ("GPU B", "GPU B", 1),
+        ("CPU", "CPU", -1),
+        ("", "GPU A", 0),
+        ("Removed GPU", "GPU A", 0),
+    ])
+    def test_select_device(self, mock_config, select, encodeGpu, encode):
+        """测试按保存的设置选择GPU，保存的GPU不存在时使用第一个"""
+        from src.util.engine import SelectDevice
+        mock_config.SelectEncodeGpu = select
+        mock_config.UseCpuNum = 16
+        SelectDevice(["GPU A", "GPU B"], 8)
+        assert (mock_config.EncodeGpu, mock_config.Encode, mock_config.UseCpuNum) == (encodeGpu, encode, 8)
+
+    def test_select_device_without_gpu(self, mock_config):
+        from src.util.engine import SelectDevice
+        mock_config.SelectEncodeGpu = "GPU A"
+        SelectDevice([], 8)
+        assert (mock_config.EncodeGpu, mock_config.Encode) == ("CPU", -1)
@@ -0,0 +1,90 @@
+"""
+单元测试：后台文件读写
+测试读取、原子写入、写入进度和失败处理
+"""
+import time
+
+import pytest
+
+
+@pytest.fixture
+def worker(qapp):
+    from src.qt.util.qtio import QtFileWorker
+    worker = QtFileWorker()
+    worker.reads, worker.progress, worker.writes = [], [], []
+    worker.readBack.connect(lambda requestId, data: worker.reads.append((requestId, data)))
+    worker.writeProgress.connect(lambda requestId, done, total: worker.progress.append((requestId, done, total)))
+    worker.writeBack.connect(lambda requestId, isOk, path: worker.writes.append((requestId, isOk, path)))
+    yield worker
+    worker.Stop()
+
+
+def wait_until(qapp, check, timeout=5):
+    end = time.time() + timeout
+    while not check() and time.time() < end:
+        qapp.processEvents()
+        time.sleep(0.001)
+    qapp.processEvents()
+    return check()
+
+
+class TestFileWorker:
+    """测试后台文件读写"""
+
+    def test_read(self, qapp, worker, tmp_path):
+        """测试读取文件，失败时返回空数据"""
+        path = tmp_path / "a.png"
+        path.write_bytes(b"image data")
+
+        requestId = worker.Read(str(path))
+        failId = worker.Read(str(tmp_path / "missing.png"))
+
+        assert wait_until(qapp, lambda: len(worker.reads) == 2)
+        assert dict(worker.reads) == {requestId: b"image data", failId: b""}
+
+    def test_write_atomic_with_progress(self, qapp, mock_config, worker, tmp_path):
+        """测试分块写入并报告进度，完成后没有临时文件"""
+        from src.qt.util.qtio import QtFileWorker
+        mock_config.ProgressInterval = 0
+        data = bytes(range(256)) * (QtFileWorker.ChunkSize // 256) * 3 + b"tail"
+        path = tmp_path / "out.png"
+
+        requestId = worker.Write(str(path), data)
+
+        assert wait_until(qapp, lambda: worker.writes)
+        assert worker.writes == [(requestId, True, str(path))]
+        assert path.read_bytes() == data
+        assert not list(tmp_path.glob("*.tmp"))
+        assert [done for _, done, _ in worker.progress] == sorted(done for _, done, _ in worker.progress)
+        assert len(worker.progress) >= 3 and worker.progress[-1][1:] == (len(data), len(data))
+
+    def test_write_fail(self, qapp, worker, tmp_path):
+        """测试写入失败时不留下临时文件"""
+        path = tmp_path / "missing_dir" / "out.png"
+
+        worker.Write(str(path), b"data")
+
+        assert wait_until(qapp, lambda: worker.writes)
+        assert worker.writes[0][1] is False
+        assert not path.exists()
+
+    def test_read_not_blocked_by_write(self, qapp, worker, tmp_path):
+        """测试正在写入大文件时读取不用排队"""
+        path = tmp_path / "a.png"
+        path.write_bytes(b"small")
+        gate = []
+
+        def SlowWrite(path, data, progressBack=None):
+            while not gate:
+                time.sleep(0.001)
+            return True
+
+        worker.WriteFile = SlowWrite
+        worker.Write(str(tmp_path / "big.png"), b"big")
+        worker.Read(str(path))
+        try:
+            assert wait_until(qapp, lambda: worker.reads)
+            assert not worker.writes
+        finally:
+            gate.append(True)
+        assert wait_until(qapp, lambda: worker.writes)
@@ -0,0 +1,203 @@
+"""
+单元测试：后台图片解码
+测试解码结果、失败处理和只解码最新的请求
+"""
+import os
+import threading
+import time
+
+import pytest
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), "..", "test_data")
+
+
+@pytest.fixture
+def decoder(qapp):
+    from src.qt.util.qtdecode import QtImageDecoder
+    decoder = QtImageDecoder()
+    results = []
+    decoder.decodeBack.connect(lambda requestId, img: results.append((requestId, img, threading.get_ident())))
+    decoder.results = results
+    yield decoder
+    decoder.Stop()
+
+
+def wait_results(qapp, decoder, num, timeout=5):
+    end = time.time() + timeout
+    while len(decoder.results) < num and time.time() < end:
+        qapp.processEvents()
+        time.sleep(0.001)
+    qapp.processEvents()
+    return decoder.results
+
+
+class TestImageDecoder:
+    """测试后台解码"""
+
+    def test_decode_in_background(self, qapp, decoder):
+        """测试在工作线程解码，结果在主线程回调"""
+        from PySide6.QtGui import QImage
+        with open(os.path.join(TEST_DATA, "sample.png"), "rb") as f:
+            data = f.read()
+
+        requestId = decoder.Decode(data)
+        results = wait_results(qapp, decoder, 1)
+
+        assert len(results) == 1
+        backId, img, threadId = results[0]
+        assert backId == requestId
+        assert (img.width(), img.height()) == (1201, 503)
+        assert img.format() in (QImage.Format_RGB32, QImage.Format_ARGB32_Premultiplied)
+        assert threadId == threading.get_ident()
+        assert decoder._thread.ident != threadId
+
+    def test_decode_fail(self, qapp, decoder):
+        """测试无法解码时返回空的QImage"""
+        decoder.Decode(b"not an image")
+
+        results = wait_results(qapp, decoder, 1)
+        assert results[0][1].isNull()
+
+    def test_latest_request_wins(self, qapp, decoder):
+        """测试连续提交时最后一个请求一定会被解码，还没开始的旧请求被丢弃"""
+        with open(os.path.join(TEST_DATA, "sample.jpg"), "rb") as f:
+            data = f.read()
+
+        requestIds = [decoder.Decode(data) for _ in range(10)]
+        assert wait_results(qapp, decoder, 1)
+        time.sleep(0.2)
+        results = wait_results(qapp, decoder, 10, timeout=0.2)
+
+        backIds = [backId for backId, _, _ in results]
+        assert backIds[-1] == requestIds[-1]
+        assert len(backIds) < len(requestIds)
+
+    def test_decode_queued(self, qapp, decoder):
+        """测试DecodeQueued的请求不会被之后的解码请求丢弃"""
+        with open(os.path.join(TEST_DATA, "sample.jpg"), "rb") as f:
+            data = f.read()
+
+        queuedIds = [decoder.DecodeQueued(data) for _ in range(3)]
+        latestIds = [decoder.Decode(data) for _ in range(3)]
+        time.sleep(0.2)
+        results = wait_results(qapp, decoder, 4)
+
+        backIds = [backId for backId, _, _ in results]
+        assert set(queuedIds) <= set(backIds)
+        assert latestIds[-1] in backIds
+        assert all(not img.isNull() for _, img, _ in results)
+
+    def test_decode_regions(self, qapp, decoder):
+        """测试部分结果按顺序解码并缩放到每个目标的大小，不会被之后的解码请求丢弃"""
+        from PySide6.QtCore import QRect
+        with open(os.path.join(TEST_DATA, "sample.png"), "rb") as f:
+            data = f.read()
+        regions = []
+        decoder.regionsBack.connect(lambda requestId, results: regions.append((requestId, results)))
+
+        firstId = decoder.DecodeRegions([(data, [(0, QRect(0, 0, 1201, 503)), (1, QRect(10, 20, 600, 251))])])
+        secondId = decoder.DecodeRegions([(b"broken", [(0, QRect(0, 0, 10, 10))])])
+        decoder.Decode(data)
+        wait_results(qapp, decoder, 1)
+        end = time.time() + 5
+        while len(regions) < 2 and time.time() < end:
+            qapp.processEvents()
+
+        assert [requestId for requestId, _ in regions] == [firstId, secondId]
+        results = regions[0][1]
+        assert [(key, rect.topLeft().toTuple(), img.size().toTuple()) for key, rect, img in results] == \
+            [(0, (0, 0), (1201, 503)), (1, (10, 20), (600, 251))]
+        assert regions[1][1] == []
+
+
+class TestImagePyramid:
+    """测试预览金字塔"""
+
+    def make_image(self, w, h):
+        from PySide6.QtGui import QImage
+        img = QImage(w, h, QImage.Format_RGB32)
+        img.fill(0x336699)
+        return img
+
+    def test_small_image_single_level(self, qapp):
+        """测试不超过层级尺寸的图片只有原图一层"""
+        from src.qt.util.qtdecode import ImagePyramid
+        pyramid = ImagePyramid.Build(b"", self.make_image(300, 200), levelSize=512)
+
+        assert pyramid.isSmall and list(pyramid.levels) == [0]
+        assert pyramid.GetLevel(0.01) == 0
+
+    def test_levels_halved(self, qapp):
+        """测试大图逐层缩小一半直到不超过层级尺寸，不保留原图"""
+        from src.qt.util.qtdecode import ImagePyramid
+        pyramid = ImagePyramid.Build(b"", self.make_image(2000, 1000), levelSize=300)
+
+        sizes = {level: (img.width(), img.height()) for level, img in pyramid.levels.items()}
+        assert sizes == {1: (1000, 500), 2: (500, 250), 3: (250, 125)}
+        assert pyramid.size == (2000, 1000)
+        assert pyramid.GetScale(3) == 8
+
+    def test_level_for_view_scale(self, qapp, mock_config):
+        """测试按显示比例选择层级，超过1:1时才使用原图"""
+        from src.qt.util.qtdecode import ImagePyramid
+        mock_config.PreviewFullScale = 1.0
+        pyramid = ImagePyramid.Build(b"", self.make_image(2000, 1000), levelSize=300)
+
+        assert pyramid.GetLevel(2.0) == 0
+        assert pyramid.GetLevel(1.0) == 1
+        assert pyramid.GetLevel(0.4) == 1
+        assert pyramid.GetLevel(0.2) == 2
+        assert pyramid.GetLevel(0.01) == 3
+
+    def test_decode_pyramid(self, qapp, mock_config, decoder):
+        """测试后台生成金字塔，失败时返回None"""
+        mock_config.PreviewLevelSize = 256
+        pyramids = []
+        decoder.pyramidBack.connect(lambda requestId, pyramid: pyramids.append((requestId, pyramid)))
+        with open(os.path.join(TEST_DATA, "sample.png"), "rb") as f:
+            data = f.read()
+
+        requestId = decoder.Decode(data, isPyramid=True)
+        end = time.time() + 5
+        while not pyramids and time.time() < end:
+            qapp.processEvents()
+        failId = decoder.Decode(b"broken", isPyramid=True)
+        while len(pyramids) < 2 and time.time() < end:
+            qapp.processEvents()
+
+        pyramid = dict(pyramids)[requestId]
+        assert pyramid.data is data and pyramid.size == (1201, 503)
+        assert sorted(pyramid.levels) == [1, 2, 3]
+        assert dict(pyramids)[failId] is None
+        assert not decoder.results
+
+    def test_decode_first_level_directly(self, qapp, mock_config):
+        """测试生成金字塔时大图直接按第1层的大小解码"""
+        from src.qt.util.qtdecode import QtImageDecoder
+        with open(os.path.join(TEST_DATA, "sample.png"), "rb") as f:
+            data = f.read()
+
+        img, size, level = QtImageDecoder.ReadImage(data, 256)
+        assert (size, level) == ((1201, 503), 1)
+        assert (img.width(), img.height()) == (600, 251)
+        img, size, level = QtImageDecoder.ReadImage(data, 2048)
+        assert level == 0 and (img.width(), img.height()) == (1201, 503)
+
+    def test_allocation_limit(self, qapp, mock_config):
+        """测试完整解码超过内存上限时只解码缩小的层级，不会请求原图"""
+        from PySide6.QtCore import QBuffer, QByteArray, QIODevice
+        from src.qt.util.qtdecode import ImagePyramid, QtImageDecoder
+        mock_config.ImageAllocationLimit = 1
+        mock_config.PreviewLevelSize = 256
+        data = QByteArray()
+        buffer = QBuffer(data)
+        buffer.open(QIODevice.WriteOnly)
+        self.make_image(1024, 1024).save(buffer, "PNG")
+        buffer.close()
+
+        img = QtImageDecoder.DecodeImage(bytes(data))
+        assert (img.width(), img.height()) == (512, 512)
+        img, size, level = QtImageDecoder.ReadImage(bytes(data), 256)
+        pyramid = ImagePyramid.Build(bytes(data), img, 256, size, level)
+        assert pyramid.minLevel == 1 and sorted(pyramid.levels) == [1, 2]
+        assert pyramid.GetLevel(4.0) == 1
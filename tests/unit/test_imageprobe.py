@@ -0,0 +1,102 @@
+"""
+单元测试：图片文件头解析
+与PIL的结果对比，测试不完整的数据和按需多读文件
+"""
+from io import BytesIO
+
+import pytest
+
+pytest.importorskip("PIL")
+from PIL import Image, PngImagePlugin
+
+from src.util.imageprobe import ProbeImage, ProbeImageFile
+
+
+def encode(mode, size, picFormat, **kwargs):
+    out = BytesIO()
+    Image.new(mode, size).save(out, picFormat, **kwargs)
+    return out.getvalue()
+
+
+class TestProbe:
+    """测试各种格式的解析"""
+
+    @pytest.mark.parametrize("mode,picFormat,kwargs,hasAlpha", [
+        ("RGB", "PNG", {}, False),
+        ("RGBA", "PNG", {}, True),
+        ("P", "PNG", {"transparency": 0}, True),
+        ("RGB", "JPEG", {}, False),
+        ("L", "JPEG", {}, False),
+        ("RGB", "WEBP", {}, False),
+        ("RGBA", "WEBP", {}, True),
+        ("RGBA", "WEBP", {"lossless": True}, True),
+        ("P", "GIF", {"transparency": 0}, True),
+        ("RGB", "BMP", {}, False),
+    ])
+    def test_same_as_pil(self, mode, picFormat, kwargs, hasAlpha):
+        """测试尺寸、格式和透明通道与PIL一致"""
+        data = encode(mode, (301, 203), picFormat, **kwargs)
+
+        info = ProbeImage(data)
+        assert info.size == Image.open(BytesIO(data)).size == (301, 203)
+        assert info.format == {"JPEG": "jpg"}.get(picFormat, picFormat.lower())
+        assert info.hasAlpha == hasAlpha
+
+    def test_png_text_and_depth(self):
+        """测试PNG的位深和tEXt"""
+        pngInfo = PngImagePlugin.PngInfo()
+        pngInfo.add_text("model", "cunet")
+        info = ProbeImage(encode("I;16", (8, 8), "PNG", pnginfo=pngInfo))
+
+        assert info.bitDepth == 16
+        assert info.text == {"model": "cunet"}
+
+    def test_jpeg_comment(self):
+        """测试JPEG的COM段"""
+        info = ProbeImage(encode("RGB", (8, 8), "JPEG", comment=b"waifu2x"))
+        assert info.comments == ["waifu2x"] and info.bitDepth == 8
+
+    def test_invalid_data(self):
+        """测试无法识别或者不完整的数据返回None"""
+        data = encode("RGB", (8, 8), "JPEG")
+        assert ProbeImage(b"not an image") is None
+        assert ProbeImage(b"") is None
+        assert ProbeImage(data[:10]) is None
+        assert ProbeImage(memoryview(data)).size == (8, 8)
+
+
+class TestProbeFile:
+    """测试读取文件"""
+
+    def test_large_exif(self, tmp_path):
+        """测试SOF在较大的EXIF之后时按需多读"""
+        path = tmp_path / "exif.jpg"
+        path.write_bytes(encode("RGB", (64, 48), "JPEG", exif=b"Exif\0\0" + b"\0" * 40000))
+
+        assert ProbeImageFile(str(path), readSize=1024).size == (64, 48)
+
+    def test_truncated_file(self, tmp_path):
+        """测试文件不完整时返回None"""
+        path = tmp_path / "broken.jpg"
+        path.write_bytes(encode("RGB", (64, 48), "JPEG", exif=b"Exif\0\0" + b"\0" * 4000)[:2000])
+
+        assert ProbeImageFile(str(path), readSize=512) is None
+
+
+class TestToolUtil:
+    """测试ToolUtil使用文件头解析"""
+
+    def test_picture_size_and_format(self):
+        """测试尺寸和格式"""
+        from src.util.tool import ToolUtil
+        data = encode("RGB", (30, 20), "WEBP")
+
+        assert ToolUtil.GetPictureSize(data) == (30, 20)
+        assert ToolUtil.GetPictureFormat(data) == "webp"
+
+    def test_data_model(self):
+        """测试读取图片中保存的转换参数"""
+        from src.util.tool import ToolUtil
+
+        assert ToolUtil.GetDataModel(encode("RGB", (8, 8), "JPEG", comment=b"model")) == "model"
+        assert ToolUtil.GetDataModel(encode("RGB", (8, 8), "PNG")) == ""
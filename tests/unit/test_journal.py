@@ -0,0 +1,83 @@
+"""
+单元测试：批量转换日志
+测试记录回放、校验、压缩和写到一半的记录
+"""
+from src.util.journal import JobJournal, JournalState
+
+MODEL = {"scale": 2, "format": "png"}
+
+
+def make_output(tmp_path, name, data):
+    dst = tmp_path / name
+    dst.write_bytes(data)
+    return str(dst)
+
+
+class TestJournal:
+    """测试日志的写入和加载"""
+
+    def test_replay_last_record(self, tmp_path):
+        """测试重新加载后每个源文件以最后一条记录为准"""
+        path = str(tmp_path / "journal.log")
+        dst = make_output(tmp_path, "a.png", b"result")
+        journal = JobJournal(path)
+        journal.Submit("a.jpg", dst, MODEL)
+        journal.Done("a.jpg", dst, MODEL, b"result")
+        journal.Submit("b.jpg", str(tmp_path / "b.png"), MODEL)
+        journal.Close()
+
+        journal = JobJournal(path)
+        assert journal.GetState("a.jpg", dst, MODEL) == JournalState.Done
+        assert journal.GetState("b.jpg", str(tmp_path / "b.png"), MODEL) == JournalState.Submit
+        assert [record["src"] for record in journal.GetUnfinished()] == ["b.jpg"]
+
+    def test_verify_output(self, tmp_path):
+        """测试输出文件被删除或修改后不再视为完成"""
+        journal = JobJournal(str(tmp_path / "journal.log"))
+        dst1 = make_output(tmp_path, "1.png", b"result1")
+        dst2 = make_output(tmp_path, "2.png", b"result2")
+        journal.Done("1.jpg", dst1, MODEL, b"result1")
+        journal.Done("2.jpg", dst2, MODEL, b"result2")
+
+        (tmp_path / "1.png").unlink()
+        (tmp_path / "2.png").write_bytes(b"result3")
+
+        assert journal.GetState("1.jpg", dst1, MODEL) == JournalState.Submit
+        assert journal.GetState("2.jpg", dst2, MODEL) == JournalState.Submit
+
+    def test_model_changed(self, tmp_path):
+        """测试转换参数变化后记录无效"""
+        journal = JobJournal(str(tmp_path / "journal.log"))
+        dst = make_output(tmp_path, "a.png", b"result")
+        journal.Done("a.jpg", dst, MODEL, b"result")
+
+        assert journal.GetState("a.jpg", dst, {"scale": 3, "format": "png"}) is None
+
+    def test_truncated_tail(self, tmp_path):
+        """测试写到一半的最后一行被丢弃，之后的记录可以正常追加"""
+        path = tmp_path / "journal.log"
+        journal = JobJournal(str(path))
+        journal.Fail("a.jpg", "a.png", MODEL)
+        journal.Close()
+        with open(path, "ab") as f:
+            f.write(b'{"op": "done", "src": "b.j')
+
+        journal = JobJournal(str(path))
+        journal.Submit("c.jpg", "c.png", MODEL)
+        journal.Close()
+
+        journal = JobJournal(str(path))
+        assert set(journal.entries) == {"a.jpg", "c.jpg"}
+        assert journal.entries["a.jpg"]["op"] == JournalState.Fail
+
+    def test_compact(self, tmp_path):
+        """测试无效记录过多时自动压缩为每个文件一条记录"""
+        path = tmp_path / "journal.log"
+        journal = JobJournal(str(path), compactNum=10)
+        for i in range(30):
+            journal.Submit("a.jpg", "a.png", MODEL)
+            journal.Fail("a.jpg", "a.png", MODEL)
+        journal.Close()
+
+        assert len(path.read_bytes().splitlines()) < 20
+        assert JobJournal(str(path)).entries["a.jpg"]["op"] == JournalState.Fail
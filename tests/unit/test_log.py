@@ -0,0 +1,118 @@
+"""
+单元测试：异步日志
+测试延迟格式化、写线程输出、按调用位置限速和按大小轮转
+"""
+import io
+import logging
+import os
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def log(tmp_path, mock_config):
+    """日志写到临时目录，结束后停止写线程并恢复日志级别"""
+    from src.util import Log
+    level = Log.logger.level
+    Log.logger.setLevel(logging.DEBUG)
+    Log.Init(str(tmp_path))
+    yield Log
+    Log.Stop()
+    Log.logger.setLevel(level)
+
+
+def read_log(tmp_path):
+    text = ""
+    for name in sorted(os.listdir(tmp_path)):
+        with open(os.path.join(tmp_path, name), encoding="utf-8") as f:
+            text += f.read()
+    return text
+
+
+class ThreadRecorder(object):
+    """记录在哪个线程中被格式化"""
+
+    def __init__(self):
+        self.threads = []
+
+    def __format__(self, spec):
+        self.threads.append(threading.get_ident())
+        return "recorder"
+
+
+class TestLog:
+    """测试异步日志"""
+
+    def test_lazy_format_in_writer(self, tmp_path, log):
+        """测试消息在写线程中格式化，根logger上的handler不会在调用线程格式化，调用位置是调用者而不是log.py"""
+        recorder = ThreadRecorder()
+        rootHandler = logging.StreamHandler(io.StringIO())
+        logging.getLogger().addHandler(rootHandler)
+        try:
+            log.Warn("lazy {} {}", recorder, 1)
+            log.Stop()
+        finally:
+            logging.getLogger().removeHandler(rootHandler)
+
+        assert not log.logger.propagate
+        assert not rootHandler.stream.getvalue()
+
+        assert recorder.threads and threading.get_ident() not in recorder.threads
+        text = read_log(tmp_path)
+        assert "lazy recorder 1" in text
+        assert "test_log.py" in text
+
+    def test_filtered_level_not_formatted(self, tmp_path, log):
+        """测试级别被过滤时不格式化"""
+        recorder = ThreadRecorder()
+        log.logger.setLevel(logging.WARN)
+        log.Debug("debug {}", recorder)
+        log.Stop()
+
+        assert not recorder.threads
+        assert "recorder" not in read_log(tmp_path)
+
+    def test_rate_limit(self, tmp_path, log, mock_config):
+        """测试同一个位置超过限速的日志被丢弃，其他位置不受影响"""
+        mock_config.LogRateNum = 3
+        mock_config.LogRateInterval = 60
+        for i in range(10):
+            log.Info("flood {}", i)
+        log.Info("other")
+        log.Stop()
+
+        text = read_log(tmp_path)
+        assert [i for i in range(10) if "flood {}\n".format(i) in text] == [0, 1, 2]
+        assert "other" in text
+
+    def test_rate_limit_suppressed_count(self, tmp_path, log, mock_config):
+        """测试下一个窗口的第一条日志带上丢弃的条数"""
+        mock_config.LogRateNum = 2
+        mock_config.LogRateInterval = 60
+        for i in range(5):
+            mock_config.LogRateInterval = 0 if i == 4 else 60
+            log.Info("burst {}", i)
+        log.Stop()
+
+        text = read_log(tmp_path)
+        assert "burst 0" in text and "burst 1" in text and "burst 2" not in text
+        assert "burst 4 (suppressed 2 similar messages)" in text
+
+    def test_rotate(self, tmp_path, mock_config):
+        """测试日志文件超过大小后轮转，只保留指定数量的旧文件"""
+        from src.util import Log
+        mock_config.LogFileSize = 0.001
+        mock_config.LogFileNum = 2
+        mock_config.LogRateNum = 0
+        Log.Init(str(tmp_path))
+        try:
+            for i in range(200):
+                Log.Warn("rotate {} {}", i, "x" * 50)
+        finally:
+            Log.Stop()
+
+        names = os.listdir(tmp_path)
+        assert len(names) == 3
+        assert all(os.path.getsize(os.path.join(tmp_path, name)) <= 1100 for name in names)
+        assert "rotate 199" in read_log(tmp_path)
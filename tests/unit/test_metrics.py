@@ -0,0 +1,98 @@
+"""
+单元测试：热点路径计时
+测试直方图分桶和分位数、计数和当前值、关闭后不记录，以及CTime记录到直方图
+"""
+import random
+
+import pytest
+
+from src.util.metrics import Histogram, Metrics
+
+
+@pytest.fixture
+def metrics(mock_config):
+    mock_config.IsMetrics = True
+    Metrics.Reset()
+    yield Metrics
+    Metrics.Reset()
+
+
+class TestHistogram:
+    """测试对数分桶直方图"""
+
+    def test_bucket_bound(self):
+        """测试每个值都落在所在桶的上下界之间，桶的宽度不超过下界的1/4"""
+        for value in list(range(64)) + [random.randrange(1 << 40) for _ in range(1000)]:
+            low, high = Histogram.GetBound(Histogram.GetIndex(value))
+            assert low <= value < high
+            assert high - low <= max(1, low // 4)
+
+    def test_percentile(self):
+        """测试分位数的相对误差不超过12.5%"""
+        histogram = Histogram()
+        values = list(range(1000, 101000, 100))
+        for value in values:
+            histogram.Add(value)
+
+        info = histogram.Get()
+        assert info["count"] == len(values)
+        assert info["min"] == 1000 and info["max"] == values[-1]
+        assert info["mean"] == pytest.approx(sum(values) / len(values))
+        for percent in (50, 90, 99):
+            exact = values[int(len(values) * percent / 100) - 1]
+            assert info["p{}".format(percent)] == pytest.approx(exact, rel=0.125)
+
+    def test_empty(self):
+        assert Histogram().Get()["p99"] == 0
+
+
+class TestMetrics:
+    """测试计时、计数和报告"""
+
+    def test_timer_counter_gauge(self, metrics):
+        """测试计时、计数和当前值都出现在报告中"""
+        for _ in range(3):
+            with metrics.Timer("work"):
+                sum(range(1000))
+        metrics.Record("record", 2000000)
+        metrics.Count("done")
+        metrics.Count("done", 4)
+        metrics.Gauge("depth", 7)
+
+        report = metrics.GetReport()
+        assert report["timers"]["work"]["count"] == 3
+        assert report["timers"]["record"]["max"] == pytest.approx(2)
+        assert report["counters"] == {"done": 5}
+        assert report["gauges"] == {"depth": 7}
+
+        text = metrics.FormatReport(report)
+        assert "work" in text and "done = 5" in text and "depth = 7" in text
+
+    def test_disabled(self, metrics, mock_config):
+        """测试关闭后不记录"""
+        mock_config.IsMetrics = False
+        with metrics.Timer("work"):
+            pass
+        metrics.Record("record", 1)
+        metrics.Count("done")
+        metrics.Gauge("depth", 1)
+
+        assert metrics.GetReport() == {"timers": {}, "counters": {}, "gauges": {}}
+
+    def test_ctime_and_time_me(self, metrics):
+        """测试CTime和time_me的每次计时都记录到直方图中，不只是超过阈值的"""
+        from src.util.tool import CTime, time_me
+
+        t = CTime()
+        t.Refresh("site")
+        t.Refresh("site")
+
+        class Worker(object):
+            @time_me
+            def Run(self):
+                return 1
+
+        assert Worker().Run() == 1
+        timers = metrics.GetReport()["timers"]
+        assert timers["site"]["count"] == 2
+        assert timers["TestMetrics.test_ctime_and_time_me.<locals>.Worker.Run"]["count"] == 1
@@ -0,0 +1,116 @@
+"""
+单元测试：任务登记表
+测试ID分配、状态转换、分组，以及多线程同时提交、取消、完成时不丢失也不重复回调
+"""
+import threading
+
+from src.util.registry import TaskRegistry, TaskState
+
+
+class Task(object):
+    state = TaskState.Wait
+
+
+class TestTaskRegistry:
+    """测试登记表的基本操作"""
+
+    def test_ids_unique_across_threads(self):
+        """测试多个线程同时分配ID不会重复"""
+        registry = TaskRegistry()
+        ids = []
+
+        def Alloc():
+            ids.extend(registry.NewId() for _ in range(10000))
+
+        threads = [threading.Thread(target=Alloc) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(set(ids)) == 40000
+        assert registry.lastId == 40000
+
+    def test_transit_only_once(self):
+        """测试任务只能从等待状态转换一次"""
+        registry = TaskRegistry()
+        task = Task()
+        registry.Add(1, task, "A")
+
+        assert registry.Transit(1, TaskState.Done) is task
+        assert task.state == TaskState.Done
+        assert registry.Transit(1, TaskState.Cancel) is None
+        assert registry.Get(1) is None
+        assert registry.groups == {}
+
+    def test_pop_group(self):
+        """测试取出分组后分组被删除，其他分组不受影响"""
+        registry = TaskRegistry()
+        for taskId in range(1, 5):
+            registry.Add(taskId, Task(), "A" if taskId % 2 else "B")
+
+        assert registry.PopGroup("A") == {1, 3}
+        assert registry.PopGroup("A") == set()
+        assert registry.groups == {"B": {2, 4}}
+        assert registry.Size() == 4
+
+    def test_pop_group_while_adding(self):
+        """测试添加任务的同时另一个线程取出分组并取消，取出的任务一定可以取消，不会留在登记表中"""
+        registry = TaskRegistry(shardNum=1)
+        cancelled = []
+
+        def CancelGroup():
+            for taskId in registry.PopGroup("A"):
+                cancelled.append(registry.Transit(taskId, TaskState.Cancel))
+
+        class HookLock(object):
+            """添加任务进入任务表之前，在另一个线程取出分组"""
+
+            def __init__(self):
+                self.lock = threading.Lock()
+                self.thread = None
+
+            def __enter__(self):
+                if not self.thread:
+                    self.thread = threading.Thread(target=CancelGroup)
+                    self.thread.start()
+                    self.thread.join(0.2)
+                self.lock.acquire()
+
+            def __exit__(self, *args):
+                self.lock.release()
+
+        hook = HookLock()
+        registry._locks = [hook]
+        task = Task()
+        registry.Add(1, task, "A")
+        hook.thread.join(5)
+
+        assert cancelled == [task]
+        assert task.state == TaskState.Cancel
+        assert registry.Size() == 0 and registry.groups == {}
+
+
+class TestStress:
+    """多线程压力测试（缩小规模）"""
+
+    def test_registry_no_lost_or_dup(self):
+        """测试完成和取消互相竞争时，每个任务只有一个结果"""
+        from tests.benchmark.stress_registry import RunRegistry
+
+        result = RunRegistry(20000, threadNum=4, cancelRate=0.5)
+
+        assert result.lostNum == 0
+        assert result.dupNum == 0
+        assert result.leftNum == 0
+
+    def test_qttask_no_lost_or_dup(self, qapp, mock_config):
+        """测试多个线程通过QtTask提交和取消任务，回调不丢失也不重复"""
+        from tests.benchmark.stress_registry import RunQtTask
+
+        result = RunQtTask(qapp, 3000, threadNum=4, cancelRate=0.3, timeout=60)
+
+        assert result.lostNum == 0
+        assert result.dupNum == 0
+        assert result.leftNum == 0
+        assert result.doneNum > 0 and result.cancelNum > 0
@@ -0,0 +1,131 @@
+"""
+单元测试：任务调度队列
+测试优先级、分组轮询和老化机制
+"""
+import threading
+from queue import Empty
+
+import pytest
+
+from src.util.scheduler import TaskScheduler, TaskPriority
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_scheduler(agingTime=2.0):
+    scheduler = TaskScheduler(agingTime)
+    scheduler.clock = FakeClock()
+    return scheduler
+
+
+def drain(scheduler):
+    return [scheduler.Get(False) for _ in range(scheduler.Size())]
+
+
+class TestPriority:
+    """测试优先级"""
+
+    def test_fifo_within_same_priority_and_group(self):
+        """测试同一优先级同一分组内保持先进先出"""
+        scheduler = make_scheduler()
+        for taskId in range(1, 6):
+            scheduler.Put(taskId)
+
+        assert drain(scheduler) == [1, 2, 3, 4, 5]
+
+    def test_interactive_before_batch(self):
+        """测试交互任务先于已入队的批量任务"""
+        scheduler = make_scheduler()
+        for taskId in range(1, 501):
+            scheduler.Put(taskId, TaskPriority.Batch, "Batch")
+        scheduler.Put(1000, TaskPriority.Interactive, "QtImg")
+        scheduler.Put(1001, TaskPriority.Prefetch, "QtImg")
+
+        assert scheduler.Get(False) == 1000
+        assert scheduler.Get(False) == 1001
+        assert scheduler.Get(False) == 1
+
+
+class TestFairness:
+    """测试分组轮询"""
+
+    def test_round_robin_across_groups(self):
+        """测试同一优先级内各分组轮流出队"""
+        scheduler = make_scheduler()
+        for taskId in range(1, 4):
+            scheduler.Put(taskId, TaskPriority.Batch, "A")
+        for taskId in range(11, 13):
+            scheduler.Put(taskId, TaskPriority.Batch, "B")
+        scheduler.Put(21, TaskPriority.Batch, "C")
+
+        assert drain(scheduler) == [1, 11, 21, 2, 12, 3]
+
+
+class TestAging:
+    """测试老化机制"""
+
+    def test_batch_not_starved(self):
+        """测试持续有交互任务时，批量任务等待足够久后也能得到服务"""
+        scheduler = make_scheduler(agingTime=2.0)
+        scheduler.Put(1, TaskPriority.Batch, "Batch")
+        scheduler.Put(2, TaskPriority.Interactive, "QtImg")
+        assert scheduler.Get(False) == 2
+
+        scheduler.Put(3, TaskPriority.Interactive, "QtImg")
+        scheduler.clock.now += 4.0
+        assert scheduler.Get(False) == 1
+        assert scheduler.Get(False) == 3
+
+    def test_interactive_latency_bounded(self):
+        """测试老化的批量任务每个老化周期最多插队一次"""
+        scheduler = make_scheduler(agingTime=2.0)
+        for taskId in range(1, 101):
+            scheduler.Put(taskId, TaskPriority.Batch, "Batch")
+        scheduler.clock.now += 60
+
+        scheduler.Put(1000, TaskPriority.Interactive, "QtImg")
+        scheduler.Put(1001, TaskPriority.Interactive, "QtImg")
+
+        order = [scheduler.Get(False) for _ in range(3)]
+        assert order == [1, 1000, 1001]
+
+
+class TestRequeue:
+    """测试重新排队"""
+
+    def test_put_again_moves_task(self):
+        """测试已在队列中的任务再次放入时按新优先级排队，不会重复出队"""
+        scheduler = make_scheduler()
+        scheduler.Put(1, TaskPriority.Batch, "Batch")
+        scheduler.Put(2, TaskPriority.Batch, "Batch")
+        scheduler.Put(2, TaskPriority.Interactive, "QtImg")
+
+        assert scheduler.Size() == 2
+        assert drain(scheduler) == [2, 1]
+
+
+class TestBlocking:
+    """测试阻塞行为"""
+
+    def test_get_timeout_raises_empty(self):
+        """测试空队列超时抛出Empty"""
+        scheduler = TaskScheduler()
+        with pytest.raises(Empty):
+            scheduler.Get(True, 0.01)
+
+    def test_get_wakes_on_put(self):
+        """测试阻塞的Get在其他线程Put后被唤醒"""
+        scheduler = TaskScheduler()
+        result = []
+        t = threading.Thread(target=lambda: result.append(scheduler.Get(True, 5)))
+        t.start()
+        scheduler.Put(42)
+        t.join(5)
+
+        assert result == [42]
@@ -0,0 +1,38 @@
+"""
+单元测试：启动耗时
+测试阶段按完成顺序记录、间隔的计算和报告格式
+"""
+import time
+
+import pytest
+
+from src.util.startup import Startup
+
+
+@pytest.fixture
+def startup():
+    marks = Startup._marks
+    Startup._marks = []
+    yield Startup
+    Startup._marks = marks
+
+
+class TestStartup:
+    """测试启动耗时报告"""
+
+    def test_report(self, startup):
+        """测试每个阶段的总时间递增，间隔之和等于最后一个阶段的总时间"""
+        startup.Mark("app")
+        time.sleep(0.01)
+        startup.Mark("first paint")
+
+        report = startup.GetReport()
+        assert [name for name, _, _ in report] == ["app", "first paint"]
+        assert report[1][1] - report[0][1] >= 10
+        assert sum(step for _, _, step in report) == pytest.approx(report[-1][1])
+        assert startup.GetTime("first paint") == report[1][1]
+        assert startup.GetTime("engine") == 0
+
+        text = startup.FormatReport()
+        assert text.splitlines()[0].split() == ["startup", "total", "step"]
+        assert "first paint" in text
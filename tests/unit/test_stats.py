@@ -0,0 +1,90 @@
+"""
+单元测试：滚动统计
+测试速率、分位数和窗口过期
+"""
+import pytest
+
+from src.util.stats import RollingStat, ConvertStats
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_stat(window=10):
+    stat = RollingStat(window)
+    stat.clock = FakeClock()
+    stat._startTime = stat.clock.now
+    return stat
+
+
+class TestRollingStat:
+    """测试滚动统计"""
+
+    def test_empty(self):
+        """测试没有数据时全部为0"""
+        info = make_stat().Get()
+        assert info["count"] == 0 and info["rate"] == 0 and info["p95"] == 0
+
+    def test_percentiles(self):
+        """测试平均值、分位数和最大值"""
+        stat = make_stat()
+        for value in range(1, 101):
+            stat.Add(value)
+
+        info = stat.Get()
+        assert info["count"] == 100 and info["total"] == 5050
+        assert info["mean"] == pytest.approx(50.5)
+        assert info["p50"] == 50
+        assert info["p95"] == 96
+        assert info["max"] == 100
+
+    def test_rate(self):
+        """测试按经过的时间计算每秒次数和每秒总量"""
+        stat = make_stat(window=10)
+        for _ in range(5):
+            stat.Add(2)
+            stat.clock.now += 1
+
+        info = stat.Get()
+        assert info["rate"] == pytest.approx(1.0)
+        assert info["totalRate"] == pytest.approx(2.0)
+
+    def test_window_expire(self):
+        """测试超出窗口的数据不再计入，累计计数保留"""
+        stat = make_stat(window=10)
+        stat.Add(100)
+        stat.clock.now += 20
+        stat.Add(1)
+
+        info = stat.Get()
+        assert info["count"] == 1 and info["max"] == 1
+        assert stat.count == 2 and stat.total == 101
+
+    def test_sample_bounded(self):
+        """测试样本数量有上限"""
+        stat = RollingStat(sampleSize=16)
+        for value in range(1000):
+            stat.Add(value)
+
+        assert len(stat._samples) == 16
+        assert stat.Get()["count"] == 1000
+
+
+class TestConvertStats:
+    """测试转换阶段统计"""
+
+    def test_stages(self):
+        """测试每个阶段独立统计"""
+        stats = ConvertStats()
+        stats.Add("engine", 0.5)
+        stats.Add("images", 2.0)
+
+        info = stats.Get()
+        assert set(info) == set(ConvertStats.Stages)
+        assert info["engine"]["count"] == 1 and info["queue"]["count"] == 0
+        assert info["images"]["total"] == 2.0
@@ -2,7 +2,10 @@
 单元测试：任务管理器
 测试QtTask类的核心功能
 """
+import io
+import os
 import pytest
+import queue
 import threading
 import time
 from unittest.mock import Mock, MagicMock, patch
@@ -274,3 +277,688 @@ class TestThreadSafety:
         
         # 验证没有数据丢失
         assert len(results) == 30  # 3个生产者 * 10个项目
+
+
+class RecordEngine(object):
+    """只记录提交和取消的引擎，结果由测试调用FinishJob模拟返回"""
+    Name = "record"
+
+    def __init__(self):
+        self.submitIds = []
+        self.cancelIds = []
+        self.gate = None    # 设置为threading.Event时，Submit会阻塞到Event被set
+        self._outQueue = queue.Queue()
+
+    def Capabilities(self):
+        return {"name": self.Name, "workers": 8}
+
+    def Submit(self, taskId, imgData, model):
+        self.submitIds.append(taskId)
+        if self.gate:
+            self.gate.wait(5)
+        return 1
+
+    def Collect(self):
+        return self._outQueue.get()
+
+    def Cancel(self, taskIds):
+        self.cancelIds.extend(taskIds)
+
+    def Stop(self):
+        self._outQueue.put(None)
+
+
+class DelayEngine(object):
+    """每个任务固定耗时的引擎，用来模拟速度不同的设备"""
+
+    def __init__(self, name, delay, slots=1):
+        self.Name = name
+        self.delay = delay
+        self.slots = slots
+        self.doneIds = []
+        self._outQueue = queue.Queue()
+
+    def Capabilities(self):
+        return {"name": self.Name, "workers": self.slots}
+
+    def Submit(self, taskId, imgData, model):
+        timer = threading.Timer(self.delay, self._Done, (taskId, imgData))
+        timer.daemon = True
+        timer.start()
+        return 1
+
+    def _Done(self, taskId, imgData):
+        self.doneIds.append(taskId)
+        self._outQueue.put((imgData, 1, taskId, self.delay))
+
+    def Collect(self):
+        return self._outQueue.get()
+
+    def Cancel(self, taskIds):
+        pass
+
+    def Stop(self):
+        self._outQueue.put(None)
+
+
+class UpscaleEngine(DelayEngine):
+    """真正缩放图片的引擎，超过maxSize的图片模拟内存不足返回失败"""
+
+    def __init__(self, maxSize=0, slots=4):
+        DelayEngine.__init__(self, "upscale", 0, slots)
+        self.maxSize = maxSize
+        self.sizes = []
+
+    def _Convert(self, taskId, imgData, model):
+        from PIL import Image
+        from src.util.engine import CpuUpscale
+        size = Image.open(io.BytesIO(imgData)).size
+        self.sizes.append(size)
+        data = b"" if self.maxSize and max(size) > self.maxSize else CpuUpscale(imgData, model)
+        self._outQueue.put((data, 1 if data else 0, taskId, 0))
+
+    def Submit(self, taskId, imgData, model):
+        threading.Thread(target=self._Convert, args=(taskId, imgData, model), daemon=True).start()
+        return 1
+
+
+@pytest.fixture
+def engine_task(qapp, mock_config):
+    """返回QtTask和一个设置引擎的函数，结束后恢复原来的引擎"""
+    from src.qt.util.qttask import QtTask
+
+    task = QtTask()
+    # 等后台初始化完成，结束后恢复的是默认引擎
+    task.WaitEngines()
+    oldEngines = task.engines
+    newEngines = []
+
+    def setEngines(*engines):
+        newEngines.extend(engines)
+        task.SetEngines(list(engines))
+
+    yield task, setEngines
+    task.SetEngines(oldEngines)
+    for engine in newEngines:
+        engine.Stop()
+
+
+@pytest.fixture
+def record_task(engine_task):
+    """把QtTask的引擎替换为RecordEngine"""
+    task, setEngines = engine_task
+    setEngines(RecordEngine())
+    return task
+
+
+def wait_until(qapp, check, timeout=5):
+    end = time.time() + timeout
+    while not check() and time.time() < end:
+        qapp.processEvents()
+        time.sleep(0.001)
+    qapp.processEvents()
+    return check()
+
+
+class TestDeduplication:
+    """测试相同请求的合并"""
+
+    def test_identical_requests_share_one_job(self, qapp, record_task):
+        """测试相同的请求只提交一次，结果分发给所有回调"""
+        model = {"model": 1, "scale": 2, "format": "jpg"}
+        results = []
+        back = lambda data, taskId, param, tick: results.append((taskId, data, param))
+
+        taskId1 = record_task.AddConvertTask(b"same_image", model, back, backParam="a", cleanFlag="Win1")
+        taskId2 = record_task.AddConvertTask(b"same_image", dict(model), back, backParam="b", cleanFlag="Win2")
+        assert wait_until(qapp, lambda: record_task.engine.submitIds)
+
+        record_task.FinishJob(record_task.engine.submitIds[0], b"result", 1.0)
+        assert wait_until(qapp, lambda: len(results) == 2)
+
+        assert record_task.engine.submitIds == [taskId1]
+        assert sorted(results) == [(taskId1, b"result", "a"), (taskId2, b"result", "b")]
+
+    def test_different_requests_not_merged(self, qapp, record_task):
+        """测试数据或参数不同的请求不会合并"""
+        back = lambda data, taskId, param, tick: None
+        record_task.AddConvertTask(b"image1", {"scale": 2}, back)
+        record_task.AddConvertTask(b"image2", {"scale": 2}, back)
+        record_task.AddConvertTask(b"image1", {"scale": 3}, back)
+
+        assert wait_until(qapp, lambda: len(record_task.engine.submitIds) == 3)
+
+    def test_cancel_one_subscriber_keeps_job(self, qapp, record_task):
+        """测试取消其中一个订阅者时共享任务继续执行"""
+        results = []
+        back = lambda data, taskId, param, tick: results.append(taskId)
+
+        record_task.AddConvertTask(b"shared", {"scale": 2}, back, cleanFlag="Win1")
+        taskId2 = record_task.AddConvertTask(b"shared", {"scale": 2}, back, cleanFlag="Win2")
+        assert wait_until(qapp, lambda: record_task.engine.submitIds)
+
+        record_task.CancelConver("Win1")
+        assert record_task.engine.cancelIds == []
+
+        record_task.FinishJob(record_task.engine.submitIds[0], b"result", 1.0)
+        assert wait_until(qapp, lambda: results)
+        assert results == [taskId2]
+
+    def test_cancel_all_subscribers_cancels_job(self, qapp, record_task):
+        """测试所有订阅者都取消后才取消引擎任务"""
+        back = lambda data, taskId, param, tick: None
+
+        taskId1 = record_task.AddConvertTask(b"shared2", {"scale": 2}, back, cleanFlag="Win1")
+        record_task.AddConvertTask(b"shared2", {"scale": 2}, back, cleanFlag="Win2")
+        assert wait_until(qapp, lambda: record_task.engine.submitIds)
+
+        record_task.CancelConver("Win1")
+        record_task.CancelConver("Win2")
+
+        assert record_task.engine.cancelIds == [taskId1]
+        assert record_task.FinishJob(taskId1, b"late", 1.0) is None
+
+
+class TestCancellation:
+    """测试单个任务取消和批量取消"""
+
+    def test_cancelled_queued_task_never_submitted(self, qapp, record_task):
+        """测试排队中被取消的任务不会提交给引擎，也不需要通知引擎"""
+        back = lambda data, taskId, param, tick: None
+        record_task.engine.gate = threading.Event()
+
+        taskId1 = record_task.AddConvertTask(b"busy", {"scale": 2}, back)
+        assert wait_until(qapp, lambda: record_task.engine.submitIds)
+        taskId2 = record_task.AddConvertTask(b"queued", {"scale": 2}, back)
+
+        assert record_task.CancelTask(taskId2)
+        assert record_task._inQueue.Size() == 0
+        record_task.engine.gate.set()
+        record_task.AddConvertTask(b"after", {"scale": 2}, back)
+        assert wait_until(qapp, lambda: len(record_task.engine.submitIds) == 2)
+
+        assert taskId2 not in record_task.engine.submitIds
+        assert record_task.engine.cancelIds == []
+        record_task.CancelAll()
+
+    def test_cancel_single_task_keeps_group(self, qapp, record_task):
+        """测试取消单个任务不影响同组的其他任务"""
+        results = []
+        back = lambda data, taskId, param, tick: results.append(taskId)
+
+        taskId1 = record_task.AddConvertTask(b"g1", {"scale": 2}, back, cleanFlag="Group")
+        taskId2 = record_task.AddConvertTask(b"g2", {"scale": 2}, back, cleanFlag="Group")
+        assert wait_until(qapp, lambda: len(record_task.engine.submitIds) == 2)
+
+        assert record_task.CancelTask(taskId1)
+        assert not record_task.CancelTask(taskId1)
+        assert record_task.engine.cancelIds == [taskId1]
+        assert record_task.convertFlag["Group"] == {taskId2}
+
+        record_task.FinishJob(taskId1, b"late", 1.0)
+        record_task.FinishJob(taskId2, b"ok", 1.0)
+        assert wait_until(qapp, lambda: results)
+        assert results == [taskId2]
+
+    def test_cancel_result_already_delivered(self, qapp, record_task):
+        """测试结果已返回但回调还没执行时取消，回调不会执行"""
+        results = []
+        back = lambda data, taskId, param, tick: results.append(taskId)
+
+        taskId = record_task.AddConvertTask(b"race", {"scale": 2}, back)
+        assert wait_until(qapp, lambda: record_task.engine.submitIds)
+        # 结果由收取线程返回，回调排队等待主线程执行
+        t = threading.Thread(target=record_task.FinishJob, args=(taskId, b"ok", 1.0))
+        t.start()
+        t.join()
+        record_task.CancelTask(taskId)
+        qapp.processEvents()
+
+        assert results == []
+
+    def test_cancel_all_purges_queue(self, qapp, record_task):
+        """测试全部取消时清空调度队列"""
+        back = lambda data, taskId, param, tick: None
+        record_task.engine.gate = threading.Event()
+
+        record_task.AddConvertTask(b"first", {"scale": 2}, back)
+        assert wait_until(qapp, lambda: record_task.engine.submitIds)
+        for i in range(1000):
+            record_task.AddConvertTask("img{}".format(i).encode(), {"scale": 2}, back, cleanFlag="Batch{}".format(i % 3))
+        queueSize = lambda: record_task._inQueue.Size() + sum(i["queue"] for i in record_task.GetWorkerInfo())
+        assert wait_until(qapp, lambda: queueSize() == 1000)
+
+        record_task.CancelAll()
+        record_task.engine.gate.set()
+
+        assert queueSize() == 0
+        assert record_task.convertLoad == {}
+        assert record_task.convertFlag == {}
+        assert len(record_task.engine.cancelIds) == 1
+
+
+class TestMultiEngine:
+    """测试多个引擎分担任务"""
+
+    def test_fast_engine_does_more_work(self, qapp, engine_task):
+        """测试速度快的引擎处理更多任务，所有任务都完成"""
+        task, setEngines = engine_task
+        fast, slow = DelayEngine("fast", 0.01), DelayEngine("slow", 0.1)
+        setEngines(fast, slow)
+        results = []
+        for i in range(30):
+            task.AddConvertTask(str(i).encode(), {"model": 1, "scale": 2},
+                                lambda data, taskId, param, tick: results.append(data), cleanFlag="multi")
+
+        assert wait_until(qapp, lambda: len(results) == 30, 10)
+        assert len(fast.doneIds) > len(slow.doneIds) * 2
+        assert sorted(results) == sorted(str(i).encode() for i in range(30))
+
+    def test_assist_result_not_cached(self, qapp, mock_config, engine_task, tmp_path):
+        """测试只缓存主引擎的结果，辅助引擎的结果不会在之后被当作主引擎的结果命中"""
+        from src.util.cache import ConvertCache
+        task, setEngines = engine_task
+        primary, assist = DelayEngine("primary", 0.01), DelayEngine("assist", 0.01)
+        setEngines(primary, assist)
+        oldCache, task.cache = task.cache, ConvertCache(str(tmp_path), 1024 * 1024)
+        mock_config.IsCacheConvert = True
+        model = {"model": 1, "scale": 2}
+        results = []
+        try:
+            for i in range(20):
+                task.AddConvertTask(str(i).encode(), model,
+                                    lambda data, taskId, param, tick: results.append(data), cleanFlag="assist")
+            assert wait_until(qapp, lambda: len(results) == 20, 10)
+
+            def cached():
+                return [i for i in range(20) if task.cache.Has(ConvertCache.GetKey(str(i).encode(), model, "primary"))]
+            assert primary.doneIds and assist.doneIds
+            assert wait_until(qapp, lambda: len(cached()) == len(primary.doneIds))
+        finally:
+            task.cache = oldCache
+
+    def test_idle_worker_steals(self, qapp, engine_task):
+        """测试一个引擎卡住时，其他引擎把它队列中的任务取走"""
+        task, setEngines = engine_task
+        stuck, free = RecordEngine(), DelayEngine("free", 0.01, slots=2)
+        stuck.gate = threading.Event()
+        stuck.Capabilities = lambda: {"name": "stuck", "workers": 1}
+        setEngines(stuck, free)
+        results = []
+        try:
+            for i in range(10):
+                task.AddConvertTask(str(i).encode(), {"model": 1, "scale": 2},
+                                    lambda data, taskId, param, tick: results.append(data), cleanFlag="steal")
+
+            assert wait_until(qapp, lambda: len(results) == 9, 10)
+            assert len(stuck.submitIds) == 1
+        finally:
+            stuck.gate.set()
+
+    def test_worker_info(self, engine_task):
+        """测试可以查询每个引擎的负载"""
+        task, setEngines = engine_task
+        setEngines(DelayEngine("a", 0.01, slots=3), DelayEngine("b", 0.01))
+
+        info = task.GetWorkerInfo()
+        assert [(i["name"], i["slots"]) for i in info] == [("a", 3), ("b", 1)]
+
+
+class TestEngineLoad:
+    """测试后台初始化引擎"""
+
+    def test_tasks_wait_for_engine_load(self, qapp, engine_task):
+        """测试引擎初始化完成前提交的任务留在队列中，不会因为没有引擎而失败"""
+        task, setEngines = engine_task
+        with task._workCond:
+            task.isEngineLoad = True
+        # 调度线程已经在等待调度队列，先用一个任务让它回到等待引擎的位置
+        skipped = []
+        task.AddConvertTask(b"skip", {"model": 1, "scale": 2},
+                            lambda data, taskId, param, tick: skipped.append(data), cleanFlag="load")
+        assert wait_until(qapp, lambda: skipped)
+        results = []
+        task.AddConvertTask(b"early", {"model": 1, "scale": 2},
+                            lambda data, taskId, param, tick: results.append(data), cleanFlag="load")
+
+        assert not wait_until(qapp, lambda: results, 0.2)
+        assert not task.WaitEngines(0.01)
+        setEngines(DelayEngine("late", 0.01))
+        assert task.WaitEngines(0.01)
+        assert wait_until(qapp, lambda: results == [b"early"])
+
+    def test_set_engines_wins_over_load(self, qapp, engine_task):
+        """测试初始化期间手动设置了引擎时，初始化的结果不覆盖，完成信号照常发射"""
+        task, setEngines = engine_task
+        engine = DelayEngine("manual", 0.01)
+        setEngines(engine)
+        infos = []
+
+        def onEngineBack(info):
+            infos.append(info)
+
+        task.engineBack.connect(onEngineBack)
+        try:
+            task.RunLoadEngine()
+            assert wait_until(qapp, lambda: infos)
+            assert task.engines == [engine]
+        finally:
+            task.engineBack.disconnect(onEngineBack)
+
+
+class TestTiling:
+    """测试大图分块转换"""
+
+    def convert(self, qapp, task, imgData, model):
+        results = []
+        self.jobId = task.AddConvertTask(imgData, model, lambda data, taskId, param, tick: results.append(data),
+                                         cleanFlag="tile")
+        assert wait_until(qapp, lambda: results, 10)
+        return results[0]
+
+    def is_clean(self, task):
+        """大图任务和它的分块任务都已经删除"""
+        return all(jobId != self.jobId and (not job.parent or job.parent.jobId != self.jobId)
+                   for jobId, job in list(task.convertJobs.items()))
+
+    def test_large_image_tiled(self, qapp, mock_config, engine_task):
+        """测试超过分块大小的图片拆分成多个任务，拼接出完整尺寸的结果"""
+        pytest.importorskip("PIL")
+        from PIL import Image
+        task, setEngines = engine_task
+        engine = UpscaleEngine()
+        setEngines(engine)
+        mock_config.TileSize = 256
+
+        imgData = open(os.path.join(os.path.dirname(__file__), "..", "test_data", "sample.png"), "rb").read()
+        data = self.convert(qapp, task, imgData, {"scale": 2, "format": "png"})
+
+        assert Image.open(io.BytesIO(data)).size == (2402, 1006)
+        assert len(engine.sizes) == 5 * 2
+        assert max(max(size) for size in engine.sizes) <= 256 + 2 * mock_config.TileOverlap
+        assert self.is_clean(task)
+
+    def test_tiles_stay_on_primary_engine(self, qapp, mock_config, engine_task):
+        """测试有辅助引擎时，一张图的所有分块都在主引擎上转换，不会混合不同引擎的结果"""
+        pytest.importorskip("PIL")
+        task, setEngines = engine_task
+        engine, assist = UpscaleEngine(), UpscaleEngine()
+        assist.Name = "assist"
+        setEngines(engine, assist)
+        mock_config.TileSize = 256
+
+        imgData = open(os.path.join(os.path.dirname(__file__), "..", "test_data", "sample.png"), "rb").read()
+        assert self.convert(qapp, task, imgData, {"scale": 2, "format": "png"})
+
+        assert len(engine.sizes) == 5 * 2
+        assert not assist.sizes
+        assert self.is_clean(task)
+
+    def test_retry_with_smaller_tiles(self, qapp, mock_config, engine_task):
+        """测试分块内存不足失败后拆成更小的分块重试"""
+        pytest.importorskip("PIL")
+        from PIL import Image
+        task, setEngines = engine_task
+        engine = UpscaleEngine(maxSize=300)
+        setEngines(engine)
+        mock_config.TileSize = 512
+
+        imgData = open(os.path.join(os.path.dirname(__file__), "..", "test_data", "sample.jpg"), "rb").read()
+        w, h = Image.open(io.BytesIO(imgData)).size
+        data = self.convert(qapp, task, imgData, {"scale": 1.5, "format": "jpg"})
+
+        assert Image.open(io.BytesIO(data)).size == (round(w * 1.5), round(h * 1.5))
+        assert any(max(size) > 300 for size in engine.sizes)
+        assert self.is_clean(task)
+
+    def test_fail_below_min_size(self, qapp, mock_config, engine_task):
+        """测试分块小于最小尺寸仍然失败时，整个任务失败"""
+        pytest.importorskip("PIL")
+        task, setEngines = engine_task
+        setEngines(UpscaleEngine(maxSize=10))
+        mock_config.TileSize = 256
+
+        imgData = open(os.path.join(os.path.dirname(__file__), "..", "test_data", "sample.png"), "rb").read()
+
+        assert self.convert(qapp, task, imgData, {"scale": 2, "format": "png"}) == b""
+        assert wait_until(qapp, lambda: self.is_clean(task))
+
+
+class FocusEngine(UpscaleEngine):
+    """记录分块提交顺序的引擎，gate为threading.Event时Submit阻塞到Event被set"""
+
+    def __init__(self, task):
+        UpscaleEngine.__init__(self, slots=1)
+        self.task = task
+        self.cores = []
+        self.gate = None
+
+    def Submit(self, taskId, imgData, model):
+        self.cores.append(self.task.convertJobs[taskId].tile[0])
+        if self.gate:
+            self.gate.wait(5)
+        return UpscaleEngine.Submit(self, taskId, imgData, model)
+
+
+class TestFocus:
+    """测试优先转换的区域"""
+
+    @staticmethod
+    def is_in(core, focus):
+        return core[0] < focus[2] and focus[0] < core[2] and core[1] < focus[3] and focus[1] < core[3]
+
+    def test_focus_first(self, qapp, mock_config, engine_task):
+        """测试与focus相交的分块最先转换，结果仍然是完整的图片"""
+        pytest.importorskip("PIL")
+        from PIL import Image
+        task, setEngines = engine_task
+        engine = FocusEngine(task)
+        setEngines(engine)
+        mock_config.TileSize = 256
+
+        imgData = open(os.path.join(os.path.dirname(__file__), "..", "test_data", "sample.png"), "rb").read()
+        focus = (1000, 300, 1201, 503)
+        results = []
+        task.AddConvertTask(imgData, {"scale": 2, "format": "png"},
+                            lambda data, taskId, param, tick: results.append(data), cleanFlag="focus", focus=focus)
+        assert wait_until(qapp, lambda: results, 10)
+
+        assert self.is_in(engine.cores[0], focus)
+        assert not self.is_in(engine.cores[0], (0, 0, 240, 250))
+        assert Image.open(io.BytesIO(results[0])).size == (2402, 1006)
+
+    def test_set_focus(self, qapp, mock_config, engine_task):
+        """测试转换中修改focus后，还在排队的分块按新的区域重新排队"""
+        pytest.importorskip("PIL")
+        task, setEngines = engine_task
+        engine = FocusEngine(task)
+        engine.gate = threading.Event()
+        setEngines(engine)
+        mock_config.TileSize = 256
+
+        imgData = open(os.path.join(os.path.dirname(__file__), "..", "test_data", "sample.png"), "rb").read()
+        results = []
+        taskId = task.AddConvertTask(imgData, {"scale": 2, "format": "png"},
+                                     lambda data, taskId, param, tick: results.append(data), cleanFlag="focus")
+        # 第一个分块阻塞在引擎中，第二个分块在设备队列中，其余在调度队列中
+        assert wait_until(qapp, lambda: len(engine.cores) == 1 and task._inQueue.Size() == 8)
+        focus = (1100, 400, 1201, 503)
+        assert task.SetConvertFocus(taskId, focus)
+        engine.gate.set()
+        assert wait_until(qapp, lambda: results, 10)
+
+        assert not self.is_in(engine.cores[0], focus) and not self.is_in(engine.cores[1], focus)
+        assert self.is_in(engine.cores[2], focus)
+        assert not task.SetConvertFocus(taskId, focus)
+
+
+class TestProgress:
+    """测试进度和部分结果回调"""
+
+    def convert(self, qapp, task, progress, partial):
+        imgData = open(os.path.join(os.path.dirname(__file__), "..", "test_data", "sample.png"), "rb").read()
+        results = []
+        task.AddConvertTask(imgData, {"scale": 2, "format": "png"},
+                            lambda data, taskId, param, tick: results.append(data), cleanFlag="progress",
+                            progressCallBack=lambda taskId, done, total, size, param: progress.append((done, total, size)),
+                            partialCallBack=lambda taskId, regions, outSize, param: partial.append((regions, outSize)))
+        assert wait_until(qapp, lambda: results, 10)
+        return results[0]
+
+    def test_progress_and_partial(self, qapp, mock_config, engine_task):
+        """测试分块转换时回调进度和已完成的分块"""
+        pytest.importorskip("PIL")
+        task, setEngines = engine_task
+        setEngines(UpscaleEngine(slots=1))
+        mock_config.TileSize = 256
+        mock_config.ProgressInterval = 0
+        progress, partial = [], []
+
+        assert self.convert(qapp, task, progress, partial)
+        assert partial
+        assert all(total == 10 for _, total, _ in progress)
+        assert [done for done, _, _ in progress] == sorted(done for done, _, _ in progress)
+        regions = [region for regions, _ in partial for region in regions]
+        assert len(regions) <= 10 and len(set((x, y) for x, y, _ in regions)) == len(regions)
+        assert all(outSize == (2402, 1006) for _, outSize in partial)
+
+    def test_rate_limited(self, qapp, mock_config, engine_task):
+        """测试进度信号限制频率"""
+        pytest.importorskip("PIL")
+        task, setEngines = engine_task
+        setEngines(UpscaleEngine())
+        mock_config.TileSize = 256
+        mock_config.ProgressInterval = 60
+        progress, partial = [], []
+
+        assert self.convert(qapp, task, progress, partial)
+        # 只有拆分时强制发射的一次
+        assert len(progress) == 1 and progress[0][1] == 10
+        assert len(partial) <= 1
+
+
+class TestStats:
+    """测试转换统计"""
+
+    def test_stages_recorded(self, qapp, engine_task):
+        """测试完成任务后各个阶段都有记录，并能查询队列深度"""
+        task, setEngines = engine_task
+        setEngines(DelayEngine("stats", 0.02))
+        before = task.GetStats()
+        results = []
+        for i in range(5):
+            task.AddConvertTask("stats{}".format(i).encode(), {"model": 1, "scale": 2},
+                                lambda data, taskId, param, tick: results.append(data), cleanFlag="stats")
+        assert task.GetStats()["queueDepth"] + task.GetStats()["running"] <= 5
+
+        assert wait_until(qapp, lambda: len(results) == 5, 10)
+        info = task.GetStats()
+        for stage in ("queue", "engine", "callback", "images"):
+            assert info[stage]["count"] >= before[stage]["count"] + 5
+        assert info["engine"]["max"] >= 0.02
+        assert info["images"]["rate"] > 0
+        assert [worker["name"] for worker in info["workers"]] == ["stats"]
+
+
+class TestTrace:
+    """测试转换过程的性能跟踪"""
+
+    def test_lifecycle_spans(self, qapp, engine_task):
+        """测试一次转换记录排队、引擎、信号和回调，并且用任务ID关联"""
+        from src.util.trace import Trace
+        task, setEngines = engine_task
+        setEngines(DelayEngine("trace", 0.01))
+        results = []
+        Trace.Start()
+        try:
+            taskId = task.AddConvertTask(b"trace", {"model": 1, "scale": 2},
+                                         lambda data, taskId, param, tick: results.append(taskId))
+            assert wait_until(qapp, lambda: results)
+        finally:
+            events = Trace._events
+            Trace.Stop()
+
+        phases = {(event[0], event[1]) for event in events if event[5] == taskId}
+        for phase in (("b", "queue"), ("e", "queue"), ("b", "engine"), ("e", "engine"),
+                      ("X", "engine.Submit"), ("X", "OnJobResult"), ("b", "signal"), ("e", "signal"),
+                      ("X", "HandlerConvertTask")):
+            assert phase in phases
+        handler = [event for event in events if event[1] == "HandlerConvertTask"][0]
+        assert handler[4] == threading.get_ident()
+
+
+class TestFuture:
+    """测试Future和asyncio接口"""
+
+    def test_future_result(self, qapp, engine_task):
+        """测试isFuture时返回Future，结果和回调一致"""
+        from concurrent.futures import Future
+        task, setEngines = engine_task
+        setEngines(DelayEngine("future", 0.01))
+        results = []
+        future = task.AddConvertTask(b"future", {"model": 1, "scale": 2},
+                                     lambda data, taskId, param, tick: results.append(taskId), isFuture=True)
+
+        assert isinstance(future, Future)
+        assert wait_until(qapp, future.done)
+        assert future.result() == b"future"
+        assert results == [future.taskId]
+
+    def test_future_failed(self, qapp, record_task):
+        """测试转换失败时Future抛出ConvertError"""
+        from src.qt.util.qttask import ConvertError
+        future = record_task.AddConvertTask(b"fail", {"model": 1, "scale": 2}, isFuture=True)
+        assert wait_until(qapp, lambda: record_task.engine.submitIds)
+
+        record_task.FinishJob(future.taskId, b"", 0)
+        assert wait_until(qapp, future.done)
+        with pytest.raises(ConvertError):
+            future.result()
+
+    def test_future_cancel(self, qapp, record_task):
+        """测试取消Future会取消任务，按清理标记取消任务也会取消Future"""
+        future1 = record_task.AddConvertTask(b"f1", {"scale": 2}, cleanFlag="Future1", isFuture=True)
+        future2 = record_task.AddConvertTask(b"f2", {"scale": 2}, cleanFlag="Future2", isFuture=True)
+
+        assert future1.cancel()
+        assert record_task.registry.Get(future1.taskId) is None
+
+        record_task.CancelConver("Future2")
+        assert future2.cancelled()
+
+    def test_async_gather(self, qapp, engine_task):
+        """测试在Qt事件循环中用asyncio并发转换，用信号量限制同时进行的任务数"""
+        import asyncio
+        from src.qt.util.qtasync import convert, QtAsyncLoop
+        task, setEngines = engine_task
+        setEngines(DelayEngine("async", 0.01, slots=4))
+        running = []
+
+        async def Main():
+            sem = asyncio.Semaphore(3)
+            maxRunning = 0
+
+            async def One(i):
+                nonlocal maxRunning
+                async with sem:
+                    running.append(i)
+                    maxRunning = max(maxRunning, len(running))
+                    data = await convert("async{}".format(i).encode(), {"scale": 2}, cleanFlag="async")
+                    running.remove(i)
+                    return data
+
+            results = await asyncio.gather(*(One(i) for i in range(20)))
+            return results, maxRunning
+
+        results, maxRunning = QtAsyncLoop().RunUntilComplete(asyncio.wait_for(Main(), 10))
+        assert results == ["async{}".format(i).encode() for i in range(20)]
+        assert maxRunning <= 3
+
+    def test_async_timeout_cancels_task(self, qapp, record_task):
+        """测试协程超时时转换任务被取消"""
+        import asyncio
+        from src.qt.util.qtasync import convert, QtAsyncLoop
+        size = record_task.registry.Size()
+        with pytest.raises(asyncio.TimeoutError):
+            QtAsyncLoop().RunUntilComplete(asyncio.wait_for(convert(b"timeout", {"scale": 2}), 0.05))
+        assert wait_until(qapp, lambda: record_task.registry.Size() == size)
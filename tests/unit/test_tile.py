@@ -0,0 +1,174 @@
+"""
+单元测试：大图分块
+测试分块的划分、固定宽高模式的参数以及拼接后与整张放大的一致性
+"""
+from io import BytesIO
+
+import pytest
+
+PIL = pytest.importorskip("PIL")
+
+
+def make_image(w, h, fmt="PNG"):
+    """平滑渐变的测试图，拼接误差容易观察"""
+    from PIL import Image
+    img = Image.new("RGB", (w, h))
+    img.putdata([(x * 255 // w, y * 255 // h, (x + y) * 255 // (w + h)) for y in range(h) for x in range(w)])
+    out = BytesIO()
+    img.save(out, fmt)
+    return out.getvalue()
+
+
+def fake_convert(data, model):
+    """用普通缩放模拟引擎转换分块"""
+    from src.util.engine import CpuUpscale
+    return CpuUpscale(data, dict(model, scale=model.get("scale", 0)))
+
+
+def convert_all(tiled, tiles):
+    for core, box in tiles:
+        tiled.Add(core, box, fake_convert(tiled.GetTileData(box), tiled.GetTileModel(box)))
+
+
+class TestSplit:
+    """测试分块划分"""
+
+    def test_cores_cover_image(self):
+        """测试core互不重叠并且正好铺满整张图，box在图片范围内"""
+        from src.util.tile import TiledImage
+
+        tiled = TiledImage(make_image(250, 130), {"scale": 2, "format": "png"}, overlap=8)
+        tiles = tiled.Split(100)
+
+        assert len(tiles) == 6
+        assert sum((c[2] - c[0]) * (c[3] - c[1]) for c, _ in tiles) == 250 * 130
+        for core, box in tiles:
+            assert max(core[2] - core[0], core[3] - core[1]) <= 100
+            assert box[0] == max(0, core[0] - 8) and box[3] == min(130, core[3] + 8)
+
+    def test_split_sub_region(self):
+        """测试重试时只拆分失败的区域"""
+        from src.util.tile import TiledImage
+
+        tiled = TiledImage(make_image(200, 200), {"scale": 2, "format": "png"}, overlap=8)
+        tiles = tiled.Split(50, (100, 0, 200, 100))
+
+        assert len(tiles) == 4
+        assert all(100 <= c[0] and c[2] <= 200 and c[3] <= 100 for c, _ in tiles)
+
+    def test_need_tile(self):
+        """测试只有超过分块大小的图片需要分块"""
+        from src.util.tile import TiledImage
+
+        assert TiledImage.NeedTile(make_image(300, 100), 256)
+        assert not TiledImage.NeedTile(make_image(200, 100), 256)
+        assert not TiledImage.NeedTile(b"not an image", 256)
+
+    def test_focus_order(self):
+        """测试与focus相交的分块最先，其余按距离由近到远，没有focus时保持原来的顺序"""
+        from src.util.tile import TiledImage
+
+        tiled = TiledImage(make_image(300, 300), {"scale": 2, "format": "png"}, overlap=8)
+        tiles = tiled.Split(100)
+        focus = (210, 210, 300, 300)
+
+        ordered = sorted(tiles, key=lambda tile: TiledImage.GetFocusKey(tile[0], focus))
+        assert ordered[0][0] == (200, 200, 300, 300)
+        assert {ordered[1][0], ordered[2][0]} == {(100, 200, 200, 300), (200, 100, 300, 200)}
+        assert ordered[-1][0] == (0, 0, 100, 100)
+        assert sorted(tiles, key=lambda tile: TiledImage.GetFocusKey(tile[0], None)) == tiles
+
+    def test_crop(self):
+        """测试裁剪出原图中的区域"""
+        from PIL import Image
+        from src.util.tile import TiledImage
+
+        data = TiledImage.Crop(make_image(200, 100, "JPEG"), (50, 20, 150, 70))
+        img = Image.open(BytesIO(data))
+        assert img.format == "PNG" and img.size == (100, 50)
+
+
+class TestMerge:
+    """测试拼接"""
+
+    def test_merge_matches_whole_image(self):
+        """测试分块放大后拼接的结果与整张放大基本一致，没有明显接缝"""
+        from PIL import Image, ImageChops, ImageStat
+        from src.util.tile import TiledImage
+
+        imgData = make_image(300, 200)
+        tiled = TiledImage(imgData, {"scale": 2, "format": "png"}, overlap=8)
+        convert_all(tiled, tiled.Split(100))
+        merged = Image.open(BytesIO(tiled.Merge())).convert("RGB")
+        whole = Image.open(BytesIO(fake_convert(imgData, {"scale": 2, "format": "png"}))).convert("RGB")
+
+        assert merged.size == (600, 400)
+        diff = ImageChops.difference(merged, whole)
+        assert max(ImageStat.Stat(diff).mean) < 1.5
+        assert max(band[1] for band in diff.getextrema()) < 40
+
+    def test_retry_tiles_blend_all_edges(self):
+        """测试重试时拆出的小分块最后加入，右侧与大分块的重叠区域同样平滑过渡，不会出现接缝"""
+        from PIL import Image
+        from src.util.tile import TiledImage
+
+        tiled = TiledImage(make_image(200, 100), {"scale": 2, "format": "png"}, overlap=8)
+        left, right = tiled.Split(100)
+
+        def add_solid(core, box, value):
+            x0, y0, x1, y1 = tiled.GetOutBox(box)
+            out = BytesIO()
+            Image.new("RGB", (x1 - x0, y1 - y0), (value,) * 3).save(out, "PNG")
+            tiled.Add(core, box, out.getvalue())
+
+        add_solid(*right, 200)
+        for core, box in tiled.Split(50, left[0]):
+            add_solid(core, box, 100)
+        merged = Image.open(BytesIO(tiled.Merge())).convert("L")
+
+        for y in (10, 150):
+            row = [merged.getpixel((x, y)) for x in range(400)]
+            assert row[0] == 100 and row[-1] == 200
+            assert max(abs(a - b) for a, b in zip(row, row[1:])) <= 10
+
+    def test_fixed_size_mode(self):
+        """测试固定宽高模式按比例计算每个分块的宽高"""
+        from PIL import Image
+        from src.util.tile import TiledImage
+
+        tiled = TiledImage(make_image(300, 200), {"scale": 0, "width": 450, "high": 500, "format": "jpg"})
+        tiles = tiled.Split(150)
+        model = tiled.GetTileModel(tiles[0][1])
+        convert_all(tiled, tiles)
+        data = tiled.Merge()
+
+        assert model["format"] == "png"
+        assert model["width"] == round(166 * 1.5) and model["high"] == round(116 * 2.5)
+        assert data[:2] == b"\xff\xd8"
+        assert Image.open(BytesIO(data)).size == (450, 500)
+
+
+class TestBigImageScale:
+    """测试大图选择的倍数"""
+
+    def test_scale_with_tiling(self, mock_config):
+        """测试开启分块时大图按原倍数放大，关闭分块时不放大"""
+        from src.util.tool import ToolUtil
+
+        mock_config.TileSize = 2560
+        assert ToolUtil.GetScaleAndNoise(3000, 4000) == (2, 3)
+        mock_config.TileSize = 0
+        assert ToolUtil.GetScaleAndNoise(3000, 4000) == (1, 3)
+
+    def test_download_and_look_with_tiling(self, mock_config):
+        """测试下载和浏览时开启分块的大图也按设置的模型放大"""
+        pytest.importorskip("waifu2x_vulkan")
+        from src.util.tool import ToolUtil
+
+        mock_config.CanWaifu2x = True
+        mock_config.TileSize = 2560
+        assert ToolUtil.GetDownloadScaleModel(3000, 4000) == ToolUtil.GetModelByIndex(mock_config.DownloadModel)
+        assert ToolUtil.GetLookScaleModel(3000, 4000, "") == ToolUtil.GetModelByIndex(ToolUtil.GetLookModel(""))
+        mock_config.TileSize = 0
+        assert ToolUtil.GetDownloadScaleModel(3000, 4000)["scale"] == 1
+        assert ToolUtil.GetLookScaleModel(3000, 4000, "") == ToolUtil.GetModelByIndex(0)
@@ -0,0 +1,122 @@
+"""
+单元测试：分块显示的图片
+测试只创建可见的分块、缓存不超过上限、缺少层级时用更小的层级绘制
+"""
+import pytest
+
+
+def make_pyramid(w, h, levelSize):
+    from PySide6.QtGui import QImage, QColor
+    from src.qt.util.qtdecode import ImagePyramid
+    img = QImage(w, h, QImage.Format_RGB32)
+    img.fill(QColor(200, 100, 50))
+    return ImagePyramid.Build(b"", img, levelSize)
+
+
+def render(scene, viewRect, outSize=(256, 256)):
+    """把场景中viewRect的区域绘制到outSize大小的图片上"""
+    from PySide6.QtCore import QRectF
+    from PySide6.QtGui import QImage, QPainter, QColor
+    out = QImage(outSize[0], outSize[1], QImage.Format_RGB32)
+    out.fill(QColor(255, 255, 255))
+    painter = QPainter(out)
+    scene.render(painter, QRectF(0, 0, outSize[0], outSize[1]), viewRect)
+    painter.end()
+    return out
+
+
+@pytest.fixture
+def scene(qapp):
+    from PySide6.QtWidgets import QGraphicsScene
+    scene = QGraphicsScene()
+    yield scene
+    scene.clear()
+
+
+class TestTiledImageItem:
+    """测试分块显示"""
+
+    def test_only_visible_tiles(self, qapp, scene):
+        """测试放大显示一角时只创建可见的分块"""
+        from PySide6.QtCore import QRectF
+        from src.qt.com.qttileitem import QtTiledImageItem
+        pyramid = make_pyramid(2048, 2048, 4096)
+        item = QtTiledImageItem(tileSize=256, cacheSize=64)
+        item.SetPyramid(pyramid)
+        scene.addItem(item)
+
+        out = render(scene, QRectF(0, 0, 256, 256))
+        assert item.createNum == 1
+        assert out.pixelColor(128, 128).red() == 200
+
+        render(scene, QRectF(128, 128, 256, 256))
+        assert item.createNum == 4
+
+    def test_coarse_level_when_zoom_out(self, qapp, scene, mock_config):
+        """测试缩小显示时使用小的层级，分块数量不随原图尺寸增长"""
+        from PySide6.QtCore import QRectF
+        from src.qt.com.qttileitem import QtTiledImageItem
+        pyramid = make_pyramid(4096, 4096, 512)
+        item = QtTiledImageItem(tileSize=256, cacheSize=64)
+        item.SetPyramid(pyramid)
+        scene.addItem(item)
+
+        # 4096 -> 256，比例1/16，使用第3层（512）
+        out = render(scene, QRectF(0, 0, 4096, 4096))
+        assert item.createNum == 4
+        assert {key[0] for key in item._tiles} == {3}
+        assert out.pixelColor(200, 200).red() == 200
+
+    def test_fallback_to_coarser_level(self, qapp, scene, mock_config):
+        """测试原图还没有解码时用已有的层级绘制"""
+        from PySide6.QtCore import QRectF
+        from src.qt.com.qttileitem import QtTiledImageItem
+        pyramid = make_pyramid(4096, 4096, 2048)
+        assert 0 not in pyramid.levels
+        item = QtTiledImageItem(tileSize=256, cacheSize=64)
+        item.SetPyramid(pyramid)
+        scene.addItem(item)
+
+        assert item.GetPaintLevel(2.0) == 1
+        out = render(scene, QRectF(1000, 1000, 128, 128))
+        assert {key[0] for key in item._tiles} == {1}
+        assert out.pixelColor(10, 10).red() == 200
+
+    def test_cache_limit(self, qapp, scene):
+        """测试平移浏览整张图后缓存不超过上限"""
+        from PySide6.QtCore import QRectF
+        from src.qt.com.qttileitem import QtTiledImageItem
+        pyramid = make_pyramid(4096, 4096, 8192)
+        item = QtTiledImageItem(tileSize=256, cacheSize=1)
+        item.SetPyramid(pyramid)
+        scene.addItem(item)
+
+        for y in range(0, 4096, 512):
+            for x in range(0, 4096, 512):
+                render(scene, QRectF(x, y, 512, 512), (512, 512))
+                assert item.GetCacheBytes() <= 1024 * 1024
+        assert item.createNum == 256
+
+        item.DropLevel(0)
+        assert item.GetCacheBytes() == 0
+
+    def test_draw_regions(self, qapp, scene):
+        """测试部分结果画到层级上，只重新生成与该区域相交的分块"""
+        from PySide6.QtCore import QRect, QRectF
+        from PySide6.QtGui import QImage, QColor
+        from src.qt.com.qttileitem import QtTiledImageItem
+        pyramid = make_pyramid(1024, 1024, 4096)
+        item = QtTiledImageItem(tileSize=256, cacheSize=64)
+        item.SetPyramid(pyramid)
+        scene.addItem(item)
+        render(scene, QRectF(0, 0, 1024, 1024))
+        assert len(item._tiles) == 16
+
+        region = QImage(100, 100, QImage.Format_RGB32)
+        region.fill(QColor(0, 255, 0))
+        item.DrawRegions([(0, QRect(300, 300, 100, 100), region), (2, QRect(0, 0, 10, 10), region)])
+        assert len(item._tiles) == 15
+
+        out = render(scene, QRectF(256, 256, 256, 256))
+        assert out.pixelColor(100, 100).green() == 255
+        assert out.pixelColor(10, 10).red() == 200
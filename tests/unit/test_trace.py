@@ -0,0 +1,70 @@
+"""
+单元测试：性能跟踪
+测试开关、事件格式、事件数上限和trace文件的写入
+"""
+import json
+import threading
+
+import pytest
+
+from src.util.trace import Trace
+
+
+@pytest.fixture
+def trace(mock_config):
+    Trace.Start()
+    yield Trace
+    Trace.Stop()
+
+
+class TestTrace:
+    """测试性能跟踪"""
+
+    def test_disabled_records_nothing(self):
+        """测试关闭时不记录"""
+        Trace.Stop()
+        with Trace.Span("span", 1):
+            pass
+        Trace.Begin("async", 1)
+        Trace.End("async", 1)
+        Trace.Instant("point")
+        assert Trace.Stop() == 0
+
+    def test_events(self, trace):
+        """测试同线程的Span、跨线程的Begin/End和时间点"""
+        with trace.Span("span", 7, engine="cpu"):
+            pass
+        trace.Begin("queue", 7)
+        thread = threading.Thread(target=lambda: trace.End("queue", 7), name="worker")
+        thread.start()
+        thread.join()
+        trace.Instant("point")
+
+        data = Trace.ToJson(Trace._events, Trace._threads)
+        events = [event for event in data["traceEvents"] if event["ph"] != "M"]
+        names = {event["args"]["name"] for event in data["traceEvents"] if event["ph"] == "M"}
+        assert [event["ph"] for event in events] == ["X", "b", "e", "i"]
+        assert events[0]["args"] == {"engine": "cpu", "taskId": 7} and events[0]["dur"] >= 0
+        assert events[1]["id"] == events[2]["id"] == 7
+        assert events[1]["tid"] != events[2]["tid"]
+        assert events[2]["ts"] >= events[1]["ts"]
+        assert "worker" in names
+
+    def test_max_events(self, trace, mock_config):
+        """测试超过事件数上限后不再记录"""
+        mock_config.TraceMaxEvents = 5
+        for i in range(10):
+            trace.Instant("point", i)
+        assert Trace.Stop() == 5
+
+    def test_save(self, tmp_path, trace):
+        """测试停止时写入trace文件"""
+        with trace.Span("span", 1):
+            pass
+        path = str(tmp_path / "trace" / "out.json")
+        assert Trace.Stop(path) == 1
+
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        assert data["displayTimeUnit"] == "ms"
+        assert any(event["name"] == "span" for event in data["traceEvents"])
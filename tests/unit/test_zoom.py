@@ -0,0 +1,49 @@
+"""
+单元测试：图片查看的缩放状态
+测试适应窗口的比例、缩放次数和缩放上下限
+"""
+import pytest
+
+from src.util.zoom import ZoomState
+
+
+class TestZoomState:
+    """测试缩放状态"""
+
+    def test_fit_scale(self):
+        """测试适应窗口取宽高比例中较小的一个"""
+        assert ZoomState.GetFitScale((2000, 1000), (800, 600)) == pytest.approx(0.4)
+        assert ZoomState.GetFitScale((100, 400), (800, 600)) == pytest.approx(1.5)
+        assert ZoomState.GetFitScale((0, 0), (800, 600)) == 0
+        assert ZoomState.GetFitScale((100, 100), (0, 600)) == 0
+
+    def test_scale_is_closed_form(self):
+        """测试多次缩放的结果与一次计算相同"""
+        zoom = ZoomState()
+        assert zoom.Zoom(3, 0.5)
+        assert zoom.Zoom(-1, 0.5)
+        assert zoom.steps == 2
+        assert zoom.GetScale(0.5) == pytest.approx(0.5 * 1.1 ** 2)
+
+        # 窗口大小变化后缩放次数不变，只改变适应窗口的比例
+        assert zoom.GetScale(0.8) == pytest.approx(0.8 * 1.1 ** 2)
+        zoom.Reset()
+        assert zoom.GetScale(0.8) == pytest.approx(0.8)
+
+    def test_limits(self):
+        """测试缩放到上下限时停止"""
+        zoom = ZoomState(step=2, minScale=0.25, maxScale=4)
+        assert zoom.Zoom(10, 1)
+        assert zoom.steps == 2
+        assert not zoom.Zoom(1, 1)
+
+        assert zoom.Zoom(-10, 1)
+        assert zoom.steps == -2
+        assert not zoom.Zoom(-1, 1)
+
+    def test_zoom_in_below_min(self):
+        """测试超大图适应窗口的比例低于下限时仍然可以放大"""
+        zoom = ZoomState(step=2, minScale=0.25, maxScale=4)
+        assert not zoom.Zoom(-1, 0.01)
+        assert zoom.Zoom(1, 0.01)
+        assert zoom.steps == 1